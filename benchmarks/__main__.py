@@ -0,0 +1,70 @@
+# Copyright 2018 TomorrowData Srl
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import argparse
+import sys
+
+from . import harness
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m benchmarks',
+                                     description='iottly SDK benchmarks')
+    sub = parser.add_subparsers(dest='command')
+
+    run_p = sub.add_parser('run', help='run the benchmarks')
+    run_p.add_argument('-k', '--filter', default='*',
+                       help='glob matched against benchmark ids')
+    run_p.add_argument('-r', '--repeat', type=int, default=3,
+                       help='repetitions of every benchmark (default: 3)')
+    run_p.add_argument('-q', '--quick', action='store_true',
+                       help='use small iteration counts (smoke run)')
+    run_p.add_argument('-t', '--transport', default='unix',
+                       help='comma-separated transports to run on ({}) or '
+                            '"all" (default: unix)'.format(', '.join(harness.TRANSPORTS)))
+    run_p.add_argument('-o', '--output', help='write JSON results to file')
+
+    cmp_p = sub.add_parser('compare', help='compare two JSON result files')
+    cmp_p.add_argument('old')
+    cmp_p.add_argument('new')
+
+    sub.add_parser('list', help='list benchmark ids')
+
+    args = parser.parse_args(argv)
+    if args.command == 'run':
+        if args.transport == 'all':
+            transports = harness.TRANSPORTS
+        else:
+            transports = args.transport.split(',')
+            unknown = set(transports) - set(harness.TRANSPORTS)
+            if unknown:
+                parser.error('unknown transport: {}'.format(', '.join(sorted(unknown))))
+        report = harness.run(args.filter, args.repeat, args.quick,
+                             transports=transports)
+        if args.output:
+            harness.dump(report, args.output)
+    elif args.command == 'compare':
+        harness.compare(args.old, args.new)
+    elif args.command == 'list':
+        for bench in harness.load_benchmarks():
+            for params in harness.expand(bench):
+                print(harness.bench_id(bench.name, params))
+    else:
+        parser.print_help()
+        return 2
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
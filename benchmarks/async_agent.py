@@ -0,0 +1,284 @@
+# Copyright 2018 TomorrowData Srl
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import asyncio
+import json
+import multiprocessing
+import os
+import time
+
+
+class ClientStats(object):
+    """Counters kept by the agent for every connected SDK application.
+    """
+    __slots__ = ('name', 'msgs', 'bytes', 'signals', 'calls', 'errors',
+                 'connected_at', 'first_msg', 'last_msg')
+
+    def __init__(self, name):
+        self.name = name
+        self.connected_at = time.time()
+        self.reset()
+
+    def reset(self):
+        self.msgs = 0
+        self.bytes = 0
+        self.signals = 0
+        self.calls = 0
+        self.errors = 0
+        self.first_msg = None
+        self.last_msg = None
+
+    def as_dict(self):
+        return dict((k, getattr(self, k)) for k in self.__slots__)
+
+
+class AsyncStubAgent(object):
+    """asyncio implementation of the SDK server of the iottly agent.
+
+    Unlike `UDSStubServer` it serves any number of SDK applications
+    concurrently and speaks the whole SDK protocol:
+
+    - answers the `sdkclient` connected signal with `sdkinit`;
+    - sends the current `connectionstatus` to new clients;
+    - counts data messages and records `call` and `error` signals;
+    - fans out commands and signals to the connected clients.
+
+    Args:
+        socket_path (`str`):
+            the unix-socket path to listen on.
+
+    Keyword Args:
+        version (`str`):
+            the version sent with `sdkinit` (`None` emulates an agent < 1.8.0).
+        echo_calls (`bool`):
+            answer every `call` signal with a command of the same name.
+    """
+
+    def __init__(self, socket_path, version='1.8.0', echo_calls=False):
+        self.socket_path = socket_path
+        self.version = version
+        self.echo_calls = echo_calls
+        self.connection_status = 'connected'
+        # name -> ClientStats (kept across reconnections)
+        self.clients = {}
+        # StreamWriter -> name of the connected application
+        self._writers = {}
+        # Client handler task -> StreamWriter
+        self._tasks = {}
+        self._server = None
+
+    async def start(self):
+        self._server = await asyncio.start_unix_server(
+            self._handle_client, path=self.socket_path, limit=2 ** 24)
+
+    async def stop(self):
+        self._server.close()
+        # Closing the transports lets the handlers read EOF and return
+        for writer in list(self._tasks.values()):
+            writer.close()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        await self._server.wait_closed()
+        try:
+            os.unlink(self.socket_path)
+        except OSError:
+            pass
+
+    # Control API
+
+    def reset(self):
+        for stats in self.clients.values():
+            stats.reset()
+
+    def stats(self):
+        return dict((name, s.as_dict()) for name, s in self.clients.items())
+
+    def connected(self):
+        return sorted(self._writers.values())
+
+    def broadcast_cmd(self, cmd_type, params, name=None):
+        """Send a command to every connected client (or only to `name`).
+        """
+        line = json.dumps({'data': {cmd_type: params}}).encode() + b'\n'
+        return self._broadcast(line, name)
+
+    def broadcast_signal(self, signal):
+        if 'connectionstatus' in signal:
+            self.connection_status = signal['connectionstatus']
+        line = json.dumps({'signal': signal}).encode() + b'\n'
+        return self._broadcast(line)
+
+    def _broadcast(self, line, name=None):
+        sent = 0
+        for writer, client in list(self._writers.items()):
+            if name is None or client == name:
+                writer.write(line)
+                sent += 1
+        return sent
+
+    # Protocol
+
+    async def _handle_client(self, reader, writer):
+        task = asyncio.current_task()
+        self._tasks[task] = writer
+        try:
+            await self._serve_client(reader, writer)
+        finally:
+            self._tasks.pop(task, None)
+            writer.close()
+
+    async def _serve_client(self, reader, writer):
+        try:
+            first = await reader.readline()
+        except (asyncio.IncompleteReadError, ValueError, ConnectionError):
+            return
+        try:
+            name = json.loads(first.decode())['signal']['sdkclient']['name']
+        except (ValueError, KeyError, TypeError):
+            return
+        stats = self.clients.get(name)
+        if stats is None:
+            stats = self.clients[name] = ClientStats(name)
+        stats.connected_at = time.time()
+        self._writers[writer] = name
+        if self.version:
+            writer.write(json.dumps(
+                {'signal': {'sdkinit': {'version': self.version}}}).encode() + b'\n')
+        writer.write(json.dumps(
+            {'signal': {'connectionstatus': self.connection_status}}).encode() + b'\n')
+        pending = b''
+        try:
+            while True:
+                chunk = await reader.read(2 ** 16)
+                if not chunk:
+                    break
+                lines = (pending + chunk).split(b'\n')
+                pending = lines.pop()
+                self._process_lines(stats, writer, lines)
+        except ConnectionError:
+            pass
+        finally:
+            self._writers.pop(writer, None)
+
+    def _process_lines(self, stats, writer, lines):
+        now = time.time()
+        for line in lines:
+            if line.startswith(b'{"data"'):
+                # Data messages are only counted: they dominate the traffic
+                stats.msgs += 1
+                stats.bytes += len(line) + 1
+                if stats.first_msg is None:
+                    stats.first_msg = now
+                stats.last_msg = now
+                continue
+            stats.signals += 1
+            try:
+                client = json.loads(line.decode())['signal']['sdkclient']
+            except (ValueError, KeyError, TypeError):
+                continue
+            if 'call' in client:
+                stats.calls += 1
+                if self.echo_calls:
+                    for cmd, args in client['call'].items():
+                        writer.write(json.dumps({'data': {cmd: args}}).encode() + b'\n')
+            elif 'error' in client:
+                stats.errors += 1
+
+
+# ======================================================================== #
+# ========================= Out-of-process runner ======================== #
+# ======================================================================== #
+
+def _agent_main(socket_path, kwargs, conn):
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    agent = AsyncStubAgent(socket_path, **kwargs)
+    loop.run_until_complete(agent.start())
+    conn.send('ready')
+
+    def on_request():
+        method, args = conn.recv()
+        if method == 'stop':
+            loop.stop()
+            return
+        conn.send(getattr(agent, method)(*args))
+
+    loop.add_reader(conn.fileno(), on_request)
+    loop.run_forever()
+    loop.remove_reader(conn.fileno())
+    loop.run_until_complete(agent.stop())
+    loop.close()
+    conn.send('stopped')
+
+
+class AgentProcess(object):
+    """Run an `AsyncStubAgent` in a separate process.
+
+    Keeping the agent out of the benchmark process ensures the event loop
+    does not compete with the SDK clients for the GIL. Methods of the
+    agent control API are proxied through a pipe.
+    """
+
+    def __init__(self, socket_path, **kwargs):
+        self.socket_path = socket_path
+        self._kwargs = kwargs
+        self._conn = None
+        self._proc = None
+
+    def start(self, timeout=5.0):
+        self._conn, child = multiprocessing.Pipe()
+        self._proc = multiprocessing.Process(
+            target=_agent_main, args=(self.socket_path, self._kwargs, child))
+        self._proc.daemon = True
+        self._proc.start()
+        if not self._conn.poll(timeout):
+            self._proc.terminate()
+            raise RuntimeError('stub agent did not start')
+        self._conn.recv()
+
+    def stop(self):
+        self._conn.send(('stop', ()))
+        if self._conn.poll(5.0):
+            self._conn.recv()
+        self._proc.join(5.0)
+        if self._proc.is_alive():
+            self._proc.terminate()
+
+    def _call(self, method, *args):
+        self._conn.send((method, args))
+        return self._conn.recv()
+
+    def reset(self):
+        return self._call('reset')
+
+    def stats(self):
+        return self._call('stats')
+
+    def connected(self):
+        return self._call('connected')
+
+    def broadcast_cmd(self, cmd_type, params, name=None):
+        return self._call('broadcast_cmd', cmd_type, params, name)
+
+    def broadcast_signal(self, signal):
+        return self._call('broadcast_signal', signal)
+
+    def wait_clients(self, n, timeout=10.0):
+        """Poll until `n` clients are connected.
+        """
+        deadline = time.time() + timeout
+        while time.time() < deadline:
+            if len(self.connected()) >= n:
+                return True
+            time.sleep(0.05)
+        return False
@@ -0,0 +1,84 @@
+# Copyright 2018 TomorrowData Srl
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import threading
+import time
+
+from iottly_sdk import IottlySDK
+from iottly_sdk.bridge import Bridge
+from iottly_sdk.bridge_client import send
+
+from .bench_sdk import connected_sdk, make_payload
+from .harness import benchmark, latency_summary
+from .stub_agent import SinkAgent
+
+
+@benchmark('oneshot_send', mode=['sdk', 'bridge'])
+def oneshot_send(ctx, mode):
+    """Latency of a script sending a single message and exiting.
+
+    `sdk` builds, starts and stops (draining) an `IottlySDK` per message,
+    `bridge` sends a datagram to a running bridge. `caller` is the time
+    spent by the script, `delivery` the time until the agent receives the
+    message.
+    """
+    msg = make_payload(256)
+    caller = []
+    delivery = []
+    if mode == 'sdk':
+        n = ctx.scaled(20, 5)
+        transport = ctx.transport()
+        agent = SinkAgent(transport)
+        agent.start()
+        try:
+            for i in range(n):
+                linked = threading.Event()
+
+                def on_status(status, linked=linked):
+                    if status == 'started':
+                        linked.set()
+                t0 = time.perf_counter()
+                sdk = IottlySDK('script', transport=transport,
+                                on_agent_status_changed=on_status)
+                sdk.start()
+                linked.wait(5.0)
+                sdk.send(msg)
+                sdk.stop(drain=True)
+                t1 = time.perf_counter()
+                # The start-up signal and the message
+                agent.wait_lines(2 * (i + 1), 5.0)
+                caller.append(t1 - t0)
+                delivery.append(agent.last_arrival - t0)
+        finally:
+            agent.stop()
+    else:
+        n = ctx.scaled(2000, 200)
+        with connected_sdk(ctx, track_arrivals=True) as (sdk, agent):
+            path = os.path.join(os.path.dirname(ctx.socket_path()), 'bridge.sock')
+            bridge = Bridge(sdk, path)
+            bridge.start()
+            try:
+                for i in range(n):
+                    t0 = time.perf_counter()
+                    send(msg, path=path)
+                    t1 = time.perf_counter()
+                    agent.wait_lines(i + 1, 5.0)
+                    caller.append(t1 - t0)
+                    delivery.append(agent.arrival_of(i + 1) - t0)
+            finally:
+                bridge.stop()
+    result = latency_summary(caller, prefix='caller')
+    result.update(latency_summary(delivery, prefix='delivery'))
+    return result
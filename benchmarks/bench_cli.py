@@ -0,0 +1,56 @@
+# Copyright 2018 TomorrowData Srl
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import json
+import os
+import time
+
+from iottly_sdk import cli
+
+from .bench_sdk import make_payload
+from .harness import benchmark
+from .stub_agent import SinkAgent
+
+
+@benchmark('cli_ingest', payload_bytes=[64, 1024], max_buffered_msgs=[1000, 10000])
+def cli_ingest(ctx, payload_bytes, max_buffered_msgs):
+    """Throughput of `iottly-send` reading a file of JSON lines.
+
+    Half of the lines select their channel. The tool blocks on a full
+    buffer: no line is dropped.
+    """
+    n = ctx.scaled(200000, 20000)
+    socket_path = ctx.socket_path()
+    data_path = os.path.join(os.path.dirname(socket_path), 'lines.jsonl')
+    line = json.dumps(make_payload(payload_bytes)).encode()
+    with open(data_path, 'wb') as f:
+        for i in range(n // 2):
+            f.write(line + b'\n')
+            f.write(b'telemetry\t' + line + b'\n')
+    agent = SinkAgent(socket_path)
+    agent.start()
+    try:
+        t0 = time.perf_counter()
+        status = cli.main([data_path, '--socket-path', socket_path, '--quiet',
+                           '--max-buffered-msgs', str(max_buffered_msgs)])
+        elapsed = time.perf_counter() - t0
+        # The start-up signal and the lines
+        received = agent.wait_idle() - 1
+    finally:
+        agent.stop()
+    return {
+        'msgs_per_sec': received / elapsed,
+        'received': received,
+        'exit_status': status,
+    }
@@ -0,0 +1,113 @@
+# Copyright 2018 TomorrowData Srl
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import multiprocessing
+import threading
+import time
+
+from iottly_sdk import IottlySDK
+from iottly_sdk.forwarder import ForwarderProcess, SharedProducer, SharedRingBuffer
+
+from .async_agent import AgentProcess
+from .bench_sdk import make_payload
+from .harness import benchmark, percentile
+
+
+def _worker(mode, ring, socket_path, name, n, payload, ready, go):
+    t0 = time.time()
+    if mode == 'shared_ring':
+        sender = SharedProducer(ring)
+    else:
+        linked = threading.Event()
+        sender = IottlySDK(
+            name, socket_path, max_buffered_msgs=n,
+            on_agent_status_changed=lambda s: s == 'started' and linked.set())
+        sender.start()
+        linked.wait(10.0)
+    ready.put(time.time() - t0)
+    go.wait()
+    send = sender.send
+    for _ in range(n):
+        send(payload)
+    if mode == 'per_process':
+        while not sender._buffer.empty():
+            time.sleep(0.01)
+        time.sleep(0.2)
+        sender.stop()
+
+
+@benchmark('cross_process_send', mode=['shared_ring', 'per_process'],
+           workers=[2, 8])
+def cross_process_send(ctx, mode, workers):
+    """Throughput of worker processes sending through one forwarder or
+    through a connection each.
+    """
+    n = ctx.scaled(20000, 2000)
+    payload = make_payload(64)
+    socket_path = ctx.socket_path()
+    agent = AgentProcess(socket_path)
+    agent.start()
+    ring = forwarder = None
+    procs = []
+    try:
+        if mode == 'shared_ring':
+            ring = SharedRingBuffer(capacity=64 * 1024 * 1024)
+            forwarder = ForwarderProcess(ring, 'bench', socket_path=socket_path,
+                                         max_buffered_msgs=workers * n)
+            forwarder.start()
+            agent.wait_clients(1)
+        ready = multiprocessing.Queue()
+        go = multiprocessing.Event()
+        procs = [
+            multiprocessing.Process(
+                target=_worker,
+                args=(mode, ring, socket_path, 'bench-{}'.format(i), n,
+                      payload, ready, go))
+            for i in range(workers)]
+        for p in procs:
+            p.start()
+        setup = [ready.get(timeout=30.0) for _ in procs]
+        agent.reset()
+        t0 = time.time()
+        go.set()
+        expected = workers * n
+        deadline = t0 + 120.0
+        last, stats = -1, agent.stats()
+        received = 0
+        # Poll until everything arrived or the agent stops receiving
+        while received < expected and (received != last or not received) \
+                and time.time() < deadline:
+            last = received
+            time.sleep(0.25)
+            stats = agent.stats()
+            received = sum(s['msgs'] for s in stats.values())
+        t1 = max(s['last_msg'] for s in stats.values() if s['last_msg'])
+        connections = len(agent.connected())
+        for p in procs:
+            p.join(30.0)
+    finally:
+        for p in procs:
+            if p.is_alive():
+                p.terminate()
+        if forwarder is not None:
+            forwarder.stop()
+        if ring is not None:
+            ring.close()
+        agent.stop()
+    return {
+        'msgs_per_sec': received / (t1 - t0),
+        'drop_ratio': 1.0 - float(received) / expected,
+        'worker_setup_ms_p50': percentile(setup, 50) * 1e3,
+        'agent_connections': connections,
+    }
@@ -0,0 +1,47 @@
+# Copyright 2018 TomorrowData Srl
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import time
+
+from iottly_sdk.iottly import IottlySDK
+
+from .bench_sdk import make_payload
+from .harness import benchmark
+
+
+@benchmark('max_message_bytes', limit=[0, 65536],
+           payload_bytes=[64, 1024, 16384, 262144])
+def max_message_bytes(ctx, limit, payload_bytes):
+    """CPU time to `send` a message with and without a size limit.
+
+    Messages within the limit take the usual path; larger ones are split
+    in fragments (`us_per_msg` is per original message).
+    """
+    payload = make_payload(payload_bytes)
+    n = ctx.scaled(max(100, 4000000 // payload_bytes), 200)
+    # The SDK is never started: messages stay in the buffer
+    sdk = IottlySDK('bench', ctx.socket_path(), max_buffered_msgs=1000,
+                    max_message_bytes=limit or None)
+    send = sdk.channel('sensors').send
+    buffer = sdk._buffer
+    t0 = time.process_time()
+    for _ in range(n):
+        send(payload)
+        if buffer.qsize() > 900:
+            while not buffer.empty():
+                buffer.get()
+                buffer.task_done()
+    t1 = time.process_time()
+    return {'us_per_msg': (t1 - t0) * 1e6 / n,
+            'buffered_per_msg': sdk.channel('sensors').stats()['msgs'] / float(n)}
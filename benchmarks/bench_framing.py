@@ -0,0 +1,51 @@
+# Copyright 2018 TomorrowData Srl
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import time
+
+from iottly_sdk import IottlySDK
+from iottly_sdk.framing import get_protocol
+
+from .bench_sdk import PAYLOAD_SIZES, make_payload
+from .harness import Skip, benchmark
+
+
+@benchmark('framing_codec', framing=['json', 'msgpack', 'cbor'],
+           payload_bytes=PAYLOAD_SIZES)
+def framing_codec(ctx, framing, payload_bytes):
+    """Bytes on the wire and encode/decode CPU time of a data message.
+
+    Encoding goes through the same path of `send` (JSON lines use the
+    string templates); decoding splits the frames of a whole stream.
+    """
+    protocol = get_protocol(framing)
+    if protocol is None:
+        raise Skip('{} codec not installed'.format(framing))
+    sdk = IottlySDK('bench', ctx.socket_path())
+    payload = make_payload(payload_bytes)
+    n = ctx.scaled(max(100, 2000000 // payload_bytes), 1000)
+
+    t0 = time.process_time()
+    frames = [sdk._msg_serialize(payload, 'sensors', protocol) for _ in range(n)]
+    t1 = time.process_time()
+    stream = b''.join(frames)
+    t2 = time.process_time()
+    decoded = [protocol.decode(f) for f in protocol.decoder().feed(stream)]
+    t3 = time.process_time()
+    assert len(decoded) == n
+    return {
+        'wire_bytes_per_msg': float(len(stream)) / n,
+        'encode_us_per_msg': (t1 - t0) * 1e6 / n,
+        'decode_us_per_msg': (t3 - t2) * 1e6 / n,
+    }
@@ -0,0 +1,30 @@
+# Copyright 2018 TomorrowData Srl
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from .harness import benchmark
+from .loadgen import run_load
+
+
+@benchmark('multi_client_throughput', clients=[1, 8, 32], processes=[1, 4])
+def multi_client_throughput(ctx, clients, processes):
+    """Aggregate throughput and fairness of many apps on one agent.
+    """
+    res = run_load(clients=clients, processes=min(processes, clients),
+                   duration=ctx.scaled(3.0, 1.0),
+                   socket_path=ctx.socket_path())
+    return {
+        'aggregate_msgs_per_sec': res['aggregate_msgs_per_sec'],
+        'drop_ratio': res['drop_ratio'],
+        'jain_fairness': res['jain_fairness'],
+    }
@@ -0,0 +1,88 @@
+# Copyright 2018 TomorrowData Srl
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import threading
+import time
+
+from iottly_sdk import IottlySDK
+from iottly_sdk.multiplex import AgentConnection
+
+from .async_agent import AgentProcess
+from .bench_sdk import make_payload
+from .harness import benchmark
+
+
+def _open_fds():
+    try:
+        return len(os.listdir('/proc/self/fd'))
+    except OSError:
+        return float('nan')
+
+
+@benchmark('many_apps_one_process', mode=['sdk', 'multiplex'], apps=[1, 15])
+def many_apps_one_process(ctx, mode, apps):
+    """Threads, descriptors and throughput of N apps in one process.
+    """
+    n = ctx.scaled(5000, 500)
+    payload = make_payload(64)
+    socket_path = ctx.socket_path()
+    agent = AgentProcess(socket_path)
+    agent.start()
+    threads, fds = threading.active_count(), _open_fds()
+    started = [threading.Event() for _ in range(apps)]
+    conn = None
+    if mode == 'sdk':
+        senders = [IottlySDK('app-{}'.format(i), socket_path,
+                             max_buffered_msgs=n,
+                             on_agent_status_changed=lambda s, e=e: e.set())
+                   for i, e in enumerate(started)]
+    else:
+        conn = AgentConnection(socket_path)
+        senders = [conn.session('app-{}'.format(i), max_buffered_msgs=n,
+                                on_agent_status_changed=lambda s, e=e: e.set())
+                   for i, e in enumerate(started)]
+    try:
+        for s in senders:
+            s.start()
+        if conn is not None:
+            conn.start()
+        for e in started:
+            e.wait(5.0)
+        threads = threading.active_count() - threads
+        fds = _open_fds() - fds
+        agent.reset()
+        t0 = time.time()
+        for _ in range(n):
+            for s in senders:
+                s.send(payload)
+        expected = n * apps
+        deadline = t0 + 60.0
+        received = 0
+        while received < expected and time.time() < deadline:
+            time.sleep(0.1)
+            stats = agent.stats()
+            received = sum(v['msgs'] for v in stats.values())
+        t1 = max(v['last_msg'] for v in stats.values() if v['last_msg'])
+    finally:
+        for s in senders:
+            s.stop()
+        if conn is not None:
+            conn.stop()
+        agent.stop()
+    return {
+        'threads': threads,
+        'fds': fds,
+        'msgs_per_sec': received / (t1 - t0),
+    }
@@ -0,0 +1,108 @@
+# Copyright 2018 TomorrowData Srl
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import threading
+import time
+
+from iottly_sdk.scheduler import Scheduler, _clock
+
+from .harness import Skip, benchmark, latency_summary
+
+_INTERVAL = 0.25
+
+
+def _sleep_loop(interval, fn, stop):
+    # The loop the periodic producers replace
+    while not stop.wait(interval):
+        fn()
+
+
+@benchmark('periodic_timers', impl=['wheel', 'sleep_threads'], timers=[10, 1000, 5000])
+def periodic_timers(ctx, impl, timers):
+    """Lateness and CPU time of `timers` producers firing every 250 ms.
+
+    `wheel` runs them on a `Scheduler`, `sleep_threads` on a thread each
+    sleeping `interval` between runs (their lateness accumulates: drift).
+    """
+    if impl == 'sleep_threads' and timers > 1000:
+        raise Skip('a thread per timer')
+    duration = ctx.scaled(3.0, 1.0)
+    lock = threading.Lock()
+    lateness = []
+    scheduler = Scheduler()
+    stop = threading.Event()
+    threads = []
+    t0 = _clock() + 0.1
+
+    def make_producer(k):
+        # The k-th producer is due at t0 + (k + 1) * interval
+        runs = [0]
+
+        def producer():
+            runs[0] += 1
+            late = _clock() - (t0 + runs[0] * _INTERVAL)
+            with lock:
+                lateness.append(late)
+        return producer
+
+    cpu0 = time.process_time()
+    wall0 = time.perf_counter()
+    for i in range(timers):
+        if impl == 'wheel':
+            scheduler.every(_INTERVAL, make_producer(i), delay=t0 + _INTERVAL - _clock(),
+                            pool=True)
+        else:
+            def run(fn=make_producer(i)):
+                time.sleep(max(0, t0 - _clock()))
+                _sleep_loop(_INTERVAL, fn, stop)
+            t = threading.Thread(target=run)
+            t.daemon = True
+            t.start()
+            threads.append(t)
+    time.sleep(duration)
+    cpu = time.process_time() - cpu0
+    wall = time.perf_counter() - wall0
+    scheduler.stop()
+    stop.set()
+    for t in threads:
+        t.join()
+    with lock:
+        samples = list(lateness)
+    result = latency_summary(samples, prefix='lateness')
+    result['cpu_percent'] = 100.0 * cpu / wall
+    result['runs'] = len(samples)
+    return result
+
+
+@benchmark('timer_churn', timers=[1000, 100000])
+def timer_churn(ctx, timers):
+    """Cost of adding and cancelling one-shot timers (handshake timeouts).
+    """
+    n = ctx.scaled(timers, min(timers, 10000))
+    scheduler = Scheduler()
+    t0 = time.perf_counter()
+    handles = [scheduler.call_later(60.0 + i * 1e-3, _noop) for i in range(n)]
+    t1 = time.perf_counter()
+    for handle in handles:
+        handle.cancel()
+    t2 = time.perf_counter()
+    scheduler.stop()
+    return {
+        'add_us': (t1 - t0) * 1e6 / n,
+        'cancel_us': (t2 - t1) * 1e6 / n,
+    }
+
+
+def _noop():
+    pass
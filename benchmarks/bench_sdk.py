@@ -0,0 +1,327 @@
+# Copyright 2018 TomorrowData Srl
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import gc
+import json
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager
+
+from iottly_sdk import IottlySDK
+from iottly_sdk.framing import JSON_LINES
+from iottly_sdk.iottly import _read_frames
+
+from .harness import benchmark, latency_summary
+from .stub_agent import SinkAgent
+
+PAYLOAD_SIZES = [64, 1024, 16384]
+BUFFER_SIZES = [10, 1000, 10000]
+
+# Upper bound to the bytes pushed by a single throughput run
+_MAX_BYTES_PER_RUN = 64 * 1024 * 1024
+
+
+def make_payload(size):
+    """Build a sensor-like payload whose JSON encoding is about `size` bytes.
+    """
+    payload = {'ts': 1546300800000}
+    i = 0
+    # Every reading adds ~14 bytes: `"s12": 20.125, `
+    while len(json.dumps(payload)) < size:
+        for _ in range(max(1, (size - len(json.dumps(payload))) // 14)):
+            payload['s{}'.format(i)] = 20.0 + (i % 64) * 0.125
+            i += 1
+    return payload
+
+
+@contextmanager
+def connected_sdk(ctx, track_arrivals=False, agent_acks=False, **sdk_kwargs):
+    """Yield an `IottlySDK` linked to a `SinkAgent` after the handshake.
+
+    The agent counters are reset once the SDK start-up signal is received.
+    """
+    transport = ctx.transport()
+    agent = SinkAgent(transport, track_arrivals=track_arrivals,
+                      acks=agent_acks)
+    agent.start()
+    linked = threading.Event()
+
+    def on_status(status):
+        if status == 'started':
+            linked.set()
+
+    sdk = IottlySDK('bench', transport=transport,
+                    on_agent_status_changed=on_status, **sdk_kwargs)
+    sdk.start()
+    try:
+        if not (agent.wait_lines(1, 5.0) and linked.wait(5.0)):
+            raise RuntimeError('SDK did not connect to the stub agent')
+        agent.reset()
+        yield sdk, agent
+    finally:
+        sdk.stop()
+        agent.stop()
+
+
+@benchmark('send_throughput', payload_bytes=PAYLOAD_SIZES,
+           max_buffered_msgs=BUFFER_SIZES)
+def send_throughput(ctx, payload_bytes, max_buffered_msgs):
+    """Push messages as fast as possible and measure what reaches the agent.
+    """
+    payload = make_payload(payload_bytes)
+    n = min(ctx.scaled(20000, 2000), _MAX_BYTES_PER_RUN // payload_bytes)
+    with connected_sdk(ctx, max_buffered_msgs=max_buffered_msgs) as (sdk, agent):
+        send = sdk.send
+        t0 = time.perf_counter()
+        for _ in range(n):
+            send(payload)
+        t_enqueued = time.perf_counter()
+        delivered = agent.wait_idle()
+        elapsed = (agent.last_arrival or t_enqueued) - t0
+        nbytes = agent.bytes
+    return {
+        'enqueue_msgs_per_sec': n / (t_enqueued - t0),
+        'delivered_msgs_per_sec': delivered / elapsed,
+        'delivered_mb_per_sec': nbytes / elapsed / 1e6,
+        'drop_ratio': 1.0 - float(delivered) / n,
+    }
+
+
+@benchmark('reliable_throughput', payload_bytes=[64, 1024],
+           ack_window=[0, 1, 8, 64, 512])
+def reliable_throughput(ctx, payload_bytes, ack_window):
+    """Time until a burst of messages is acknowledged (`ack_window=0`:
+    reliable mode off, until written) by an agent acking every chunk.
+    """
+    payload = make_payload(payload_bytes)
+    n = ctx.scaled(20000, 2000)
+    with connected_sdk(ctx, agent_acks=True, max_buffered_msgs=n,
+                       ack_window=ack_window or None) as (sdk, agent):
+        t0 = time.perf_counter()
+        for _ in range(n):
+            sdk.send(payload)
+        pending = sdk.flush(60.0)
+        elapsed = time.perf_counter() - t0
+    return {
+        'msgs_per_sec': (n - pending) / elapsed,
+        'mb_per_sec': agent.bytes / elapsed / 1e6,
+        'lost_ratio': float(pending) / n,
+    }
+
+
+@benchmark('enqueue_to_agent_latency', payload_bytes=PAYLOAD_SIZES)
+def enqueue_to_agent_latency(ctx, payload_bytes):
+    """Time between `send` and the arrival at an idle agent.
+    """
+    payload = make_payload(payload_bytes)
+    n = ctx.scaled(2000, 200)
+    samples = []
+    with connected_sdk(ctx, track_arrivals=True, max_buffered_msgs=10) as (sdk, agent):
+        for i in range(1, n + 1):
+            t = time.perf_counter()
+            sdk.send(payload)
+            agent.wait_lines(i)
+            samples.append(agent.arrival_of(i) - t)
+    return latency_summary(samples)
+
+
+@benchmark('backlog_replay', payload_bytes=PAYLOAD_SIZES,
+           max_buffered_msgs=BUFFER_SIZES)
+def backlog_replay(ctx, payload_bytes, max_buffered_msgs):
+    """Fill the buffer while the agent is down, then time the replay.
+    """
+    payload = make_payload(payload_bytes)
+    transport = ctx.transport()
+    sdk = IottlySDK('bench', transport=transport,
+                    max_buffered_msgs=max_buffered_msgs)
+    sdk.start()
+    for _ in range(max_buffered_msgs):
+        sdk.send(payload)
+    agent = SinkAgent(transport)
+    agent.start()
+    try:
+        # Start-up signal plus the whole backlog
+        if not agent.wait_lines(max_buffered_msgs + 1, 60.0):
+            raise RuntimeError('backlog was not replayed')
+        elapsed = agent.last_arrival - agent.connected_at
+    finally:
+        sdk.stop()
+        agent.stop()
+    return {
+        'replay_secs': elapsed,
+        'replay_msgs_per_sec': max_buffered_msgs / elapsed,
+    }
+
+
+@benchmark('command_dispatch_latency')
+def command_dispatch_latency(ctx):
+    """Time between the agent writing a command and the callback invocation.
+    """
+    n = ctx.scaled(2000, 200)
+    received = threading.Event()
+    stamps = []
+
+    def on_cmd(params):
+        stamps.append(time.perf_counter())
+        received.set()
+
+    samples = []
+    with connected_sdk(ctx) as (sdk, agent):
+        sdk.subscribe('bench', on_cmd)
+        for i in range(n):
+            received.clear()
+            line = '{{"data": {{"bench": {{"seq": {}}}}}}}\n'.format(i).encode()
+            t = time.perf_counter()
+            agent.send(line)
+            if not received.wait(5.0):
+                raise RuntimeError('command not dispatched')
+            samples.append(stamps[-1] - t)
+    return latency_summary(samples)
+
+
+@benchmark('buffered_memory', payload_bytes=PAYLOAD_SIZES,
+           max_buffered_msgs=BUFFER_SIZES)
+def buffered_memory(ctx, payload_bytes, max_buffered_msgs):
+    """Traced memory held by the internal buffer for every message.
+
+    Payloads are decoded from JSON inside the traced region so each
+    buffered message owns its objects, as in a real producer.
+    """
+    raw = json.dumps(make_payload(payload_bytes))
+    # The SDK is never started: messages stay in the buffer
+    sdk = IottlySDK('bench', ctx.socket_path(),
+                    max_buffered_msgs=max_buffered_msgs)
+    gc.collect()
+    tracemalloc.start()
+    try:
+        before = tracemalloc.get_traced_memory()[0]
+        for _ in range(max_buffered_msgs):
+            sdk.send(json.loads(raw))
+        gc.collect()
+        after = tracemalloc.get_traced_memory()[0]
+    finally:
+        tracemalloc.stop()
+    per_msg = float(after - before) / max_buffered_msgs
+    return {
+        'bytes_per_msg': per_msg,
+        'overhead_bytes_per_msg': per_msg - len(raw),
+    }
+
+
+@benchmark('enqueue_cost', api=['send', 'send_raw'], payload_bytes=PAYLOAD_SIZES)
+def enqueue_cost(ctx, api, payload_bytes):
+    """CPU time to validate, encode and buffer one message.
+
+    The producer holds the JSON encoding of the message (eg. a bridge):
+    `send` needs it decoded first, `send_raw` takes it as it is.
+    """
+    raw = json.dumps(make_payload(payload_bytes)).encode()
+    n = ctx.scaled(max(100, 4000000 // payload_bytes), 1000)
+    # The SDK is never started: messages stay in the buffer
+    sdk = IottlySDK('bench', ctx.socket_path(), max_buffered_msgs=1000)
+    t0 = time.process_time()
+    if api == 'send':
+        for _ in range(n):
+            sdk.send(json.loads(raw), channel='sensors')
+    else:
+        for _ in range(n):
+            sdk.send_raw(raw, channel='sensors')
+    t1 = time.process_time()
+    return {'us_per_msg': (t1 - t0) * 1e6 / n}
+
+
+@benchmark('schema_send', api=['send', 'schema'])
+def schema_send(ctx, api):
+    """CPU time to send a small fixed-shape reading.
+    """
+    n = ctx.scaled(200000, 10000)
+    sdk = IottlySDK('bench', ctx.socket_path(), max_buffered_msgs=1000)
+    readings = sdk.register_schema(
+        'readings', [('temperature', float), ('humidity', float), ('ts', int)])
+    t0 = time.process_time()
+    if api == 'send':
+        for i in range(n):
+            sdk.send({'temperature': 21.5, 'humidity': 40.25, 'ts': i})
+    else:
+        for i in range(n):
+            readings.send(21.5, 40.25, i)
+    t1 = time.process_time()
+    return {'us_per_msg': (t1 - t0) * 1e6 / n}
+
+
+@benchmark('channel_send', api=['send', 'handle'])
+def channel_send(ctx, api):
+    """CPU time to send a small message to a channel.
+    """
+    n = ctx.scaled(200000, 10000)
+    sdk = IottlySDK('bench', ctx.socket_path(), max_buffered_msgs=1000)
+    msg = {'door': 'open', 'ts': 1546300800}
+    t0 = time.process_time()
+    if api == 'send':
+        for _ in range(n):
+            sdk.send(msg, channel='alarms')
+    else:
+        alarms = sdk.channel('alarms')
+        for _ in range(n):
+            alarms.send(msg)
+    t1 = time.process_time()
+    return {'us_per_msg': (t1 - t0) * 1e6 / n}
+
+
+@benchmark('thread_count')
+def thread_count(ctx):
+    """Threads added to the process by one linked SDK instance.
+    """
+    before = threading.active_count()
+    with connected_sdk(ctx) as (sdk, agent):
+        during = threading.active_count()
+    # The stub agent runs one thread of its own
+    return {'threads_per_sdk': during - before - 1}
+
+
+class _ChunkSocket(object):
+    """Socket replaying a fixed list of chunks.
+    """
+    def __init__(self, chunks):
+        self._chunks = iter(chunks)
+
+    def recv(self, size):
+        return next(self._chunks, b'')
+
+
+@benchmark('receive_parse', payload_bytes=PAYLOAD_SIZES)
+def receive_parse(ctx, payload_bytes):
+    """Throughput of the framing of messages received from the agent.
+    """
+    line = json.dumps({'data': {'bench': make_payload(payload_bytes)}}).encode() + b'\n'
+    n = min(ctx.scaled(20000, 2000), _MAX_BYTES_PER_RUN // payload_bytes)
+    stream = line * n
+    # Reproduce the reads performed by the receiver thread
+    size = ctx.transport().recv_size
+    chunks = [stream[i:i + size] for i in range(0, len(stream), size)]
+    sock = _ChunkSocket(chunks)
+    decoder = JSON_LINES.decoder()
+    parsed = 0
+    t0 = time.perf_counter()
+    while parsed < n:
+        msgs = _read_frames(sock, decoder, size=size)
+        if not msgs:
+            break
+        parsed += len(msgs)
+    elapsed = time.perf_counter() - t0
+    return {
+        'msgs_per_sec': parsed / elapsed,
+        'mb_per_sec': len(stream) / elapsed / 1e6,
+    }
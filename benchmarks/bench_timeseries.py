@@ -0,0 +1,57 @@
+# Copyright 2018 TomorrowData Srl
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import time
+
+from iottly_sdk import IottlySDK, TimeSeriesBatcher
+from iottly_sdk import timeseries
+
+from .harness import Skip, benchmark
+
+
+@benchmark('timeseries_samples', mode=['send', 'batcher', 'columns'])
+def timeseries_samples(ctx, mode):
+    """CPU time and buffered bytes per 3-field sensor sample.
+
+    `send` sends a message per sample, `batcher` adds the samples one by
+    one to a `TimeSeriesBatcher` (1000 samples per batch), `columns` adds
+    blocks of 1000 samples as NumPy arrays.
+    """
+    if mode == 'columns' and timeseries.numpy is None:
+        raise Skip('numpy not installed')
+    n = ctx.scaled(200000, 20000)
+    sdk = IottlySDK('bench', ctx.socket_path(), max_buffered_msgs=n)
+    sensors = sdk.channel('sensors')
+    batcher = TimeSeriesBatcher(sdk, max_samples=1000, max_latency=60)
+    t0 = time.process_time()
+    if mode == 'send':
+        for i in range(n):
+            sensors.send({'ts': 1546300800.0 + i, 'temp': 21.5, 'hum': 40.25})
+    elif mode == 'batcher':
+        for i in range(n):
+            batcher.add({'temp': 21.5, 'hum': 40.25}, ts=1546300800.0 + i,
+                        channel='sensors')
+    else:
+        numpy = timeseries.numpy
+        ts = 1546300800.0 + numpy.arange(1000, dtype='d')
+        temp = numpy.full(1000, 21.5)
+        hum = numpy.full(1000, 40.25)
+        for _ in range(n // 1000):
+            batcher.add_columns(ts, {'temp': temp, 'hum': hum}, channel='sensors')
+    batcher.close()
+    t1 = time.process_time()
+    return {
+        'us_per_sample': (t1 - t0) * 1e6 / n,
+        'bytes_per_sample': float(sensors.stats()['bytes']) / n,
+    }
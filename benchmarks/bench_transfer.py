@@ -0,0 +1,149 @@
+# Copyright 2018 TomorrowData Srl
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import base64
+import gc
+import json
+import os
+import threading
+import time
+
+from iottly_sdk.transfer import DEFAULT_CHUNK_SIZE
+
+from .bench_sdk import connected_sdk
+from .harness import Skip, benchmark
+
+
+def _rss_anon():
+    # Anonymous resident memory (file-backed mapped pages excluded), bytes
+    with open('/proc/self/status') as f:
+        for line in f:
+            if line.startswith('RssAnon:'):
+                return int(line.split()[1]) * 1024
+    raise Skip('RssAnon not available')
+
+
+class _PeakRss(object):
+    """Sample the anonymous RSS in a thread, keeping the peak.
+    """
+    def __init__(self, period=0.005):
+        self.period = period
+        self.base = _rss_anon()
+        self.peak = self.base
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._sample)
+        self._thread.daemon = True
+        self._thread.start()
+
+    def _sample(self):
+        while not self._stop.wait(self.period):
+            self.peak = max(self.peak, _rss_anon())
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+        return self.peak - self.base
+
+
+@benchmark('file_upload', mode=['send', 'send_file'])
+def file_upload(ctx, mode):
+    """Peak memory and throughput of sending a 100 MB file.
+
+    `send` is the previous way: read the file, base64-encode it in a
+    `dict` and `send` one message. `send_file` streams memory-mapped
+    chunks. `peak_rss_mb` is the growth of the anonymous resident memory.
+    """
+    size = ctx.scaled(100, 10) * 1024 * 1024
+    path = os.path.join(os.path.dirname(ctx.socket_path()), 'upload.bin')
+    with open(path, 'wb') as f:
+        block = os.urandom(1024 * 1024)
+        for _ in range(size // len(block)):
+            f.write(block)
+    with connected_sdk(ctx) as (sdk, agent):
+        gc.collect()
+        rss = _PeakRss()
+        t0 = time.perf_counter()
+        if mode == 'send':
+            with open(path, 'rb') as f:
+                data = base64.b64encode(f.read()).decode()
+            sdk.send({'file': {'name': 'upload.bin', 'data': data}})
+            del data
+            agent.wait_lines(1, 120.0)
+        else:
+            transfer = sdk.send_file(path)
+            transfer.wait(120.0)
+            agent.wait_lines(transfer.chunks, 120.0)
+        elapsed = time.perf_counter() - t0
+        peak = rss.stop()
+    return {
+        'peak_rss_mb': peak / 1e6,
+        'mb_per_sec': size / elapsed / 1e6,
+    }
+
+
+def _file_chunks(content, chunk_size=DEFAULT_CHUNK_SIZE):
+    # The `sdkfile` command lines of `content`, one at a time
+    chunks = -(-len(content) // chunk_size)
+    for k in range(chunks):
+        offset = k * chunk_size
+        header = {'cmd': 'firmware', 'id': 'bench', 'size': len(content),
+                  'chunks': chunks, 'chunk': k, 'offset': offset,
+                  'data': base64.b64encode(content[offset:offset + chunk_size]).decode()}
+        yield json.dumps({'data': {'sdkfile': header}}).encode() + b'\n'
+
+
+@benchmark('file_download', mode=['line', 'chunks'])
+def file_download(ctx, mode):
+    """Peak memory and throughput of receiving a 100 MB command.
+
+    `line` is the previous way: the file is base64-encoded in a single
+    command and written by the callback. `chunks` sends it as `sdkfile`
+    chunks, written in place by the SDK. `peak_rss_mb` is the growth of
+    the anonymous resident memory (the command line of `line` is built
+    before measuring).
+    """
+    size = ctx.scaled(100, 10) * 1024 * 1024
+    content = os.urandom(1024 * 1024) * (size // (1024 * 1024))
+    target = os.path.join(os.path.dirname(ctx.socket_path()), 'firmware.bin')
+    received = threading.Event()
+
+    def on_firmware(params):
+        if 'file' in params:
+            os.rename(params['file']['path'], target)
+        else:
+            with open(target, 'wb') as f:
+                f.write(base64.b64decode(params['data']))
+        received.set()
+
+    if mode == 'line':
+        line = json.dumps({'data': {'firmware': {
+            'data': base64.b64encode(content).decode()}}}).encode() + b'\n'
+    with connected_sdk(ctx) as (sdk, agent):
+        sdk.subscribe('firmware', on_firmware)
+        gc.collect()
+        rss = _PeakRss()
+        t0 = time.perf_counter()
+        if mode == 'line':
+            agent.send(line)
+        else:
+            for chunk in _file_chunks(content):
+                agent.send(chunk)
+        received.wait(120.0)
+        elapsed = time.perf_counter() - t0
+        peak = rss.stop()
+    return {
+        'peak_rss_mb': peak / 1e6,
+        'mb_per_sec': size / elapsed / 1e6,
+        'received': os.path.getsize(target) == size,
+    }
@@ -0,0 +1,267 @@
+# Copyright 2018 TomorrowData Srl
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import fnmatch
+import importlib
+import itertools
+import json
+import os
+import pkgutil
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import uuid
+from collections import namedtuple
+
+from iottly_sdk.transport import LoopbackTransport, TcpTransport, UnixTransport
+
+# Registered benchmarks, in registration order
+_REGISTRY = []
+
+# Transports of `Context.transport`, see `run`
+TRANSPORTS = ['unix', 'seqpacket', 'abstract', 'tcp', 'loopback']
+
+Benchmark = namedtuple('Benchmark', ['name', 'func', 'params'])
+
+
+class Skip(Exception):
+    """Raised by a benchmark that can't run here (eg. missing package).
+    """
+
+
+def benchmark(name, **params):
+    """Register a benchmark function.
+
+    Every keyword argument maps a parameter name to the list of values
+    to explore; the benchmark is run once for each combination.
+    The decorated function is invoked as `func(ctx, **combination)` and
+    must return a `dict` mapping metric names to numbers.
+    """
+    def decorator(f):
+        _REGISTRY.append(Benchmark(name, f, params))
+        return f
+    return decorator
+
+
+def load_benchmarks():
+    """Import every `bench_*` module of this package so they can register.
+    """
+    pkg_dir = os.path.dirname(os.path.abspath(__file__))
+    for _, mod_name, _ in pkgutil.iter_modules([pkg_dir]):
+        if mod_name.startswith('bench_'):
+            importlib.import_module('benchmarks.' + mod_name)
+    return list(_REGISTRY)
+
+
+def expand(bench):
+    """Yield the parameter combinations of a benchmark.
+    """
+    keys = sorted(bench.params)
+    for values in itertools.product(*(bench.params[k] for k in keys)):
+        yield dict(zip(keys, values))
+
+
+def bench_id(name, params):
+    if not params:
+        return name
+    args = ','.join('{}={}'.format(k, params[k]) for k in sorted(params))
+    return '{}[{}]'.format(name, args)
+
+
+# ======================================================================== #
+# ============================== Statistics ============================== #
+# ======================================================================== #
+
+def percentile(samples, pct):
+    """Return the `pct` percentile (0-100) of `samples` (linear interpolation).
+    """
+    if not samples:
+        return float('nan')
+    data = sorted(samples)
+    k = (len(data) - 1) * pct / 100.0
+    lo = int(k)
+    hi = min(lo + 1, len(data) - 1)
+    return data[lo] + (data[hi] - data[lo]) * (k - lo)
+
+
+def latency_summary(samples, prefix='latency', scale=1e6):
+    """Summarize latency samples (seconds) as microsecond percentiles.
+    """
+    return {
+        '{}_p50_us'.format(prefix): percentile(samples, 50) * scale,
+        '{}_p90_us'.format(prefix): percentile(samples, 90) * scale,
+        '{}_p99_us'.format(prefix): percentile(samples, 99) * scale,
+        '{}_max_us'.format(prefix): max(samples) * scale if samples else float('nan'),
+    }
+
+
+def _median(values):
+    return percentile(values, 50)
+
+
+# ======================================================================== #
+# ================================ Runner ================================ #
+# ======================================================================== #
+
+class Context(object):
+    """Per-run helpers handed to every benchmark function.
+    """
+    def __init__(self, quick=False, transport='unix'):
+        self.quick = quick
+        self.transport_kind = transport
+        self.transport_used = False
+        self._tmpdirs = []
+
+    def scaled(self, full, quick):
+        """Pick an iteration count depending on the run mode.
+        """
+        return quick if self.quick else full
+
+    def socket_path(self):
+        """Return a fresh unix-socket path in a private temporary directory.
+        """
+        d = tempfile.mkdtemp(prefix='iottly-bench-')
+        self._tmpdirs.append(d)
+        return os.path.join(d, 'agent.sock')
+
+    def transport(self):
+        """Return a fresh transport of the kind selected for the run.
+
+        Benchmarks connecting through it can run on every transport, the
+        others only on unix sockets.
+        """
+        self.transport_used = True
+        kind = self.transport_kind
+        if kind == 'unix':
+            return UnixTransport(self.socket_path())
+        if kind == 'seqpacket':
+            return UnixTransport(self.socket_path(), seqpacket=True)
+        if kind == 'abstract':
+            return UnixTransport('@iottly-bench-' + uuid.uuid4().hex)
+        if kind == 'tcp':
+            return TcpTransport('127.0.0.1', 0)
+        return LoopbackTransport()
+
+    def cleanup(self):
+        for d in self._tmpdirs:
+            shutil.rmtree(d, ignore_errors=True)
+        self._tmpdirs = []
+
+
+def _git_revision():
+    try:
+        out = subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'],
+                                      stderr=subprocess.STDOUT)
+        return out.decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def _runs(bench, params, repeat, quick, transport):
+    runs = []
+    for _ in range(repeat):
+        ctx = Context(quick=quick, transport=transport)
+        try:
+            runs.append(bench.func(ctx, **params))
+        finally:
+            ctx.cleanup()
+        if transport != 'unix' and not ctx.transport_used:
+            raise Skip('runs on unix sockets only')
+    return runs
+
+
+def run(pattern='*', repeat=3, quick=False, out=sys.stdout, transports=None):
+    """Run the registered benchmarks matching `pattern`.
+
+    Every combination is repeated `repeat` times; for each metric the raw
+    values and their median are reported. Benchmarks are run on each of
+    `transports` (default: unix sockets), added to the parameters of the
+    other ones.
+    """
+    results = []
+    for bench in load_benchmarks():
+        for bench_params, transport in itertools.product(
+                expand(bench), transports or ['unix']):
+            params = dict(bench_params)
+            if transport != 'unix':
+                params['transport'] = transport
+            ident = bench_id(bench.name, params)
+            if not fnmatch.fnmatch(ident, pattern):
+                continue
+            try:
+                runs = _runs(bench, bench_params, repeat, quick, transport)
+            except Skip as e:
+                out.write('{}\n    skipped: {}\n'.format(ident, e))
+                continue
+            metrics = {}
+            for metric in sorted(runs[0]):
+                values = [r[metric] for r in runs]
+                metrics[metric] = {'values': values, 'median': _median(values)}
+            results.append({'name': bench.name, 'params': params,
+                            'metrics': metrics})
+            out.write('{}\n'.format(ident))
+            for metric, m in sorted(metrics.items()):
+                out.write('    {:<32} {:>16.3f}\n'.format(metric, m['median']))
+            out.flush()
+    return {
+        'meta': {
+            'revision': _git_revision(),
+            'python': platform.python_version(),
+            'implementation': platform.python_implementation(),
+            'platform': platform.platform(),
+            'timestamp': time.time(),
+            'repeat': repeat,
+            'quick': quick,
+            'transports': transports or ['unix'],
+        },
+        'benchmarks': results,
+    }
+
+
+def dump(report, path):
+    with open(path, 'w') as f:
+        json.dump(report, f, indent=2, sort_keys=True)
+
+
+def compare(old_path, new_path, out=sys.stdout):
+    """Print the relative change of every metric shared by two reports.
+    """
+    with open(old_path) as f:
+        old = json.load(f)
+    with open(new_path) as f:
+        new = json.load(f)
+    old_index = dict(
+        (bench_id(b['name'], b['params']), b['metrics'])
+        for b in old['benchmarks'])
+    out.write('{} -> {}\n'.format(old['meta'].get('revision'),
+                                  new['meta'].get('revision')))
+    for b in new['benchmarks']:
+        ident = bench_id(b['name'], b['params'])
+        if ident not in old_index:
+            continue
+        out.write('{}\n'.format(ident))
+        for metric, m in sorted(b['metrics'].items()):
+            if metric not in old_index[ident]:
+                continue
+            before = old_index[ident][metric]['median']
+            after = m['median']
+            if before:
+                delta = '{:+.1f}%'.format((after - before) * 100.0 / before)
+            else:
+                delta = 'n/a'
+            out.write('    {:<32} {:>14.3f} {:>14.3f} {:>9}\n'.format(
+                metric, before, after, delta))
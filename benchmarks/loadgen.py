@@ -0,0 +1,192 @@
+# Copyright 2018 TomorrowData Srl
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Multi-client load generator for the iottly SDK.
+
+Runs N `IottlySDK` applications against an `AsyncStubAgent` and reports
+the aggregate throughput and how fairly it is shared among clients::
+
+    python -m benchmarks.loadgen --clients 32 --duration 5
+"""
+
+import argparse
+import json
+import multiprocessing
+import os
+import shutil
+import tempfile
+import threading
+import time
+
+from iottly_sdk import IottlySDK
+
+from .async_agent import AgentProcess
+
+
+def jain_index(values):
+    """Jain's fairness index: 1.0 when all values are equal, 1/n at worst.
+    """
+    if not values or not any(values):
+        return float('nan')
+    return float(sum(values)) ** 2 / (len(values) * sum(v * v for v in values))
+
+
+def _run_clients(socket_path, names, payload, duration, max_buffered_msgs,
+                 rate, linked, start, results):
+    """Run a group of SDK clients, each one producing from its own thread.
+    """
+    sdks = []
+    for name in names:
+        sdk = IottlySDK(name, socket_path, max_buffered_msgs=max_buffered_msgs)
+        sdk.start()
+        sdks.append(sdk)
+    linked.wait()
+    start.wait()
+    deadline = time.time() + duration
+    sent = {}
+
+    def produce(sdk):
+        n = 0
+        send = sdk.send
+        if rate:
+            period = 1.0 / rate
+            next_t = time.time()
+            while next_t < deadline:
+                send(payload)
+                n += 1
+                next_t += period
+                delay = next_t - time.time()
+                if delay > 0:
+                    time.sleep(delay)
+        else:
+            while time.time() < deadline:
+                send(payload)
+                n += 1
+        sent[sdk._name] = n
+
+    threads = [threading.Thread(target=produce, args=(sdk,)) for sdk in sdks]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    results.put(sent)
+    # Let the buffers drain before tearing the clients down
+    time.sleep(0.5)
+    for sdk in sdks:
+        sdk.stop()
+
+
+def run_load(clients=8, duration=3.0, payload_bytes=64, processes=1,
+             max_buffered_msgs=1000, rate=None, socket_path=None):
+    """Run the load test and return a `dict` of results.
+
+    Args:
+        clients (`int`): number of simulated SDK applications.
+        duration (`float`): seconds of load.
+        payload_bytes (`int`): approximate JSON size of each message.
+        processes (`int`): worker processes the clients are spread over.
+        max_buffered_msgs (`int`): buffer size of each client.
+        rate (`float`): per-client messages/s (`None` for as fast as possible).
+    """
+    from .bench_sdk import make_payload
+    payload = make_payload(payload_bytes)
+    tmpdir = None
+    if socket_path is None:
+        tmpdir = tempfile.mkdtemp(prefix='iottly-load-')
+        socket_path = os.path.join(tmpdir, 'agent.sock')
+    agent = AgentProcess(socket_path)
+    agent.start()
+    names = ['load-{}'.format(i) for i in range(clients)]
+    groups = [names[i::processes] for i in range(processes)]
+    # Workers are held on `linked` until every client has connected
+    linked = multiprocessing.Event()
+    start = multiprocessing.Event()
+    results = multiprocessing.Queue()
+    workers = [
+        multiprocessing.Process(
+            target=_run_clients,
+            args=(socket_path, group, payload, duration, max_buffered_msgs,
+                  rate, linked, start, results))
+        for group in groups if group]
+    try:
+        for w in workers:
+            w.start()
+        if not agent.wait_clients(clients, timeout=30.0):
+            raise RuntimeError('not all the clients connected')
+        linked.set()
+        time.sleep(0.2)
+        agent.reset()
+        start.set()
+        sent = {}
+        for _ in workers:
+            sent.update(results.get(timeout=duration + 60.0))
+        # Wait for the agent to stop receiving
+        last = -1
+        stats = agent.stats()
+        while sum(s['msgs'] for s in stats.values()) != last:
+            last = sum(s['msgs'] for s in stats.values())
+            time.sleep(0.2)
+            stats = agent.stats()
+        for w in workers:
+            w.join(30.0)
+    finally:
+        for w in workers:
+            if w.is_alive():
+                w.terminate()
+        agent.stop()
+        if tmpdir:
+            shutil.rmtree(tmpdir, ignore_errors=True)
+
+    received = [stats[name]['msgs'] if name in stats else 0 for name in names]
+    first = min(s['first_msg'] for s in stats.values() if s['first_msg'])
+    last_msg = max(s['last_msg'] for s in stats.values() if s['last_msg'])
+    elapsed = max(last_msg - first, 1e-9)
+    total_sent = sum(sent.values())
+    return {
+        'clients': clients,
+        'processes': processes,
+        'elapsed_secs': elapsed,
+        'sent': total_sent,
+        'received': sum(received),
+        'drop_ratio': 1.0 - float(sum(received)) / total_sent if total_sent else 0.0,
+        'aggregate_msgs_per_sec': sum(received) / elapsed,
+        'aggregate_mb_per_sec': sum(stats[n]['bytes'] for n in stats) / elapsed / 1e6,
+        'per_client_min': min(received),
+        'per_client_max': max(received),
+        'jain_fairness': jain_index(received),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m benchmarks.loadgen',
+                                     description=__doc__.splitlines()[0])
+    parser.add_argument('-c', '--clients', type=int, default=8)
+    parser.add_argument('-d', '--duration', type=float, default=3.0)
+    parser.add_argument('-s', '--payload-bytes', type=int, default=64)
+    parser.add_argument('-p', '--processes', type=int, default=1,
+                        help='worker processes running the clients')
+    parser.add_argument('-b', '--max-buffered-msgs', type=int, default=1000)
+    parser.add_argument('--rate', type=float,
+                        help='per-client messages/s (default: unbounded)')
+    parser.add_argument('--socket-path',
+                        help='listen on this path instead of a temporary one')
+    args = parser.parse_args(argv)
+    res = run_load(args.clients, args.duration, args.payload_bytes,
+                   args.processes, args.max_buffered_msgs, args.rate,
+                   args.socket_path)
+    print(json.dumps(res, indent=2, sort_keys=True))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,194 @@
+# Copyright 2018 TomorrowData Srl
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import bisect
+import re
+import socket
+import threading
+import time
+
+from iottly_sdk.transport import get_transport
+
+_SEQ = re.compile(br'"seq": (\d+)')
+
+
+class SinkAgent(object):
+    """Thread-based stub of the iottly agent used by the benchmarks.
+
+    The stub serves one SDK client at a time: it answers the connection
+    with an `sdkinit` signal and counts the newline-delimited messages
+    it receives. Running in the same process of the SDK, arrival times
+    share the `time.perf_counter` clock with the producer.
+
+    Args:
+        transport (`Transport` or `str`):
+            the transport (or unix-socket path) to listen on.
+
+    Keyword Args:
+        version (`str`):
+            the agent version advertised with `sdkinit` (`None` to emulate
+            an agent < 1.8.0).
+        track_arrivals (`bool`):
+            record the arrival time of every received chunk.
+        acks (`bool`):
+            acknowledge the sequenced data messages (reliable mode), with
+            a cumulative ack for every received chunk.
+    """
+
+    def __init__(self, transport, version='1.8.0', track_arrivals=False,
+                 acks=False):
+        self.transport = get_transport(transport)
+        self.version = version
+        self.track_arrivals = track_arrivals
+        self.acks = acks
+        self._cond = threading.Condition()
+        self._server = None
+        self._client = None
+        self._thread = None
+        self.connections = 0
+        self.connected_at = None
+        self.reset()
+
+    def reset(self):
+        """Reset message counters and arrival records.
+        """
+        with self._cond:
+            self.lines = 0
+            self.bytes = 0
+            self.last_arrival = None
+            # Parallel lists: arrival time and cumulative number of lines
+            self._arrival_times = []
+            self._arrival_lines = []
+
+    def start(self):
+        self._server = self.transport.listen()
+        self._thread = threading.Thread(target=self._serve, name='sink_agent')
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self):
+        if self._server:
+            try:
+                self._server.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+            self._server.close()
+        self.disconnect()
+        if self._thread:
+            self._thread.join(2.0)
+        self.transport.cleanup()
+
+    def disconnect(self):
+        """Drop the current client connection (if any).
+        """
+        with self._cond:
+            client = self._client
+        if client:
+            try:
+                client.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+
+    def send(self, data):
+        """Write raw bytes to the connected client.
+        """
+        with self._cond:
+            client = self._client
+        client.sendall(data)
+
+    def wait_connected(self, timeout=5.0):
+        with self._cond:
+            return self._cond.wait_for(lambda: self._client is not None, timeout)
+
+    def wait_lines(self, n, timeout=30.0):
+        """Block until at least `n` lines have been received.
+        """
+        with self._cond:
+            return self._cond.wait_for(lambda: self.lines >= n, timeout)
+
+    def wait_idle(self, idle=0.05, timeout=30.0):
+        """Block until no new line is received for `idle` seconds.
+        """
+        deadline = time.time() + timeout
+        with self._cond:
+            last = -1
+            while self.lines != last and time.time() < deadline:
+                last = self.lines
+                self._cond.wait(idle)
+            return self.lines
+
+    def arrival_of(self, n):
+        """Return the arrival time of the `n`-th line (1-based).
+        """
+        with self._cond:
+            i = bisect.bisect_left(self._arrival_lines, n)
+            return self._arrival_times[i]
+
+    def _serve(self):
+        while True:
+            try:
+                client, _ = self._server.accept()
+            except OSError:
+                break  # Server socket closed
+            if getattr(client, 'family', None) == socket.AF_INET:
+                client.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            with self._cond:
+                self._client = client
+                self.connections += 1
+                self.connected_at = time.perf_counter()
+                self._cond.notify_all()
+            try:
+                if self.version:
+                    client.sendall(
+                        '{{"signal": {{"sdkinit": {{"version": "{}"{}}}}}}}\n'.format(
+                            self.version, ', "acks": true' if self.acks else '').encode())
+                self._drain(client)
+            finally:
+                with self._cond:
+                    self._client = None
+                client.close()
+
+    def _drain(self, client):
+        recv = client.recv
+        tail = b''
+        while True:
+            try:
+                buf = recv(262144)
+            except OSError:
+                return
+            if not buf:
+                return
+            now = time.perf_counter()
+            n = buf.count(b'\n')
+            if self.acks and n:
+                # Ack the last complete line (the tail may hold a split one)
+                end = buf.rfind(b'\n')
+                lines = tail + buf[:end]
+                seq = _SEQ.match(lines, lines.rfind(b'"seq": '))
+                tail = buf[end + 1:]
+                if seq:
+                    client.sendall(
+                        '{{"signal": {{"sdkack": {{"seq": {}}}}}}}\n'.format(
+                            int(seq.group(1))).encode())
+            elif self.acks:
+                tail += buf
+            with self._cond:
+                self.bytes += len(buf)
+                if n:
+                    self.lines += n
+                    self.last_arrival = now
+                    if self.track_arrivals:
+                        self._arrival_times.append(now)
+                        self._arrival_lines.append(self.lines)
+                    self._cond.notify_all()
@@ -1,2 +1,3 @@
 from .iottly import IottlySDK
 from .errors import DisconnectedSDK
+from .timeseries import TimeSeriesBatcher
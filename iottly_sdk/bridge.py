@@ -0,0 +1,208 @@
+# Copyright 2018 TomorrowData Srl
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Local ingestion bridge for short-lived scripts.
+
+Cron jobs and shell scripts don't need an `IottlySDK` (and a handshake
+with the agent) each: a long-lived bridge holds one SDK connection and
+forwards the messages received on a local datagram socket::
+
+    python -m iottly_sdk.bridge --name scripts
+
+The scripts send JSON lines (see `iottly_sdk.bridge_client` for the line
+format and a client without dependencies), eg. from a shell::
+
+    printf 'jobs\\t{"backup": "done"}\\n' | socat - UNIX-SENDTO:/var/run/iottly_bridge_socket
+
+Datagrams are connectionless: a script doesn't wait for the agent, nor
+for the bridge to accept a connection. Messages go through the SDK
+buffer, so they are kept while the agent is unavailable.
+"""
+
+import argparse
+import os
+import signal
+import socket
+import sys
+import threading
+
+import six
+
+from .iottly import IottlySDK
+from .bridge_client import DEFAULT_BRIDGE_PATH
+
+# Larger than the default maximum datagram size of Linux unix sockets
+_MAX_DATAGRAM = 256 * 1024
+
+
+def forward_line(sdk, line):
+    """Send a message line (see `iottly_sdk.bridge_client`) through `sdk`.
+
+    Returns:
+        `bool`: False if the line is not a valid message (nothing sent).
+    """
+    if line.endswith(b'\r'):
+        line = line[:-1]
+    channel = None
+    if not line.startswith(b'{'):
+        channel, tab, line = line.partition(b'\t')
+        if not tab or not channel:
+            return False
+        try:
+            name = channel.decode('utf-8')
+        except UnicodeDecodeError:
+            return False
+        if six.PY3:
+            # Channel names are native strings (UTF-8 bytes on Python 2)
+            channel = name
+    try:
+        # Not `sdk.channel`: the handles of many names would be kept forever
+        sdk.send_raw(line, channel=channel, validate=True)
+    except (TypeError, ValueError):
+        return False
+    return True
+
+
+class Bridge(object):
+    """Forward the message lines received on a datagram socket to a SDK.
+
+    Args:
+        sdk (`IottlySDK`):
+            the SDK holding the connection to the **iottly agent**.
+
+    Keyword Args:
+        path (`str`):
+            the path of the datagram socket (replaced if it exists).
+        mode (`int`):
+            the permissions of the socket file (who can send).
+        rcvbuf (`int`):
+            the receive buffer of the socket in bytes, absorbing bursts.
+
+    Attributes:
+        forwarded (`int`):
+            the lines moved into the SDK buffer.
+        rejected (`int`):
+            the invalid lines discarded.
+    """
+
+    def __init__(self, sdk, path=DEFAULT_BRIDGE_PATH, mode=0o660, rcvbuf=1 << 20):
+        self._sdk = sdk
+        self.path = path
+        self.mode = mode
+        self.rcvbuf = rcvbuf
+        self._socket = None
+        self._thread = None
+        self._stopped = threading.Event()
+        self.forwarded = 0
+        self.rejected = 0
+
+    def start(self):
+        try:
+            os.unlink(self.path)
+        except OSError:
+            pass  # No stale socket
+        self._socket = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        try:
+            self._socket.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, self.rcvbuf)
+        except (OSError, IOError):
+            pass  # Keep the system default
+        self._socket.bind(self.path)
+        os.chmod(self.path, self.mode)
+        self._thread = threading.Thread(target=self._receive, name='bridge_t')
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self, timeout=2.0):
+        """Stop after the datagrams already received are forwarded.
+        """
+        self._stopped.set()
+        # Wake the receiver with an empty datagram (queued after the others)
+        waker = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        try:
+            waker.sendto(b'', self.path)
+        except (OSError, IOError):
+            pass
+        finally:
+            waker.close()
+        self._thread.join(timeout)
+        self._socket.close()
+        try:
+            os.unlink(self.path)
+        except OSError:
+            pass
+
+    def _receive(self):
+        buf = bytearray(_MAX_DATAGRAM)
+        view = memoryview(buf)
+        recv_into = self._socket.recv_into
+        sdk = self._sdk
+        while True:
+            try:
+                n = recv_into(buf)
+            except (OSError, IOError):
+                return  # Socket closed
+            if not n and self._stopped.is_set():
+                return
+            for line in view[:n].tobytes().split(b'\n'):
+                if not line:
+                    continue
+                if forward_line(sdk, line):
+                    self.forwarded += 1
+                else:
+                    self.rejected += 1
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog='python -m iottly_sdk.bridge',
+        description='Forward the JSON lines of local scripts to the iottly agent.')
+    parser.add_argument('--name', default='bridge',
+                        help='the application name (default: bridge)')
+    parser.add_argument('--path', default=DEFAULT_BRIDGE_PATH,
+                        help='the bridge socket (default: %(default)s)')
+    parser.add_argument('--mode', type=lambda v: int(v, 8), default=0o660,
+                        help='permissions of the bridge socket, octal (default: 660)')
+    parser.add_argument('--socket-path', default=None,
+                        help='the socket of the iottly agent')
+    parser.add_argument('--transport', default=None,
+                        help='reach the iottly agent with another transport, '
+                             'eg. tcp:agent:8765 (see iottly_sdk.transport)')
+    parser.add_argument('--max-buffered-msgs', type=int, default=1000,
+                        help='messages buffered while the agent is unavailable')
+    args = parser.parse_args(argv)
+
+    sdk_kwargs = {'max_buffered_msgs': args.max_buffered_msgs}
+    if args.socket_path:
+        sdk_kwargs['socket_path'] = args.socket_path
+    if args.transport:
+        sdk_kwargs['transport'] = args.transport
+    sdk = IottlySDK(args.name, **sdk_kwargs)
+    bridge = Bridge(sdk, args.path, mode=args.mode)
+
+    stopped = threading.Event()
+    for signum in (signal.SIGINT, signal.SIGTERM):
+        signal.signal(signum, lambda *_: stopped.set())
+    sdk.start()
+    bridge.start()
+    while not stopped.wait(1.0):
+        pass
+    bridge.stop()
+    discarded = sdk.stop(drain=True, timeout=5.0)
+    sys.stderr.write('forwarded {} lines, rejected {}, discarded {}\n'.format(
+        bridge.forwarded, bridge.rejected, discarded))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,93 @@
+# Copyright 2018 TomorrowData Srl
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Client of the ingestion bridge (see `iottly_sdk.bridge`).
+
+This module only uses the standard library: it can be copied next to a
+script that must not depend on the SDK::
+
+    from iottly_sdk.bridge_client import send
+
+    send({'backup': 'done'}, channel='jobs')
+
+A datagram carries one or more lines, each line a message:
+
+- `{"backup": "done"}`: a JSON object, sent without a channel;
+- `jobs\\t{"backup": "done"}`: the channel, a tab and the JSON object.
+"""
+
+import json
+import socket
+
+DEFAULT_BRIDGE_PATH = '/var/run/iottly_bridge_socket'
+
+
+def encode_line(msg, channel=None):
+    """Return the line (`bytes`, with the line break) of a message.
+    """
+    line = json.dumps(msg, separators=(',', ':')).encode('utf-8')
+    if channel:
+        line = channel.encode('utf-8') + b'\t' + line
+    return line + b'\n'
+
+
+class BridgeClient(object):
+    """Send messages to the bridge on a datagram socket.
+
+    Keyword Args:
+        path (`str`):
+            the path of the bridge socket.
+        timeout (`float`):
+            the maximum time in seconds a send waits while the bridge is
+            busy (`socket.timeout` is raised).
+    """
+
+    def __init__(self, path=DEFAULT_BRIDGE_PATH, timeout=1.0):
+        self.path = path
+        self._socket = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        self._socket.settimeout(timeout)
+
+    def send(self, msg, channel=None):
+        """Send a JSON-serializable `dict`.
+        """
+        self.send_lines(encode_line(msg, channel))
+
+    def send_lines(self, data):
+        """Send pre-framed lines (`bytes`) in a single datagram.
+
+        Raises:
+            socket.error:
+                the bridge is not running, or the datagram is too large
+                (`EMSGSIZE`: send fewer lines at a time).
+        """
+        self._socket.sendto(data, self.path)
+
+    def close(self):
+        self._socket.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def send(msg, channel=None, path=DEFAULT_BRIDGE_PATH):
+    """Send a single message through the bridge (one-shot scripts).
+    """
+    client = BridgeClient(path)
+    try:
+        client.send(msg, channel)
+    finally:
+        client.close()
@@ -0,0 +1,292 @@
+# Copyright 2018 TomorrowData Srl
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import time
+from array import array
+from threading import Condition, Lock
+try:
+    from queue import Empty
+except ImportError:
+    # python 2.7
+    from Queue import Empty
+
+from collections import namedtuple
+
+# Define named tuple to represent msg and metadata in the
+# internal buffer. `framing` is the id of the `Protocol` used to
+# encode the payload (default JSON lines).
+Msg = namedtuple('Msg', ['payload', 'type', 'channel', 'framing'])
+Msg.__new__.__defaults__ = (0,)
+
+_MIN_ARENA_BYTES = 4096
+_MIN_SLOTS = 64
+
+
+class ArenaBuffer(object):
+    """Bounded FIFO of encoded messages stored in a contiguous arena.
+
+    Messages are kept as the bytes that will be written to the socket,
+    back to back in a single `bytearray`; an index of offsets and lengths
+    (`array` module) records where each one lives. Compared to a `Queue` of
+    `dict` this avoids the per-message object overhead, which dominates the
+    memory footprint of large buffers of small messages.
+
+    At most `maxsize` messages are stored: when the buffer is full the
+    oldest message is discarded to make room for the new one, so `put`
+    never blocks.
+
+    `get` hands out a `memoryview` on the arena (no copy): the region is
+    not reused until `task_done` is called, so the consumer can keep
+    retrying to send the same message. `join` waits for the buffer to be
+    drained.
+
+    Args:
+        maxsize (`int`):
+            the maximum number of buffered messages.
+    """
+
+    def __init__(self, maxsize):
+        self.maxsize = max(1, maxsize)
+        lock = Lock()
+        self._cond = Condition(lock)
+        # Signaled when every message has been released by the consumer
+        self._all_done = Condition(lock)
+        # Consumers blocked in `get` (skip the notify when there are none)
+        self._waiting = 0
+        self._arena = bytearray(_MIN_ARENA_BYTES)
+        # Live bytes are in self._arena[self._start:self._end]
+        self._start = 0
+        self._end = 0
+        # Circular index of the buffered messages
+        slots = min(self.maxsize, _MIN_SLOTS)
+        self._offsets = array('I', [0]) * slots
+        self._lengths = array('I', [0]) * slots
+        self._types = array('B', [0]) * slots
+        self._framings = array('B', [0]) * slots
+        self._first = 0
+        self._count = 0
+        # A memoryview returned by `get` is still in use
+        self._exported = False
+        self._closed = False
+        # A blocked `get` must return (see `wakeup`)
+        self._wakeup = False
+        # Number of messages discarded because the buffer was full
+        self.dropped = 0
+
+    def qsize(self):
+        with self._cond:
+            return self._count
+
+    def empty(self):
+        with self._cond:
+            return self._count == 0
+
+    def full(self):
+        with self._cond:
+            return self._count >= self.maxsize
+
+    @property
+    def nbytes(self):
+        """Bytes allocated for the arena and the index.
+        """
+        with self._cond:
+            return len(self._arena) + self._offsets.itemsize * len(self._offsets) + \
+                self._lengths.itemsize * len(self._lengths) + \
+                len(self._types) + len(self._framings)
+
+    def put(self, msg, block=True, timeout=None):
+        """Append a `Msg` whose payload is the encoded message.
+
+        The payload is a bytes-like object or a tuple of bytes-like parts,
+        joined while copied in the arena.
+
+        The `block` and `timeout` arguments are accepted for compatibility
+        with `Queue.put`: the call never blocks.
+        """
+        parts = msg.payload
+        if not isinstance(parts, tuple):
+            parts = (parts,)
+        n = 0
+        for part in parts:
+            n += len(part)
+        with self._cond:
+            if self._count >= self.maxsize:
+                self._pop_first()
+                self.dropped += 1
+            elif self._count == len(self._offsets):
+                self._grow_index()
+            if self._end + n > len(self._arena):
+                self._compact(n)
+            end = self._end
+            for part in parts:
+                start, end = end, end + len(part)
+                self._arena[start:end] = part
+            i = (self._first + self._count) % len(self._offsets)
+            self._offsets[i] = self._end
+            self._lengths[i] = n
+            self._types[i] = 1 if msg.type else 0
+            self._framings[i] = msg.framing
+            self._end = end
+            self._count += 1
+            if self._waiting:
+                self._cond.notify()
+
+    def get(self, block=True, timeout=None):
+        """Remove and return the oldest `Msg`.
+
+        The payload is a `memoryview` on the arena, valid until
+        `task_done` is called.
+
+        Returns `None` if the buffer has been closed.
+
+        Raises:
+            Empty:
+                no message available within the timeout (or `block` is False),
+                or `wakeup` was called.
+        """
+        with self._cond:
+            if self._wakeup:
+                self._wakeup = False
+                raise Empty
+            if block:
+                while not self._count and not self._closed and not self._wakeup:
+                    self._waiting += 1
+                    try:
+                        notified = self._cond.wait(timeout)
+                    finally:
+                        self._waiting -= 1
+                    if not notified and timeout is not None:
+                        break
+            if self._closed:
+                return None
+            if not self._count:
+                self._wakeup = False
+                raise Empty
+            i = self._first
+            off, n = self._offsets[i], self._lengths[i]
+            kind, framing = self._types[i], self._framings[i]
+            # Set before popping: the region must not be reused
+            self._exported = True
+            self._pop_first()
+            return Msg(memoryview(self._arena)[off:off + n], bool(kind), None,
+                       framing)
+
+    def task_done(self):
+        """Release the payload returned by the last `get`.
+        """
+        with self._cond:
+            self._exported = False
+            if not self._count:
+                self._all_done.notify_all()
+
+    def join(self, timeout=None):
+        """Wait until every message has been released with `task_done`.
+
+        Returns early if the buffer is closed.
+
+        Keyword Args:
+            timeout (`float`):
+                the maximum time to wait in seconds (None waits forever).
+
+        Returns:
+            `int`: the messages not released yet, including the one
+            handed out by `get` (0 if the buffer is drained).
+        """
+        deadline = None if timeout is None else time.time() + timeout
+        with self._all_done:
+            while (self._count or self._exported) and not self._closed:
+                if deadline is None:
+                    self._all_done.wait()
+                    continue
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    break
+                self._all_done.wait(remaining)
+            return self._count + (1 if self._exported else 0)
+
+    def resize(self, maxsize):
+        """Change the maximum number of buffered messages.
+
+        No message is discarded: after a shrink the messages over the new
+        limit are sent as usual, and each `put` on the full buffer drops
+        the oldest one as always.
+        """
+        with self._cond:
+            self.maxsize = max(1, maxsize)
+
+    def wakeup(self):
+        """Make the next (or the blocked) `get` raise `Empty`.
+        """
+        with self._cond:
+            self._wakeup = True
+            self._cond.notify()
+
+    def close(self):
+        """Wake the consumers: `get` returns `None` from now on.
+        """
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+            self._all_done.notify_all()
+
+    def _pop_first(self):
+        self._first = (self._first + 1) % len(self._offsets)
+        self._count -= 1
+        if self._count:
+            self._start = self._offsets[self._first]
+        else:
+            # Empty: restart from the beginning of the arena
+            self._first = 0
+            if not self._exported:
+                self._start = self._end = 0
+            else:
+                self._start = self._end
+
+    def _grow_index(self):
+        size = min(self.maxsize, 2 * len(self._offsets))
+        order = [(self._first + k) % len(self._offsets) for k in range(self._count)]
+        self._offsets = array('I', (self._offsets[i] for i in order)) + \
+            array('I', [0]) * (size - self._count)
+        self._lengths = array('I', (self._lengths[i] for i in order)) + \
+            array('I', [0]) * (size - self._count)
+        self._types = array('B', (self._types[i] for i in order)) + \
+            array('B', [0]) * (size - self._count)
+        self._framings = array('B', (self._framings[i] for i in order)) + \
+            array('B', [0]) * (size - self._count)
+        self._first = 0
+
+    def _compact(self, n):
+        """Move the live bytes at the beginning of an arena with room for `n`.
+        """
+        live = self._end - self._start
+        needed = live + n
+        size = len(self._arena)
+        if needed > size // 2 or size > 4 * needed:
+            # Keep the arena about twice the live data (grow or shrink)
+            size = max(_MIN_ARENA_BYTES, 2 * needed)
+        if self._exported or size != len(self._arena):
+            # A payload handed out by `get` may still be read from the old
+            # arena: never overwrite it, copy the live data in a new one
+            arena = bytearray(size)
+            arena[0:live] = self._arena[self._start:self._end]
+            self._arena = arena
+        else:
+            self._arena[0:live] = self._arena[self._start:self._end]
+        shift = self._start
+        size = len(self._offsets)
+        for k in range(self._count):
+            i = (self._first + k) % size
+            self._offsets[i] -= shift
+        self._start = 0
+        self._end = live
@@ -0,0 +1,159 @@
+# Copyright 2018 TomorrowData Srl
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import json
+import sys
+from threading import Lock
+
+from .buffer import Msg
+from .errors import MessageTooLarge
+from .fragments import count_fragments, fragments
+from .framing import JSON_LINES
+
+
+class Channel(object):
+    """Handle to send messages to a channel, returned by `IottlySDK.channel`.
+
+    The channel name is validated and JSON-escaped once: the envelope of
+    the messages is pre-encoded around the payload, so `send` only
+    serializes the message.
+
+    Attributes:
+        name (`str`):
+            the channel name (None for messages without a channel).
+    """
+
+    def __init__(self, sdk, name=None):
+        self.name = name
+        self._sdk = sdk
+        self._prefix = sdk._data_prefix
+        if name:
+            self._suffix = ', "channel": {}}}}}\n'.format(json.dumps(name)).encode()
+        else:
+            self._suffix = sdk._data_suffix
+        self._stats_lock = Lock()
+        self._msgs = 0
+        self._bytes = 0
+        # `SendPolicy` set by `IottlySDK.configure` (None: send everything)
+        self._policy = sdk._channel_policy(name)
+        # Messages longer are split in fragments or rejected
+        self._limit = sdk._max_message_bytes or sys.maxsize
+        self._envelope = len(self._prefix) + len(self._suffix)
+
+    def send(self, msg):
+        """Sends a message to the channel. See `IottlySDK.send`.
+
+        Raises:
+            TypeError:
+                `send` was invoked with a non `dict` argument.
+            ValueError:
+                `send` was invoked with a non JSON-serializable `dict`.
+        """
+        if not isinstance(msg, dict):
+            err = 'msg must be a dict but {} was given.'.format(type(msg))
+            raise TypeError(err)
+        self._send(msg)
+
+    def send_raw(self, payload, validate=False):
+        """Sends a message already serialized to JSON. See `IottlySDK.send_raw`.
+        """
+        self._sdk._check_raw(payload, validate)
+        self._send_raw(payload)
+
+    def stats(self):
+        """Messages and bytes (as encoded for the agent) sent to the channel.
+
+        Returns:
+            `dict`: with the `msgs` and `bytes` counters.
+        """
+        with self._stats_lock:
+            return {'msgs': self._msgs, 'bytes': self._bytes}
+
+    def _send(self, msg):
+        protocol = self._sdk._protocol
+        if protocol is JSON_LINES:
+            try:
+                data = json.dumps(msg).encode()
+            except TypeError:
+                raise ValueError('Given msg is not JSON-serializable.')
+            payload = (self._prefix, data, self._suffix)
+            n = len(self._prefix) + len(data) + len(self._suffix)
+        else:
+            try:
+                payload = self._sdk._msg_serialize(msg, self.name, protocol)
+            except TypeError:
+                raise ValueError('Given msg is not JSON-serializable.')
+            n = len(payload)
+        if n > self._limit:
+            if protocol is not JSON_LINES:
+                data = json.dumps(msg).encode()
+            self._send_oversized(data)
+            return
+        self._submit(Msg(payload=payload, type=False, channel=self.name,
+                         framing=protocol.id), n)
+
+    def _send_raw(self, payload):
+        # Pre-serialized payloads are always buffered as JSON lines
+        n = len(self._prefix) + len(payload) + len(self._suffix)
+        if n > self._limit:
+            self._send_oversized(payload)
+            return
+        self._submit(Msg(payload=(self._prefix, payload, self._suffix),
+                         type=False, channel=self.name), n)
+
+    def _send_oversized(self, data):
+        # Submit the JSON `data` of a message to split in fragments by `_emit`
+        n = self._envelope + len(data)
+        if self._sdk._oversized == 'reject':
+            raise MessageTooLarge('message of {} bytes exceeds max_message_bytes ({}).'.format(
+                n, self._limit))
+        count = count_fragments(len(data), self._limit, self._envelope)
+        if count > self._sdk._buffer.maxsize:
+            raise MessageTooLarge('message of {} bytes needs {} fragments, more than '
+                                  'max_buffered_msgs ({}).'.format(
+                                      n, count, self._sdk._buffer.maxsize))
+        self._submit(Msg(payload=(self._prefix, data, self._suffix),
+                         type=False, channel=self.name), n)
+
+    def _submit(self, msg, n):
+        # Buffer the message of `n` bytes, unless the policy drops or holds it
+        policy = self._policy
+        if policy is None:
+            self._emit(msg, n)
+        else:
+            policy.submit(msg, n, self._emit)
+
+    def _emit(self, msg, n):
+        if n > self._limit and isinstance(msg.payload, tuple):
+            self._emit_fragments(msg.payload[1])
+            return
+        self._sdk._enqueue(msg)
+        self._count(n)
+
+    def _emit_fragments(self, data):
+        # memoryview.tobytes: bytes(view) is the repr of the view on Python 2
+        data = memoryview(data).tobytes()
+        for payload in fragments(data, self._limit, self._envelope):
+            self._sdk._enqueue(Msg(payload=(self._prefix, payload, self._suffix),
+                                   type=False, channel=self.name))
+            self._count(self._envelope + len(payload))
+
+    def _encode(self, data):
+        # The JSON line of a message with the JSON-encoded `data` payload
+        return self._prefix + data + self._suffix
+
+    def _count(self, n):
+        with self._stats_lock:
+            self._msgs += 1
+            self._bytes += n
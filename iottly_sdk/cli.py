@@ -0,0 +1,170 @@
+# Copyright 2018 TomorrowData Srl
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""The `iottly-send` command: send JSON lines to iottly.
+
+Reads the message lines (see `iottly_sdk.bridge_client` for the format:
+a JSON object, optionally prefixed by its channel and a tab) from the
+standard input or from files, and sends them through the iottly agent::
+
+    sensor-dump | iottly-send --channel telemetry
+    iottly-send readings-1.jsonl readings-2.jsonl
+
+The input is streamed: memory is bounded by the SDK buffer. When the
+buffer is full the reading pauses until the agent drains it (`--drop`
+discards the oldest messages instead). Statistics are printed to the
+standard error on exit.
+"""
+
+import argparse
+import io
+import sys
+import threading
+import time
+
+from .iottly import IottlySDK
+from .bridge import forward_line
+
+# Lines sent between two checks of the buffer occupancy
+_CHECK_EVERY = 256
+
+
+class Stats(object):
+
+    def __init__(self):
+        self.lines = 0
+        self.accepted = 0
+        self.rejected = 0
+        self.dropped = 0
+        self.elapsed = 0.0
+
+    def __str__(self):
+        rate = self.accepted / self.elapsed if self.elapsed else 0.0
+        return ('{} lines, {} accepted, {} rejected, {} dropped '
+                'in {:.2f}s ({:.0f} msgs/s)').format(
+                    self.lines, self.accepted, self.rejected, self.dropped,
+                    self.elapsed, rate)
+
+
+def ingest(sdk, streams, channel=None, block=True, stats=None):
+    """Send the message lines read from binary `streams` through `sdk`.
+
+    Keyword Args:
+        channel (`str`):
+            the channel of the lines without their own.
+        block (`bool`):
+            wait for room in the SDK buffer instead of dropping messages.
+        stats (`Stats`):
+            updated with the counters.
+
+    Returns:
+        `Stats`: the counters.
+    """
+    stats = stats or Stats()
+    buffer = sdk._buffer
+    prefix = channel.encode('utf-8') + b'\t' if channel else b''
+    # Room for the lines sent until the next check (a small buffer is
+    # checked more often)
+    every = min(_CHECK_EVERY, max(1, buffer.maxsize // 2))
+    high = max(1, buffer.maxsize - every)
+    countdown = every
+    for stream in streams:
+        for line in stream:
+            line = line.rstrip(b'\r\n')
+            if not line:
+                continue
+            stats.lines += 1
+            if prefix and line.startswith(b'{'):
+                line = prefix + line
+            if forward_line(sdk, line):
+                stats.accepted += 1
+            else:
+                stats.rejected += 1
+            countdown -= 1
+            if not countdown:
+                countdown = every
+                while block and buffer.qsize() >= high:
+                    # Backpressure: let the sender thread drain the buffer
+                    buffer.join(0.5)
+    return stats
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog='iottly-send',
+        description='Send JSON lines to iottly through the iottly agent.')
+    parser.add_argument('files', nargs='*', default=['-'],
+                        help='files of JSON lines (default: - the standard input)')
+    parser.add_argument('--channel', default=None,
+                        help='the channel of the lines without their own')
+    parser.add_argument('--name', default='iottly-send',
+                        help='the application name (default: iottly-send)')
+    parser.add_argument('--socket-path', default=None,
+                        help='the socket of the iottly agent')
+    parser.add_argument('--transport', default=None,
+                        help='reach the iottly agent with another transport, '
+                             'eg. tcp:agent:8765 (see iottly_sdk.transport)')
+    parser.add_argument('--max-buffered-msgs', type=int, default=10000,
+                        help='the size of the buffer (default: 10000)')
+    parser.add_argument('--drop', action='store_true',
+                        help='drop the oldest messages instead of waiting '
+                        'when the buffer is full')
+    parser.add_argument('--timeout', type=float, default=10.0,
+                        help='seconds to wait for the agent at start-up and '
+                        'to drain the buffer on exit (default: 10)')
+    parser.add_argument('--quiet', action='store_true',
+                        help="don't print the statistics")
+    args = parser.parse_args(argv)
+
+    linked = threading.Event()
+
+    def on_status(status):
+        if status == 'started':
+            linked.set()
+
+    sdk_kwargs = {'max_buffered_msgs': args.max_buffered_msgs,
+                  'on_agent_status_changed': on_status}
+    if args.socket_path:
+        sdk_kwargs['socket_path'] = args.socket_path
+    if args.transport:
+        sdk_kwargs['transport'] = args.transport
+    sdk = IottlySDK(args.name, **sdk_kwargs)
+    sdk.start()
+    # Buffered messages would be sent anyway, but don't start while the
+    # agent is missing: a full buffer would block (or drop) at once
+    linked.wait(args.timeout)
+
+    stats = Stats()
+    t0 = time.time()
+    try:
+        for path in args.files:
+            if path == '-':
+                stream = getattr(sys.stdin, 'buffer', sys.stdin)
+                ingest(sdk, [stream], args.channel, not args.drop, stats)
+            else:
+                with io.open(path, 'rb') as stream:
+                    ingest(sdk, [stream], args.channel, not args.drop, stats)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        discarded = sdk.stop(drain=True, timeout=args.timeout)
+        stats.elapsed = time.time() - t0
+        stats.dropped = sdk._buffer.dropped + discarded
+        if not args.quiet:
+            sys.stderr.write('iottly-send: {}\n'.format(stats))
+    return 1 if stats.dropped or stats.rejected else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
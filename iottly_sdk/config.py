@@ -0,0 +1,242 @@
+# Copyright 2018 TomorrowData Srl
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Runtime configuration of the send rates, local or from the cloud.
+
+The configuration is a `dict` (all the keys are optional)::
+
+    {
+        "max_buffered_msgs": 500,
+        "channels": {
+            "telemetry": {"sampling": 0.1, "rate_limit": 2.0},
+            "status": {"aggregation": 30.0},
+            "*": {"rate_limit": 10.0}
+        },
+        "degraded": {
+            "telemetry": {"aggregation": 60.0},
+            "debug": {"paused": true}
+        },
+        "hysteresis": 30.0
+    }
+
+Every channel accepts:
+
+- `sampling`: the fraction of the messages sent, in (0, 1].
+- `rate_limit`: the maximum messages per second (the excess is dropped).
+- `aggregation`: a window in seconds; only the newest message of each
+  window is sent, at its end.
+- `paused`: drop every message.
+
+The settings of a channel replace its previous ones (`null` restores the
+defaults). `""` applies to the messages sent without a channel, and `"*"`
+to the messages of every channel without its own settings.
+
+The `degraded` settings replace the `channels` ones while the iottly
+agent reports its MQTT connection down (`connectionstatus` signal), so
+that neither the SDK nor the agent buffers fill with low-value data
+during an outage. The full rate is restored once the connection has been
+up for `hysteresis` seconds (default 10): a flapping link keeps the
+channels degraded.
+
+The same `dict` can be sent from the cloud as the reserved `sdkconfig`
+command, see `IottlySDK.configure`.
+"""
+
+import time
+from threading import Lock
+
+import six
+
+# The reserved command type of the remote configuration
+CONFIG_CMD = 'sdkconfig'
+
+# The channel settings applied to the channels without their own
+DEFAULT_CHANNEL = '*'
+
+# Seconds of connectivity before leaving the degraded mode
+DEFAULT_HYSTERESIS = 10.0
+
+_SETTINGS = ('sampling', 'rate_limit', 'aggregation', 'paused')
+
+
+def validate_config(config):
+    """Check a configuration `dict` and return a normalized copy.
+
+    Raises:
+        TypeError:
+            the configuration or one of its values has a wrong type.
+        ValueError:
+            a value is out of range or a key is unknown.
+    """
+    if not isinstance(config, dict):
+        raise TypeError('config must be a dict but {} was given.'.format(type(config)))
+    unknown = set(config) - set(['max_buffered_msgs', 'channels', 'degraded',
+                                 'hysteresis'])
+    if unknown:
+        raise ValueError('unknown config keys: {}'.format(', '.join(sorted(unknown))))
+    result = {}
+    if 'max_buffered_msgs' in config:
+        size = config['max_buffered_msgs']
+        if not isinstance(size, six.integer_types) or isinstance(size, bool):
+            raise TypeError('max_buffered_msgs must be an int.')
+        if size < 1:
+            raise ValueError('max_buffered_msgs must be positive.')
+        result['max_buffered_msgs'] = size
+    if 'hysteresis' in config:
+        hysteresis = config['hysteresis']
+        if not _is_number(hysteresis):
+            raise TypeError('hysteresis must be a number.')
+        if hysteresis < 0:
+            raise ValueError('hysteresis must not be negative.')
+        result['hysteresis'] = hysteresis
+    for key in ('channels', 'degraded'):
+        channels = config.get(key, {})
+        if not isinstance(channels, dict):
+            raise TypeError('{} must be a dict.'.format(key))
+        result[key] = {}
+        for name, settings in channels.items():
+            if not isinstance(name, six.string_types):
+                raise TypeError('channel names must be str.')
+            if settings is not None:
+                SendPolicy(**_check_settings(settings))
+            result[key][name] = settings and dict(settings)
+    return result
+
+
+def _is_number(value):
+    return not isinstance(value, bool) and \
+        isinstance(value, (float,) + six.integer_types)
+
+
+def _check_settings(settings):
+    if not isinstance(settings, dict):
+        raise TypeError('channel settings must be a dict.')
+    unknown = set(settings) - set(_SETTINGS)
+    if unknown:
+        raise ValueError('unknown channel settings: {}'.format(', '.join(sorted(unknown))))
+    for key, value in settings.items():
+        if key == 'paused':
+            if not isinstance(value, bool):
+                raise TypeError('paused must be a bool.')
+        elif value is not None and not _is_number(value):
+            raise TypeError('{} must be a number.'.format(key))
+    return settings
+
+
+class SendPolicy(object):
+    """Sampling, rate limit and aggregation of the messages of a channel.
+
+    Keyword Args:
+        paused (`bool`):
+            drop every message.
+        sampling (`float`):
+            the fraction of the messages sent, in (0, 1].
+        rate_limit (`float`):
+            the maximum messages per second (None: unlimited).
+        aggregation (`float`):
+            send only the newest message of every window of `aggregation`
+            seconds (None: send every message).
+        scheduler (`Scheduler`):
+            ends the aggregation windows (required with `aggregation`).
+    """
+
+    def __init__(self, sampling=None, rate_limit=None, aggregation=None,
+                 paused=False, scheduler=None):
+        if sampling is not None and not 0 < sampling <= 1:
+            raise ValueError('sampling must be in (0, 1].')
+        if rate_limit is not None and rate_limit <= 0:
+            raise ValueError('rate_limit must be positive.')
+        if aggregation is not None and aggregation <= 0:
+            raise ValueError('aggregation must be positive.')
+        self.sampling = sampling
+        self.rate_limit = rate_limit
+        self.aggregation = aggregation
+        self.paused = paused
+        self._scheduler = scheduler
+        self._lock = Lock()
+        # Sampling accumulator: the first message is sent
+        self._credit = 1.0 - (sampling or 1.0)
+        # Token bucket of the rate limit (burst of one second)
+        self._tokens = max(1.0, rate_limit or 0)
+        self._refill_ts = time.time()
+        # Aggregation: the newest message of the window and its timer
+        self._held = None
+        self._emit = None
+        self._timer = None
+        self._closed = False
+        # Messages discarded by the policy
+        self.dropped = 0
+
+    def settings(self):
+        return dict((k, getattr(self, k)) for k in _SETTINGS
+                    if getattr(self, k) not in (None, False))
+
+    def submit(self, msg, n, emit):
+        """Send (`emit(msg, n)`), hold or drop a message.
+        """
+        with self._lock:
+            if self.paused:
+                self.dropped += 1
+                return
+            if self.sampling is not None:
+                self._credit += self.sampling
+                if self._credit < 1.0 - 1e-9:
+                    self.dropped += 1
+                    return
+                self._credit -= 1.0
+            if self.aggregation is not None and not self._closed:
+                if self._held is not None:
+                    self.dropped += 1
+                self._held = (msg, n)
+                self._emit = emit
+                if self._timer is None:
+                    self._timer = self._scheduler.call_later(
+                        self.aggregation, self._end_window)
+                return
+            if not self._take_token():
+                self.dropped += 1
+                return
+        emit(msg, n)
+
+    def close(self, emit):
+        """Send the held message (if any) and stop aggregating.
+        """
+        with self._lock:
+            self._closed = True
+            held, self._held = self._held, None
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+        if held is not None:
+            emit(*held)
+
+    def _take_token(self):
+        if self.rate_limit is None:
+            return True
+        now = time.time()
+        self._tokens = min(max(1.0, self.rate_limit),
+                           self._tokens + (now - self._refill_ts) * self.rate_limit)
+        self._refill_ts = now
+        if self._tokens < 1.0:
+            return False
+        self._tokens -= 1.0
+        return True
+
+    def _end_window(self):
+        with self._lock:
+            held, self._held = self._held, None
+            self._timer = None
+            if held is None or self._closed or not self._take_token():
+                return
+        self._emit(*held)
@@ -26,3 +26,10 @@ class DisconnectedSDK(Exception):
     while the SDK is disconnected from the agent.
     """
     pass
+
+
+class MessageTooLarge(ValueError):
+    """Exception raised when sending a message whose encoding exceeds
+    the `max_message_bytes` of the SDK and can't be split in fragments.
+    """
+    pass
@@ -0,0 +1,353 @@
+# Copyright 2018 TomorrowData Srl
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Multi-process support: many producer processes, one agent connection.
+
+Worker processes (eg. forked by a pre-forking server or a
+`multiprocessing.Pool`) write messages in a `SharedRingBuffer` through a
+`SharedProducer`; a single `Forwarder` (running in a dedicated
+`ForwarderProcess` or in any process owning an `IottlySDK`) drains the ring
+into the SDK, which holds the only connection to the **iottly agent**.
+
+.. warning::
+    Requires Python `>= 3.8` (`multiprocessing.shared_memory`).
+"""
+
+import json
+import multiprocessing
+import struct
+import threading
+
+import six
+
+try:
+    from multiprocessing import shared_memory
+except ImportError:
+    # Python < 3.8
+    shared_memory = None
+
+from .iottly import IottlySDK
+
+# Ring header: head and tail (total bytes written/consumed) and the number
+# of records dropped to make room for new ones.
+_HEADER = struct.Struct('<QQQ')
+_HEADER_SIZE = 64  # keep the data region cache-line aligned
+_RECORD_LEN = struct.Struct('<I')
+_CHANNEL_LEN = struct.Struct('<H')
+
+
+class SharedRingBuffer(object):
+    """Multi-producer/single-consumer ring buffer of messages in shared memory.
+
+    Records are length-prefixed byte strings laid out back to back in a
+    `multiprocessing.shared_memory` segment. When the ring is full the
+    oldest records are discarded, consistently with the SDK internal buffer.
+    Access is serialized with a `multiprocessing.Condition`, which also wakes
+    the consumer when new records are available.
+
+    The ring must be created before forking the producers (or handed to
+    `multiprocessing.Process` arguments) so that they share the condition.
+
+    Keyword Args:
+        capacity (`int`):
+            the size in bytes of the data region.
+    """
+
+    def __init__(self, capacity=1 << 20):
+        if shared_memory is None:
+            raise RuntimeError('SharedRingBuffer requires Python >= 3.8')
+        self._capacity = capacity
+        self._shm = shared_memory.SharedMemory(create=True,
+                                               size=_HEADER_SIZE + capacity)
+        self._owner = True
+        self._cond = multiprocessing.Condition(multiprocessing.Lock())
+        _HEADER.pack_into(self._shm.buf, 0, 0, 0, 0)
+
+    def __getstate__(self):
+        return (self._shm.name, self._capacity, self._cond)
+
+    def __setstate__(self, state):
+        name, self._capacity, self._cond = state
+        self._shm = shared_memory.SharedMemory(name=name)
+        self._owner = False
+
+    @property
+    def dropped(self):
+        """Number of records discarded because the ring was full.
+        """
+        with self._cond:
+            return _HEADER.unpack_from(self._shm.buf, 0)[2]
+
+    @property
+    def pending_bytes(self):
+        """Number of bytes (records and prefixes) currently stored.
+        """
+        with self._cond:
+            head, tail, _ = _HEADER.unpack_from(self._shm.buf, 0)
+        return head - tail
+
+    def put(self, record):
+        """Append a record, dropping the oldest ones if there is no room.
+
+        Raises:
+            ValueError:
+                The record can't fit the ring at all.
+        """
+        size = _RECORD_LEN.size + len(record)
+        if size > self._capacity:
+            raise ValueError('record of {} bytes exceeds the ring capacity'.format(len(record)))
+        buf = self._shm.buf
+        with self._cond:
+            head, tail, dropped = _HEADER.unpack_from(buf, 0)
+            while self._capacity - (head - tail) < size:
+                length = _RECORD_LEN.unpack(self._read(tail, _RECORD_LEN.size))[0]
+                tail += _RECORD_LEN.size + length
+                dropped += 1
+            self._write(head, _RECORD_LEN.pack(len(record)))
+            self._write(head + _RECORD_LEN.size, record)
+            _HEADER.pack_into(buf, 0, head + size, tail, dropped)
+            self._cond.notify()
+
+    def get_many(self, max_records=256, timeout=None):
+        """Remove and return up to `max_records` records.
+
+        Blocks up to `timeout` seconds (forever if `None`) while the ring
+        is empty; returns an empty list on timeout.
+        """
+        buf = self._shm.buf
+        records = []
+        with self._cond:
+            head, tail, dropped = _HEADER.unpack_from(buf, 0)
+            if head == tail:
+                self._cond.wait(timeout)
+                head, tail, dropped = _HEADER.unpack_from(buf, 0)
+            while tail < head and len(records) < max_records:
+                length = _RECORD_LEN.unpack(self._read(tail, _RECORD_LEN.size))[0]
+                tail += _RECORD_LEN.size
+                records.append(self._read(tail, length))
+                tail += length
+            _HEADER.pack_into(buf, 0, head, tail, dropped)
+        return records
+
+    def wakeup(self):
+        """Wake up a consumer blocked in `get_many`.
+        """
+        with self._cond:
+            self._cond.notify_all()
+
+    def close(self):
+        """Detach from the shared memory (and release it if owned).
+        """
+        self._shm.close()
+        if self._owner:
+            self._shm.unlink()
+
+    def _read(self, pos, n):
+        start = _HEADER_SIZE + pos % self._capacity
+        end = start + n
+        limit = _HEADER_SIZE + self._capacity
+        if end <= limit:
+            return bytes(self._shm.buf[start:end])
+        first = limit - start
+        return bytes(self._shm.buf[start:limit]) + \
+            bytes(self._shm.buf[_HEADER_SIZE:_HEADER_SIZE + n - first])
+
+    def _write(self, pos, data):
+        start = _HEADER_SIZE + pos % self._capacity
+        end = start + len(data)
+        limit = _HEADER_SIZE + self._capacity
+        if end <= limit:
+            self._shm.buf[start:end] = data
+        else:
+            first = limit - start
+            self._shm.buf[start:limit] = data[:first]
+            self._shm.buf[_HEADER_SIZE:_HEADER_SIZE + len(data) - first] = data[first:]
+
+
+def _encode_record(payload, channel):
+    chan = channel.encode('utf-8') if channel else b''
+    return _CHANNEL_LEN.pack(len(chan)) + chan + payload
+
+
+def _decode_record(record):
+    n = _CHANNEL_LEN.unpack_from(record, 0)[0]
+    start = _CHANNEL_LEN.size
+    channel = record[start:start + n].decode('utf-8') if n else None
+    return record[start + n:], channel
+
+
+class SharedProducer(object):
+    """Process-local handle to send messages through a `SharedRingBuffer`.
+
+    It exposes the same `send` of `IottlySDK` without threads, locks or
+    sockets of its own, so it can be used freely in forked workers.
+
+    Args:
+        ring (`SharedRingBuffer`):
+            the ring drained by a `Forwarder`.
+    """
+
+    def __init__(self, ring):
+        self._ring = ring
+
+    def send(self, msg, channel=None):
+        """Sends a message to iottly through the forwarder process.
+
+        The message is JSON-encoded in the calling process, so the forwarder
+        only has to frame it.
+
+        Args:
+            msg (`dict`):
+                The data to be sent. The `dict` should be JSON-serializable.
+            channel (`str`):
+                The channel to which the message will be forwarded.
+                Default to None
+
+        Raises:
+            TypeError:
+                `send` was invoked with a non `dict` argument.
+            ValueError:
+                `send` was invoked with a non JSON-serializable `dict`
+                or the message doesn't fit the ring.
+        """
+        if not isinstance(msg, dict):
+            err = 'msg must be a dict but {} was given.'.format(type(msg))
+            raise TypeError(err)
+
+        if channel and not isinstance(channel, six.string_types):
+            err = 'channel must be a str but {} was given.'.format(type(channel))
+            raise TypeError(err)
+
+        try:
+            payload = json.dumps(msg).encode('utf-8')
+        except TypeError:
+            raise ValueError('Given msg is not JSON-serializable.')
+
+        self._ring.put(_encode_record(payload, channel))
+
+
+class Forwarder(object):
+    """Drain a `SharedRingBuffer` into an `IottlySDK`.
+
+    Records are moved into the SDK internal buffer by a single thread, so
+    the buffering policy of the SDK (`max_buffered_msgs`) still applies.
+    They are sent through the channel handles: the settings of the
+    channels (see `IottlySDK.configure`) and `max_message_bytes` apply too.
+
+    Args:
+        sdk (`IottlySDK`):
+            the SDK holding the connection to the **iottly agent**.
+        ring (`SharedRingBuffer`):
+            the ring written by the producers.
+
+    Attributes:
+        forwarded (`int`):
+            the records moved into the SDK.
+        rejected (`int`):
+            the records exceeding `max_message_bytes` (with
+            `oversized='reject'`).
+    """
+
+    def __init__(self, sdk, ring, batch=256):
+        self._sdk = sdk
+        self._ring = ring
+        self._batch = batch
+        self._stopped = threading.Event()
+        self._thread = None
+        self.forwarded = 0
+        self.rejected = 0
+
+    def start(self):
+        self._thread = threading.Thread(target=self._forward, name='forwarder_t')
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self, timeout=2.0):
+        """Stop forwarding after the records already in the ring are moved.
+        """
+        self._stopped.set()
+        self._ring.wakeup()
+        self._thread.join(timeout)
+
+    def _forward(self):
+        handle = self._sdk._channel_handle
+        while True:
+            stopping = self._stopped.is_set()
+            records = self._ring.get_many(self._batch, timeout=0.5)
+            for record in records:
+                payload, channel = _decode_record(record)
+                try:
+                    handle(channel)._send_raw(payload)
+                except ValueError:
+                    self.rejected += 1
+                else:
+                    self.forwarded += 1
+            if stopping and not records:
+                break
+
+
+def _forwarder_main(ring, name, sdk_kwargs, setup, drain_timeout, started, stopped):
+    sdk = IottlySDK(name, **sdk_kwargs)
+    if setup:
+        setup(sdk)
+    sdk.start()
+    forwarder = Forwarder(sdk, ring)
+    forwarder.start()
+    started.set()
+    stopped.wait()
+    forwarder.stop()
+    # Write the records just moved into the SDK buffer
+    sdk.stop(drain=True, timeout=drain_timeout)
+
+
+class ForwarderProcess(object):
+    """Dedicated process owning the `IottlySDK` fed by a `SharedRingBuffer`.
+
+    Args:
+        ring (`SharedRingBuffer`):
+            the ring written by the producers.
+        name (`str`):
+            an identifier for the connected application.
+
+    Keyword Args:
+        setup (func, optional):
+            invoked with the `IottlySDK` in the forwarder process before it
+            is started (eg. to `subscribe` command callbacks).
+        drain_timeout (`float`):
+            the maximum time in seconds spent on `stop` writing the
+            buffered records to the agent.
+        **sdk_kwargs:
+            forwarded to the `IottlySDK` constructor.
+    """
+
+    def __init__(self, ring, name, setup=None, drain_timeout=5.0, **sdk_kwargs):
+        self._started = multiprocessing.Event()
+        self._stopped = multiprocessing.Event()
+        self._proc = multiprocessing.Process(
+            target=_forwarder_main,
+            args=(ring, name, sdk_kwargs, setup, drain_timeout, self._started,
+                  self._stopped),
+            name='iottly-forwarder')
+        self._proc.daemon = True
+
+    def start(self, timeout=5.0):
+        self._proc.start()
+        if not self._started.wait(timeout):
+            raise RuntimeError('the forwarder process did not start')
+
+    def stop(self, timeout=10.0):
+        self._stopped.set()
+        self._proc.join(timeout)
+        if self._proc.is_alive():
+            self._proc.terminate()
@@ -0,0 +1,162 @@
+# Copyright 2018 TomorrowData Srl
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Fragments of the messages exceeding `max_message_bytes`.
+
+With `IottlySDK(max_message_bytes=...)` a message whose encoding exceeds
+the limit is split in fragment messages, sent on the same channel::
+
+    {"fragment": {"id": "5b1f...", "index": 0, "count": 3, "data": "<base64>"}}
+
+`data` is a slice of the JSON encoding of the original message. The
+fragments are buffered and forwarded as separate messages: consumers put
+them back together with a `Reassembler`::
+
+    reassembler = Reassembler()
+
+    def on_message(payload):
+        msg = reassembler.feed(payload)
+        if msg is not None:
+            handle(msg)
+
+With `oversized='reject'` the SDK raises `MessageTooLarge` instead.
+"""
+
+import base64
+import json
+import time
+import uuid
+
+from threading import Lock
+
+FRAGMENT = 'fragment'
+# The smallest limit leaving room for the fragments data
+MIN_MESSAGE_BYTES = 256
+
+_HEAD = b'{"fragment": {"id": "%s", "index": %d, "count": %d, "data": "'
+_TAIL = b'"}}'
+# Room for the sequence number spliced in reliable mode
+_SEQ_BYTES = 32
+
+
+def _fragment_size(limit, envelope, count):
+    # The bytes of the original message that fit a fragment of `limit`
+    head = len(_HEAD % (b'0' * 32, count, count))
+    room = limit - envelope - head - len(_TAIL) - _SEQ_BYTES
+    if room < 4:
+        raise ValueError('max_message_bytes ({}) leaves no room for the '
+                         'fragments of the channel.'.format(limit))
+    return room // 4 * 3
+
+
+def count_fragments(n, limit, envelope):
+    """The number of fragments of a message of `n` bytes.
+
+    Args:
+        n (`int`):
+            the bytes of the JSON encoding of the message.
+        limit (`int`):
+            the maximum size of an encoded message.
+        envelope (`int`):
+            the bytes around the payload of every message.
+
+    Raises:
+        ValueError:
+            `limit` is too small for the `envelope`.
+    """
+    size = _fragment_size(limit, envelope, n)
+    return -(-n // size)
+
+
+def fragments(data, limit, envelope):
+    """Split the JSON encoding `data` of a message in fragment payloads.
+
+    Returns:
+        `list`: the JSON-encoded payloads of the fragments, each one
+        fitting `limit` bytes within an `envelope` of bytes.
+    """
+    size = _fragment_size(limit, envelope, len(data))
+    count = -(-len(data) // size)
+    frag_id = uuid.uuid4().hex.encode()
+    return [b''.join((_HEAD % (frag_id, i, count),
+                      base64.b64encode(data[i * size:(i + 1) * size]), _TAIL))
+            for i in range(count)]
+
+
+class Reassembler(object):
+    """Put back together the messages split in fragments.
+
+    Keyword Args:
+        max_age (`float`):
+            incomplete messages older than `max_age` seconds are discarded
+            (a fragment was lost). Default to 60.
+        max_pending (`int`):
+            the maximum number of incomplete messages, the oldest are
+            discarded. Default to 100.
+
+    Attributes:
+        discarded (`int`):
+            the incomplete messages discarded.
+    """
+
+    def __init__(self, max_age=60.0, max_pending=100):
+        self.max_age = max_age
+        self.max_pending = max_pending
+        self.discarded = 0
+        # id -> [first arrival, count, {index: data}]
+        self._pending = {}
+        self._lock = Lock()
+
+    def feed(self, payload):
+        """Add a received payload.
+
+        Args:
+            payload (`dict`):
+                the payload of a message, a fragment or not.
+
+        Returns:
+            `dict`: the payload itself if it's not a fragment, the
+            original message if it's the last missing fragment, None
+            otherwise.
+
+        Raises:
+            ValueError:
+                the reassembled message is not valid JSON.
+        """
+        fragment = payload.get(FRAGMENT) if len(payload) == 1 else None
+        if not isinstance(fragment, dict):
+            return payload
+        now = time.time()
+        with self._lock:
+            self._expire(now)
+            entry = self._pending.get(fragment['id'])
+            if entry is None:
+                entry = self._pending[fragment['id']] = [now, fragment['count'], {}]
+            entry[2][fragment['index']] = fragment['data']
+            if len(entry[2]) < entry[1]:
+                return None
+            del self._pending[fragment['id']]
+        data = b''.join(base64.b64decode(entry[2][i]) for i in range(entry[1]))
+        return json.loads(data.decode('utf-8'))
+
+    def _expire(self, now):
+        deadline = now - self.max_age
+        for frag_id, entry in list(self._pending.items()):
+            if entry[0] < deadline:
+                del self._pending[frag_id]
+                self.discarded += 1
+        if len(self._pending) >= self.max_pending:
+            oldest = min(self._pending, key=lambda k: self._pending[k][0])
+            del self._pending[oldest]
+            self.discarded += 1
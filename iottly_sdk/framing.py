@@ -0,0 +1,238 @@
+# Copyright 2018 TomorrowData Srl
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Framing and encoding of the messages exchanged with the iottly agent.
+
+A `Protocol` couples a framer (how messages are delimited on the stream)
+with a codec (how a message is turned into bytes):
+
+- `JSON_LINES`: newline-delimited JSON, understood by every agent.
+- `msgpack` and `cbor`: a 4-byte big-endian length prefix followed by a
+  msgpack/CBOR body. Available when the `msgpack`/`cbor2` packages are
+  installed and negotiated with the agent during the handshake.
+"""
+
+import json
+import struct
+from collections import namedtuple
+
+import six
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+try:
+    import cbor2
+except ImportError:
+    cbor2 = None
+
+# Upper bound of a length-prefixed frame from the agent
+MAX_FRAME_BYTES = 16 * 1024 * 1024
+
+_LENGTH = struct.Struct('>I')
+
+
+def _bytes(data):
+    # bytes(view) is the repr of the view on Python 2
+    if isinstance(data, six.binary_type):
+        return data
+    return memoryview(data).tobytes()
+
+
+class FramingError(ValueError):
+    """The stream from the agent can't be decoded with the current framing.
+    """
+
+
+class JSONCodec(object):
+    name = 'json'
+
+    def dumps(self, obj):
+        return json.dumps(obj).encode()
+
+    def loads(self, data):
+        if not isinstance(data, six.text_type):
+            data = _bytes(data).decode('utf-8')
+        return json.loads(data)
+
+
+class MsgpackCodec(object):
+    name = 'msgpack'
+
+    def dumps(self, obj):
+        return msgpack.packb(obj, use_bin_type=True)
+
+    def loads(self, data):
+        return msgpack.unpackb(_bytes(data), raw=False)
+
+
+class CBORCodec(object):
+    name = 'cbor'
+
+    def dumps(self, obj):
+        return cbor2.dumps(obj)
+
+    def loads(self, data):
+        return cbor2.loads(_bytes(data))
+
+
+class LineDecoder(object):
+    """Split a byte stream in newline-terminated frames.
+    """
+
+    def __init__(self, pending=b''):
+        self._buf = bytearray(pending)
+        # The pending bytes already searched for a newline
+        self._scanned = 0
+
+    def feed(self, data):
+        """Add received bytes and return the list of complete frame bodies.
+        """
+        buf = self._buf
+        buf += data
+        frames = []
+        # Long lines are received in many reads: don't search them again
+        end = buf.find(b'\n', self._scanned)
+        start = 0
+        while end >= 0:
+            frames.append(bytes(buf[start:end]))
+            start = end + 1
+            end = buf.find(b'\n', start)
+        if start:
+            del buf[:start]
+        self._scanned = len(buf)
+        return frames
+
+    def pending(self):
+        """Bytes received after the last complete frame.
+        """
+        return bytes(self._buf)
+
+
+class LengthPrefixDecoder(object):
+    """Split a byte stream in length-prefixed frames.
+    """
+
+    def __init__(self, pending=b''):
+        self._buf = bytearray(pending)
+
+    def feed(self, data):
+        """Add received bytes and return the list of complete frame bodies.
+
+        Raises:
+            FramingError:
+                a frame exceeds `MAX_FRAME_BYTES`.
+        """
+        buf = self._buf
+        buf += data
+        frames = []
+        start = 0
+        while len(buf) - start >= _LENGTH.size:
+            n, = _LENGTH.unpack_from(buf, start)
+            if n > MAX_FRAME_BYTES:
+                raise FramingError('frame of {} bytes exceeds the limit'.format(n))
+            end = start + _LENGTH.size + n
+            if end > len(buf):
+                break
+            frames.append(bytes(buf[start + _LENGTH.size:end]))
+            start = end
+        if start:
+            del buf[:start]
+        return frames
+
+    def pending(self):
+        return bytes(self._buf)
+
+
+class LineFramer(object):
+    decoder = LineDecoder
+
+    @staticmethod
+    def frame(body):
+        return body + b'\n'
+
+    @staticmethod
+    def unframe(frame):
+        return frame[:-1]
+
+
+class LengthPrefixFramer(object):
+    decoder = LengthPrefixDecoder
+
+    @staticmethod
+    def frame(body):
+        return _LENGTH.pack(len(body)) + body
+
+    @staticmethod
+    def unframe(frame):
+        return frame[_LENGTH.size:]
+
+
+class Protocol(namedtuple('Protocol', ['id', 'name', 'framer', 'codec'])):
+    """A framer and a codec, identified by a small integer `id`.
+    """
+
+    def encode(self, obj):
+        """Encode and frame a message.
+        """
+        return self.framer.frame(self.codec.dumps(obj))
+
+    def decode(self, body):
+        """Decode a frame body returned by a decoder.
+        """
+        return self.codec.loads(body)
+
+    def decoder(self, pending=b''):
+        return self.framer.decoder(pending)
+
+
+JSON_LINES = Protocol(0, 'json', LineFramer, JSONCodec())
+
+# Every known protocol, indexed by id
+PROTOCOLS = [
+    JSON_LINES,
+    Protocol(1, 'msgpack', LengthPrefixFramer, MsgpackCodec()),
+    Protocol(2, 'cbor', LengthPrefixFramer, CBORCodec()),
+]
+
+_INSTALLED = {
+    'json': True,
+    'msgpack': msgpack is not None,
+    'cbor': cbor2 is not None,
+}
+
+
+def available_framings():
+    """Names of the binary framings usable in this interpreter (by preference).
+    """
+    return [p.name for p in PROTOCOLS[1:] if _INSTALLED[p.name]]
+
+
+def get_protocol(name):
+    """Return the `Protocol` named `name` or None if it is unavailable.
+    """
+    for p in PROTOCOLS:
+        if p.name == name and _INSTALLED[p.name]:
+            return p
+    return None
+
+
+def transcode(frame, src, dst):
+    """Re-encode a framed message from the `src` to the `dst` protocol.
+    """
+    if src is dst:
+        return frame
+    return dst.encode(src.decode(src.framer.unframe(frame)))
@@ -15,16 +15,13 @@
 import six
 
 import os, errno
+import re
+import select
 import socket
 import time
-from collections import namedtuple
+import weakref
 from functools import wraps
-from threading import Thread, Condition, Event, Lock, Timer
-try:
-    from queue import Queue, Full
-except:
-    #python 2.7
-    from Queue import Queue, Full
+from threading import Thread, Condition, Event, Lock, RLock
 
 import json
 
@@ -32,10 +29,41 @@ import json
 from .version import __version__
 from .utils import min_agent_version
 from .errors import DisconnectedSDK
-
-# Define named tuple to represent msg and metadata in the
-# internal buffer
-Msg = namedtuple('Msg', ['payload', 'type', 'channel'])
+from .fragments import MIN_MESSAGE_BYTES
+from .buffer import ArenaBuffer, Empty, Msg
+from .schema import SchemaSender
+from .channel import Channel
+from .framing import JSON_LINES, PROTOCOLS, FramingError, get_protocol, transcode
+from .reliable import AckWindow, sequence
+from .reporting import ErrorReporter
+from .scheduler import Scheduler
+from .transfer import DEFAULT_CHUNK_SIZE, DEFAULT_MAX_DOWNLOAD_BYTES, DEFAULT_MAX_DOWNLOADS, \
+    FILE_CMD, FileReceiver, FileTransfer
+from .transport import get_transport
+from .config import CONFIG_CMD, DEFAULT_CHANNEL, DEFAULT_HYSTERESIS, SendPolicy, \
+    validate_config
+
+_NEWLINE = re.compile(b'\n')
+_JSON_WS = b' \t\r\n'
+# Non-blocking reads of the commands already received (see `_read_frames`)
+# and writes with a deadline (see `_write`)
+_MSG_DONTWAIT = getattr(socket, 'MSG_DONTWAIT', None)
+_MAX_DRAIN_BYTES = 1024 * 1024
+# Handles kept for the channel names passed to `send` (see `_channel_handle`)
+_MAX_IMPLICIT_CHANNELS = 1024
+
+# Live SDK instances, reset in the child after a `fork`
+_instances = weakref.WeakSet()
+
+
+def _reset_instances_after_fork():
+    for sdk in list(_instances):
+        sdk._reset_after_fork()
+
+
+if hasattr(os, 'register_at_fork'):
+    # Python >= 3.7
+    os.register_at_fork(after_in_child=_reset_instances_after_fork)
 
 
 class IottlySDK:
@@ -86,66 +114,200 @@ class IottlySDK:
         on_connection_status_changed (func, optional):
             callback to receive notification on the
             iottly agent connection status.
+
+        framings (`list`, optional):
+            the binary framings (`'msgpack'`, `'cbor'`) offered to the
+            iottly agent, by preference. Framings whose codec is not
+            installed are ignored (see `iottly_sdk.framing.available_framings`).
+            Default to None: JSON lines only.
+
+        ack_window (`int`, optional):
+            enable the reliable mode (see `iottly_sdk.reliable`) with up to
+            `ack_window` data messages waiting for the acknowledge of the
+            iottly agent. Agents that don't acknowledge the messages are
+            served as usual. Default to None: the messages are released as
+            soon as they are written to the socket.
+
+        download_dir (`str`, optional):
+            the directory of the files being received as chunked commands
+            (see `iottly_sdk.transfer`). Default to None: the system
+            temporary directory.
+
+        max_download_bytes (`int`):
+            the size of the largest file received as chunked commands,
+            larger files are rejected. Default to 1 GiB.
+
+        max_downloads (`int`):
+            the files received at the same time, the chunks of further
+            files are rejected until one is complete. Default to 4.
+
+        max_message_bytes (`int`, optional):
+            the maximum size of an encoded message, as accepted by the
+            iottly agent and the MQTT broker (at least 256). Default to
+            None: no limit.
+
+        oversized (`str`):
+            what to do with the messages exceeding `max_message_bytes`:
+            `'fragment'` splits them in fragment messages (see
+            `iottly_sdk.fragments`), `'reject'` raises `MessageTooLarge`
+            from `send`. Default to `'fragment'`.
+
+        transport (`Transport` or `str`, optional):
+            how to reach the iottly agent instead of the unix socket
+            `socket_path`, eg. `'tcp:agent:8765'` (see
+            `iottly_sdk.transport`).
+
+        heartbeat (`float`, optional):
+            ping the iottly agent every `heartbeat` seconds, if it
+            supports it (see `link_stats`). Default to None: no pings,
+            a hung agent is noticed only when the connection breaks.
+
+        heartbeat_misses (`int`):
+            the consecutive unanswered pings after which the link is
+            declared dead and the SDK reconnects, unless the agent is
+            still reading the messages written meanwhile. Default to 3.
+
+        write_timeout (`float`, optional):
+            the seconds allowed to write a message to the socket. An
+            agent that stops reading makes the write time out: the SDK
+            reconnects and writes the message again on the new link.
+            Default to 30. None: writes wait indefinitely.
+
+        send_buffer_bytes (`int`, optional):
+            the size of the kernel send buffer of the socket
+            (`SO_SNDBUF`). Default to None: the system default.
     """
 
     def __init__(self, name,
                  socket_path='/var/run/iottly.com-agent/sdk/iottly_sdk_socket',
                  max_buffered_msgs=10,
                  on_agent_status_changed=None,
-                 on_connection_status_changed=None):
+                 on_connection_status_changed=None,
+                 framings=None,
+                 ack_window=None,
+                 download_dir=None,
+                 max_download_bytes=DEFAULT_MAX_DOWNLOAD_BYTES,
+                 max_downloads=DEFAULT_MAX_DOWNLOADS,
+                 max_message_bytes=None,
+                 oversized='fragment',
+                 transport=None,
+                 heartbeat=None,
+                 heartbeat_misses=3,
+                 write_timeout=30.0,
+                 send_buffer_bytes=None):
         """Init IottlySDK
         """
+        if max_message_bytes is not None:
+            if not isinstance(max_message_bytes, six.integer_types) or \
+                    isinstance(max_message_bytes, bool):
+                err = 'max_message_bytes must be an int but {} was given.'.format(
+                    type(max_message_bytes))
+                raise TypeError(err)
+            if max_message_bytes < MIN_MESSAGE_BYTES:
+                raise ValueError('max_message_bytes must be at least {}.'.format(
+                    MIN_MESSAGE_BYTES))
+        for arg, value in (('max_download_bytes', max_download_bytes),
+                           ('max_downloads', max_downloads)):
+            if not isinstance(value, six.integer_types) or isinstance(value, bool):
+                raise TypeError('{} must be an int but {} was given.'.format(arg, type(value)))
+            if value < 1:
+                raise ValueError('{} must be positive.'.format(arg))
+        if oversized not in ('fragment', 'reject'):
+            raise ValueError("oversized must be 'fragment' or 'reject'.")
+        if heartbeat is not None and not heartbeat > 0:
+            raise ValueError('heartbeat must be a positive number of seconds.')
+        if heartbeat_misses < 1:
+            raise ValueError('heartbeat_misses must be at least 1.')
+        if write_timeout is not None and not write_timeout > 0:
+            raise ValueError('write_timeout must be a positive number of seconds.')
+        if send_buffer_bytes is not None:
+            if not isinstance(send_buffer_bytes, six.integer_types) or \
+                    isinstance(send_buffer_bytes, bool):
+                err = 'send_buffer_bytes must be an int but {} was given.'.format(
+                    type(send_buffer_bytes))
+                raise TypeError(err)
+            if send_buffer_bytes <= 0:
+                raise ValueError('send_buffer_bytes must be positive.')
         self._name = str(name)
         self._socket_path = socket_path
+        self._transport = get_transport(transport if transport is not None else socket_path)
         self._max_buffered_msgs = max_buffered_msgs
+        self._framings = [f for f in framings or () if get_protocol(f) is not None]
+        self._ack_window = ack_window
+        self._max_message_bytes = max_message_bytes or self._transport.max_message_bytes
+        self._oversized = oversized
+        self._heartbeat = heartbeat
+        self._heartbeat_misses = heartbeat_misses
+        self._write_timeout = write_timeout
+        self._send_buffer_bytes = send_buffer_bytes
         self._on_agent_status_changed_cb = self._wrapped_cb_execution(on_agent_status_changed)
         self._on_connection_status_changed_cb = self._wrapped_cb_execution(on_connection_status_changed)
 
-        # Threads references
-        self._consumer_t = None
-        self._drainer_t = None
-        self._connection_t = None
-
-        # The queue holding the window buffer for incoming messages
-        # up to self._max_buffered_msgs messages
-        self._buffer = Queue(maxsize=self._max_buffered_msgs)
-        self._buffer_full = Condition()
-
-        # Conditions and state mgmt
-        self._socket_state_lock = Lock()
-        self._connected_to_agent = Condition(self._socket_state_lock)
-        self._disconnected_from_agent = Event()
-        # Indicate if there is a link to the iottly agent
-        self._agent_linked = False
-        # The unix socket to communicate with the iottly agent
-        self._socket = None
-        # Lock to serialize writes to the socket
-        self._socket_write_lock = Lock()
-        # The version of the attacched iottly agent
-        # iottly agent <= 1.8.0 doesn't provide a version.
-        self._agent_version_state_lock = Lock()
-        self._agent_version = None
-        self._handshake_ended = Event()
-        self._handshake_timeout_timer = None
+        self._init_runtime_state()
 
         # Pre-computed messages (JSON strings)
         # NOTE literal curly braces are double-up to use format spec-language
+        options = ''
+        if self._framings:
+            # Offer the binary framings, the agent picks one in sdkinit
+            options += ', "framings": {}'.format(json.dumps(self._framings))
+        if self._ack_window:
+            # Ask for acknowledges, the agent confirms in sdkinit
+            options += ', "acks": {}'.format(int(self._ack_window))
+        if self._heartbeat:
+            # Offer the heartbeat, the agent confirms in sdkinit
+            options += ', "heartbeat": {}'.format(float(self._heartbeat))
         self._app_start_msg = \
-            '{{"signal": {{"sdkclient": {{"name": "{}", "status": "connected", "version": "{}"}}}}}}\n'.format(self._name, __version__).encode()
-        # NOTE Since the data msg template will be later proessed with format
+            '{{"signal": {{"sdkclient": {{"name": "{}", "status": "connected", "version": "{}"{}}}}}}}\n'.format(self._name, __version__, options).encode()
+        self._framing_msg = '{{{{"signal": {{{{"sdkclient": {{{{"name": "{}", "framing": "{}"}}}}}}}}}}}}\n'.format(self._name, '{}')
+        # Envelope of the data messages, the payload is spliced in the middle
+        # (the channel is added by the `Channel` handles)
+        self._data_prefix = '{{"data": {{"sdkclient": {{"name": "{}"}}, "payload": '.format(self._name).encode()
+        self._data_suffix = b'}}\n'
+        # NOTE Since the signal msg template will be later proessed with format
         # the curly brace are quadruplicated {{{{ -> {{ -> {
-        self._data_msg = '{{{{"data": {{{{"sdkclient": {{{{"name": "{}"}}}}, "payload": {}}}}}}}}}\n'.format(self._name, '{}')
-        self._data_chan_msg = '{{{{"data": {{{{"sdkclient": {{{{"name": "{}"}}}}, "payload": {}, "channel": "{}"}}}}}}}}\n'.format(self._name, '{}', '{}')
         self._err_msg = '{{{{"signal": {{{{"sdkclient": {{{{"name": "{}", "error": {}}}}}}}}}}}}}\n'.format(self._name, '{}')
         self._call_agent_msg = '{{{{"signal": {{{{"sdkclient": {{{{"name": "{}", "call": {}}}}}}}}}}}}}\n'.format(self._name, '{}')
+        self._ping_msg = '{{{{"signal": {{{{"sdkclient": {{{{"name": "{}", "ping": {}}}}}}}}}}}}}\n'.format(self._name, '{}')
+        self._file_msg = '{{{{"signal": {{{{"sdkclient": {{{{"name": "{}", "file": {}}}}}}}}}}}}}\n'.format(self._name, '{}')
 
         # Lookup-table (cmd_type -> callback)
         # Store the callback function for a particular message type
         self._cmd_callbacks = {}
+        # Command types whose pending commands are collapsed in the newest
+        self._coalesced = set()
 
-        self._sdk_stopped = Event()
+        # Registered fixed-shape messages (name -> SchemaSender)
+        self._schemas = {}
+
+        # Runtime configuration of the send rates, see `configure`
+        self._channel_settings = {}
+        # Settings while the MQTT connection of the agent is down
+        self._degraded_settings = {}
+        self._hysteresis = DEFAULT_HYSTERESIS
+        self._degraded = False
+
+        # Channel handles (name -> Channel) returned by `channel`, and of
+        # the most recent names passed to `send` (see `_channel_handle`)
+        self._channels = {}
+        self._implicit_channels = {}
+        self._no_channel = Channel(self)
 
-    def subscribe(self, cmd_type, callback):
+        # Attached `TimeSeriesBatcher`s, flushed on stop
+        self._batchers = []
+
+        # Timers of the periodic producers not cancelled, see `every`
+        self._periodic = set()
+
+        # Files being received as chunked commands
+        self._download_dir = download_dir
+        self._download_limits = (max_download_bytes, max_downloads)
+        self._files = FileReceiver(self, download_dir, *self._download_limits)
+
+        # Reset the runtime state in processes forked from this one
+        _instances.add(self)
+
+    def subscribe(self, cmd_type, callback, coalesce=False):
         """Subscribe to specific command received from the iottly-agent.
 
         After subscribing a callback for a command type, the iottly SDK is
@@ -157,15 +319,29 @@ class IottlySDK:
 
         .. note:: If you call `subscribe` with a `cmd_type` already registered the callback is overwritten.
 
+        With `coalesce`, when several commands of `cmd_type` are pending
+        dispatch (eg. a burst delivered after a reconnection) only the
+        newest one is executed: the `callback` is invoked with the
+        additional keyword argument `superseded`, the number of discarded
+        older commands.
+
         Args:
             `cmd_type` (`str`):
                 The string denoting a particular type of command.
             `callback` (func or callable):
                 The callback invoked when a message of type `cmd_type` is received from the **iottly agent**
 
+        Keyword Args:
+            `coalesce` (`bool`):
+                Collapse the pending commands of `cmd_type` in the newest.
+                Default to False.
+
         Raises:
             TypeError:
                 The method was invoked with an argument of wrong type.
+            ValueError:
+                `cmd_type` is reserved to the SDK (see `configure` and
+                `iottly_sdk.transfer`).
         """
         if not isinstance(cmd_type, six.string_types):
             # Typecheck cmd_type (python2 compatible)
@@ -177,7 +353,14 @@ class IottlySDK:
             err = 'callback must be a callable but {} was given.'.format(type(cmd_type))
             raise TypeError(err)
 
+        if cmd_type in (CONFIG_CMD, FILE_CMD):
+            raise ValueError('{} is a reserved command type.'.format(cmd_type))
+
         self._cmd_callbacks[cmd_type] = self._wrapped_cb_execution(callback)
+        if coalesce:
+            self._coalesced.add(cmd_type)
+        else:
+            self._coalesced.discard(cmd_type)
 
     def start(self):
         """Connect to the iottly agent.
@@ -187,10 +370,6 @@ class IottlySDK:
                                     name='receiver_t')
         self._receiver_t.daemon = True
         self._receiver_t.start()
-        # Start the thread that keep the buffer size at bay
-        self._drainer_t = Thread(target=self._drain_buffer, name='drainer_t')
-        self._drainer_t.daemon = True
-        self._drainer_t.start()
         # Start the thread that send messages to the iottly agent
         self._consumer_t = Thread(target=self._consume_buffer, name='sender_t')
         self._consumer_t.daemon = True
@@ -228,6 +407,9 @@ class IottlySDK:
                 `send` was invoked with a non `dict` argument.
             ValueError:
                 `send` was invoked with a non JSON-serializable `dict`.
+            MessageTooLarge:
+                the message exceeds `max_message_bytes` and is rejected
+                (a `ValueError`).
         """
         if not isinstance(msg, dict):
             err = 'msg must be a dict but {} was given.'.format(type(msg))
@@ -237,23 +419,201 @@ class IottlySDK:
             err = 'channel must be a str but {} was given.'.format(type(channel))
             raise TypeError(err)
 
-        try:
-            json.dumps(msg)
-        except TypeError as e:
-            raise ValueError('Given msg is not JSON-serializable.')
+        # Messages are buffered already encoded
+        self._channel_handle(channel)._send(msg)
 
-        payload = Msg(payload=msg, type=False, channel=channel)  # denote a data payload
-        try:
-            self._buffer.put(payload, False)  # en-queue the msg non-blocking
-        except Full:
-            # Notify the buffer flusher that the buffer is full
-            # If the buffer dimension is correctly set
-            # this should happend only if:
-            # - the iottly agent is disconnected from the network
-            # - the sdk is disconnected from the iottly agent
-            with self._buffer_full:
-                self._buffer_full.notify()
-            self._buffer.put(payload) # en-queue the msg blocking
+    def channel(self, name):
+        """Return the handle to send messages to the channel `name`.
+
+        Sending through a handle is equivalent to `send(msg, channel=name)`
+        but the channel is validated and encoded once. The handle also keeps
+        the statistics of the channel::
+
+            alarms = sdk.channel('alarms')
+            alarms.send({'door': 'open'})
+            alarms.stats()  # {'msgs': 1, 'bytes': ...}
+
+        Handles are cached: calling `channel` with the same `name` returns
+        the same handle. Sending with `send(msg, channel=name)` only keeps
+        the handles of the most recent names.
+
+        Args:
+            name (`str`):
+                The channel to which the messages will be forwarded.
+
+        Returns:
+            `Channel`: the handle of the channel.
+
+        Raises:
+            TypeError:
+                The method was invoked with a non `str` name.
+            ValueError:
+                The method was invoked with an empty name.
+        """
+        handle = self._channels.get(name)
+        if handle is None:
+            with self._channels_lock:
+                # The handle of a name already passed to `send` is kept
+                handle = self._implicit_channels.pop(name, None) or \
+                    self._new_channel(name)
+                handle = self._channels.setdefault(name, handle)
+        return handle
+
+    def _new_channel(self, name):
+        if not isinstance(name, str):
+            err = 'channel must be a str but {} was given.'.format(type(name))
+            raise TypeError(err)
+        if not name:
+            raise ValueError('channel must be a non-empty str.')
+        return Channel(self, name)
+
+    def send_raw(self, payload, channel=None, validate=False):
+        """Sends a message already serialized to JSON to iottly.
+
+        Same as `send` for producers holding the JSON encoding of the
+        message: the bytes are copied in the internal buffer as they are,
+        without decoding and encoding them again.
+
+        Args:
+            payload (`bytes`, `bytearray` or `memoryview`):
+                The UTF-8 encoded JSON object to be sent. It can't contain
+                line breaks (use a compact encoding).
+            channel (`str`):
+                The channel to which the message will be forwarded.
+                Default to None
+            validate (`bool`):
+                Check that the payload is UTF-8 text delimited by curly
+                braces (the JSON is not parsed). Default to False
+
+        Raises:
+            TypeError:
+                `send_raw` was invoked with a non bytes-like `payload`.
+            ValueError:
+                `payload` contains line breaks or is not valid.
+        """
+        if channel and not isinstance(channel, str):
+            err = 'channel must be a str but {} was given.'.format(type(channel))
+            raise TypeError(err)
+
+        self._check_raw(payload, validate)
+        self._channel_handle(channel)._send_raw(payload)
+
+    def _check_raw(self, payload, validate):
+        """Check a pre-serialized payload (see `send_raw`).
+        """
+        if not isinstance(payload, (six.binary_type, bytearray, memoryview)):
+            err = 'payload must be bytes-like but {} was given.'.format(type(payload))
+            raise TypeError(err)
+
+        if isinstance(payload, memoryview):
+            if payload.ndim != 1 or payload.itemsize != 1:
+                raise TypeError('payload must be a 1-dimensional view of bytes.')
+            line_break = _NEWLINE.search(payload) is not None
+        else:
+            line_break = payload.find(b'\n') >= 0
+        if line_break:
+            raise ValueError('Given payload contains line breaks.')
+
+        if validate:
+            _validate_raw_json(payload)
+
+    def register_schema(self, name, fields, channel=None):
+        """Register a fixed-shape message and return its sender.
+
+        Use this method for messages sent often with the same keys, eg.
+        periodic readings of a sensor: the JSON encoding of the keys and of
+        the message envelope is computed once, and the returned
+        `SchemaSender` only formats the values::
+
+            readings = sdk.register_schema(
+                'readings', [('temperature', float), ('humidity', float), ('ts', int)])
+            readings.send(21.5, 40.0, 1546300800)
+
+        is equivalent to::
+
+            sdk.send({'temperature': 21.5, 'humidity': 40.0, 'ts': 1546300800})
+
+        .. note:: If you call `register_schema` with a `name` already registered the schema is overwritten.
+
+        Args:
+            name (`str`):
+                an identifier for the schema.
+            fields (`list`):
+                the `(key, type)` pairs of the message, in the order of the
+                values passed to `send`. Supported types are `float`, `int`,
+                `bool` and `str`. A `dict` is accepted when its order is
+                preserved (Python >= 3.7).
+            channel (`str`):
+                The channel to which the messages will be forwarded.
+                Default to None
+
+        Returns:
+            `SchemaSender`: call its `send(*values)` to send a message.
+
+        Raises:
+            TypeError:
+                The method was invoked with an argument of wrong type.
+        """
+        if not isinstance(name, six.string_types):
+            err = 'name must be a string but {} was given.'.format(type(name))
+            raise TypeError(err)
+
+        if channel and not isinstance(channel, str):
+            err = 'channel must be a str but {} was given.'.format(type(channel))
+            raise TypeError(err)
+
+        if isinstance(fields, dict):
+            fields = list(fields.items())
+        sender = SchemaSender(self, name, fields, channel)
+        self._schemas[name] = sender
+        return sender
+
+    def send_file(self, path, channel=None, chunk_size=DEFAULT_CHUNK_SIZE, name=None):
+        """Send a file as a stream of chunk messages.
+
+        The file is memory-mapped and sent in the background, a chunk at a
+        time (see `iottly_sdk.transfer` for the format of the chunks),
+        without loading or encoding it whole. Chunks bypass the internal
+        buffer: the transfer pauses while the SDK is disconnected from the
+        iottly agent, then resumes from the first chunk not written.
+
+        .. note:: The file must not be modified during the transfer.
+
+        Args:
+            path (`str`):
+                the path of the file.
+
+        Keyword Args:
+            channel (`str`):
+                The channel to which the chunks will be forwarded.
+                Default to None
+            chunk_size (`int`):
+                the bytes of the file in each chunk (before the base64
+                encoding). Default to 48 KiB, reduced so that the chunks
+                fit `max_message_bytes`.
+            name (`str`):
+                the file name sent with the chunks. Default to the base
+                name of `path`.
+
+        Returns:
+            `FileTransfer`: call its `wait` to wait for the end of the
+            transfer.
+
+        Raises:
+            TypeError:
+                The method was invoked with an argument of wrong type.
+            ValueError:
+                `chunk_size` is not positive.
+            IOError:
+                the file can't be opened.
+        """
+        if channel and not isinstance(channel, str):
+            err = 'channel must be a str but {} was given.'.format(type(channel))
+            raise TypeError(err)
+
+        transfer = FileTransfer(self, path, channel, chunk_size, name)
+        transfer.start()
+        return transfer
 
     @min_agent_version('1.8.0')
     def call_agent(self, cmd, *args):
@@ -282,7 +642,8 @@ class IottlySDK:
         Raises:
             DisconnectedSDK:
                 `call_agent` called while the SDK was not connected to a
-                iottly agent.
+                iottly agent, or the agent stopped reading and the write
+                timed out (see `write_timeout`).
             InvalidAgentVersion:
                 `call_agent` called while the SDK was connected to an agent < 1.8.0
 
@@ -308,107 +669,431 @@ class IottlySDK:
         payload = json.dumps(dict([(cmd, cmd_args)]))
         msg = self._call_agent_msg.format(payload).encode()
         # send the message right-away
-        self._send_msg_through_socket(msg)
+        try:
+            self._send_msg_through_socket(msg)
+        except (OSError, IOError):
+            # Disconnected meanwhile, or the agent stopped reading
+            raise DisconnectedSDK('Connection lost during `agent_call`')
+
+    def every(self, interval, producer, channel=None, jitter=0.0):
+        """Send the message returned by `producer` every `interval` seconds.
+
+        Replaces the sampling loops with `time.sleep` in a thread of their
+        own: every producer runs on the timer wheel of the SDK (one thread
+        whatever the number of producers) and a small pool of workers,
+        apart from the timers of the SDK (eg. the heartbeat)::
 
-    def stop(self):
+            sdk.every(5.0, lambda: {'temperature': sensor.read()})
+
+        Runs are scheduled on a fixed grid and don't drift. A run is
+        skipped if the previous one of the same producer is still
+        executing. The messages are sent as with `send`; a producer
+        returning None sends nothing. Exceptions raised by the producer are
+        reported as for the other callbacks.
+
+        Args:
+            interval (`float`):
+                the period in seconds.
+            producer (func or callable):
+                called without arguments, returns the `dict` to be sent.
+
+        Keyword Args:
+            channel (`str`):
+                The channel to which the messages will be forwarded.
+                Default to None
+            jitter (`float`):
+                a random delay, up to `jitter` seconds, added to every run.
+                Default to 0.
+
+        Returns:
+            `TimerHandle`: call its `cancel` to stop the producer.
+
+        Raises:
+            TypeError:
+                The method was invoked with an argument of wrong type.
+            ValueError:
+                `interval` is not positive.
+        """
+        if not six.callable(producer):
+            err = 'producer must be a callable but {} was given.'.format(type(producer))
+            raise TypeError(err)
+
+        if channel and not isinstance(channel, str):
+            err = 'channel must be a str but {} was given.'.format(type(channel))
+            raise TypeError(err)
+
+        name = getattr(producer, '__name__', None) or producer.__class__.__name__
+
+        def produce():
+            try:
+                msg = producer()
+                if msg is not None:
+                    self.send(msg, channel)
+            except Exception as exc:
+                self._errors.report(exc, name)
+
+        handle = self._scheduler.every(interval, produce, jitter=jitter, pool=True)
+        self._periodic.add(handle)
+        handle._on_cancel = self._periodic.discard
+        return handle
+
+    def configure(self, config):
+        """Change the send rates and the buffer size at runtime.
+
+        The `config` `dict` (see `iottly_sdk.config` for its format) sets
+        the sampling, rate limit and aggregation window of the channels,
+        and `max_buffered_msgs`. The same `dict` can be sent from the cloud
+        as the reserved `sdkconfig` command::
+
+            {"sdkconfig": {"channels": {"telemetry": {"sampling": 0.1}}}}
+
+        The whole `config` is validated before being applied, and applied
+        at once: the threads keep running and no buffered message is lost
+        (a smaller buffer discards the oldest messages only on the next
+        sends). Messages held by a replaced aggregation window are sent.
+        Invalid configs received from the cloud are reported as errors of
+        the `sdkconfig` callback.
+
+        Args:
+            config (`dict`):
+                the settings to change, the others are kept.
+
+        Raises:
+            TypeError:
+                a setting has a wrong type.
+            ValueError:
+                a setting is out of range or unknown.
+        """
+        config = validate_config(config)
+        with self._config_lock:
+            for key, table in (('channels', self._channel_settings),
+                               ('degraded', self._degraded_settings)):
+                for name, settings in config[key].items():
+                    if settings is None:
+                        table.pop(name, None)
+                    else:
+                        table[name] = settings
+            self._hysteresis = config.get('hysteresis', self._hysteresis)
+            if 'max_buffered_msgs' in config:
+                self._max_buffered_msgs = config['max_buffered_msgs']
+                self._buffer.resize(self._max_buffered_msgs)
+            replaced = self._update_policies()
+        self._close_policies(replaced)
+
+    def effective_config(self):
+        """Return the configuration in effect (see `configure`).
+
+        Returns:
+            `dict`: with `max_buffered_msgs`, the settings of the configured
+            `channels` and their `degraded` ones, the `hysteresis` and the
+            current `mode` (`'normal'` or `'degraded'`).
+        """
+        with self._config_lock:
+            return {
+                'max_buffered_msgs': self._max_buffered_msgs,
+                'channels': dict((name, dict(settings)) for name, settings
+                                 in self._channel_settings.items()),
+                'degraded': dict((name, dict(settings)) for name, settings
+                                 in self._degraded_settings.items()),
+                'hysteresis': self._hysteresis,
+                'mode': 'degraded' if self._degraded else 'normal',
+            }
+
+    def link_stats(self):
+        """Round-trip time and liveness of the link with the iottly agent.
+
+        With `heartbeat` the SDK pings the agent and measures the answers:
+
+        - `rtt`: the last round-trip time in seconds (None if none yet).
+        - `srtt`: the smoothed round-trip time.
+        - `pings`, `pongs`: the pings sent and answered.
+        - `dead_links`: the links dropped after `heartbeat_misses`
+          unanswered pings.
+        - `write_timeouts`: the links dropped after a write exceeding
+          `write_timeout`.
+
+        Returns:
+            `dict`: the statistics of the link.
+        """
+        with self._heartbeat_lock:
+            return dict(self._link_stats)
+
+    def flush(self, timeout=None):
+        """Wait until the buffered messages have been written to the socket.
+
+        Pending time-series batches are moved in the buffer first. Messages
+        are written only while the SDK is connected to the iottly agent:
+        when disconnected, `flush` waits for the link to be re-established
+        until the `timeout` expires.
+
+        Keyword Args:
+            timeout (`float`):
+                the maximum time to wait in seconds.
+                Default to None (wait until the buffer is drained).
+
+        Returns:
+            `int`: the number of messages not written yet (0 on success).
+            In reliable mode, messages not acknowledged by the agent are
+            counted too.
+        """
+        deadline = None if timeout is None else time.time() + timeout
+        for batcher in self._batchers:
+            batcher.flush()
+        pending = self._buffer.join(timeout)
+        if self._window is not None:
+            # Wait for the acknowledge of the agent too
+            if deadline is not None:
+                timeout = max(0, deadline - time.time())
+            pending += self._window.join(timeout)
+        return pending
+
+    def stop(self, drain=False, timeout=2.0):
         """Convenience method to stop the sdk threads and perform cleanup
+
+        Keyword Args:
+            drain (`bool`):
+                write the buffered messages to the socket before stopping
+                (see `flush`). Default to False: buffered messages are
+                discarded.
+            timeout (`float`):
+                the maximum time in seconds spent draining the buffer.
+
+        Returns:
+            `int`: the number of buffered messages discarded.
         """
+        # Move the pending time-series batches in the buffer
+        for batcher in self._batchers:
+            batcher.close()
+        # and the messages held by the aggregation windows
+        with self._config_lock:
+            if self._restore_timer is not None:
+                self._restore_timer.cancel()
+        for handle in self._channel_handles():
+            if handle._policy is not None:
+                handle._policy.close(handle._emit)
+        if drain and self._consumer_t is not None:
+            self.flush(timeout)
         self._sdk_stopped.set()
+        if self._window is not None:
+            self._window.close()
+        # Wake the sender thread waiting for a handshake
+        self._handshake_ended.set()
         # Wake the connection thread so it can exit properly
         self._disconnected_from_agent.set()
-        self._connection_t.join(2.0)
         # Cancel handshake time if any
         if self._handshake_timeout_timer:
             self._handshake_timeout_timer.cancel()
-        # Wake the drainer thread so it can exit properly
-        with self._buffer_full:
-            self._buffer_full.notify()
-        self._drainer_t.join(2.0)
+        self._stop_heartbeat()
+        self._scheduler.stop()
+        self._errors.stop()
+        self._files.close()
         # Wake up consumer thread waiting on empty buffer
-        try:
-            self._buffer.put(None, False, timeout=2.0)
-        except Full:
-            # This is usefull during tests
-            pass
+        self._buffer.close()
         # Wake up the consumer and receiver threads so they can exit properly
         with self._connected_to_agent:
             self._connected_to_agent.notifyAll()
-        self._consumer_t.join(2.0)
-        self._receiver_t.join(2.0)
-
+        # Every thread has been woken: wait for them within a single deadline
+        deadline = time.time() + 2.0
+        for t in (self._connection_t, self._consumer_t, self._receiver_t):
+            if t is not None:
+                t.join(max(0, deadline - time.time()))
+        discarded = self._buffer.join(0)
+        if self._window is not None:
+            discarded += len(self._window)
+        return discarded
 
     # ======================================================================== #
     # =========================== Private Methods ============================ #
     # ======================================================================== #
 
+    def _init_runtime_state(self):
+        """Create buffer, threads references and synchronization primitives.
+        """
+        # Threads references
+        self._receiver_t = None
+        self._consumer_t = None
+        self._connection_t = None
+
+        # The buffer holding the encoded outgoing messages
+        # up to self._max_buffered_msgs messages
+        self._buffer = ArenaBuffer(self._max_buffered_msgs)
+
+        # Conditions and state mgmt
+        self._socket_state_lock = Lock()
+        self._connected_to_agent = Condition(self._socket_state_lock)
+        self._disconnected_from_agent = Event()
+        # Indicate if there is a link to the iottly agent
+        self._agent_linked = False
+        # The unix socket to communicate with the iottly agent
+        self._socket = None
+        # Lock to serialize writes to the socket
+        self._socket_write_lock = Lock()
+        # The version of the attacched iottly agent
+        # iottly agent <= 1.8.0 doesn't provide a version.
+        self._agent_version_state_lock = Lock()
+        self._agent_version = None
+        # Framing used on the current link (negotiated in sdkinit)
+        self._protocol = JSON_LINES
+        self._rx_decoder = JSON_LINES.decoder()
+        self._handshake_ended = Event()
+        self._handshake_timeout_timer = None
+        # Timers of the SDK (handshake timeout, periodic producers)
+        self._init_scheduler()
+        # Reports of the exceptions raised by the callbacks
+        self._errors = ErrorReporter(self)
+        # Reliable mode: the unacknowledged data messages
+        self._window = AckWindow(self._ack_window) if self._ack_window else None
+        # The agent on the current link acknowledges the messages
+        self._acks_enabled = False
+        # Heartbeat: the timer of the pings on the current link and the
+        # pings not answered yet (seq -> time sent)
+        self._heartbeat_lock = Lock()
+        self._heartbeat_timer = None
+        self._pings = {}
+        self._ping_seq = 0
+        # Bytes written to the socket, and their count at the last ping
+        self._tx_bytes = 0
+        self._tx_mark = 0
+        self._link_stats = {'rtt': None, 'srtt': None, 'pings': 0,
+                            'pongs': 0, 'dead_links': 0, 'write_timeouts': 0}
+
+        # Guards the channel settings (see `configure`); the timer restoring
+        # the full rate after the degraded mode
+        self._config_lock = RLock()
+        self._restore_timer = None
+        self._restore_timer_id = 0
+        # Guards the creation of the channel handles
+        self._channels_lock = Lock()
+
+        self._sdk_stopped = Event()
+
+    def _init_scheduler(self):
+        self._scheduler = Scheduler()
+
+    def _reset_after_fork(self):
+        """Reset the runtime state in a child process created with `fork`.
+
+        Threads are not replicated by `fork` and the inherited locks could be
+        held by threads that don't exist in the child. The inherited socket
+        is closed (only the child file descriptor: the parent connection is
+        left untouched) and messages buffered by the parent are discarded.
+        The SDK is left stopped: call `start` to connect from the child.
+        """
+        if self._socket:
+            try:
+                self._socket.close()
+            except (OSError, IOError):
+                pass
+        self._init_runtime_state()
+        # The timers and the incomplete files of the parent are not inherited
+        self._periodic = set()
+        self._files = FileReceiver(self, self._download_dir, *self._download_limits)
+        # nor the aggregation windows, on the timers of the parent
+        for handle in self._channel_handles():
+            if handle._policy is not None:
+                handle._policy = self._channel_policy(handle.name)
+
     def _connect_to_agent(self):
         """Try to create a connection to the iottly agent SDK server.
         """
         while not self._sdk_stopped.is_set():
             with self._connected_to_agent:
-                s = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
                 try:
-                    s.connect(self._socket_path)
-                except OSError as e:
-                    if e.errno == errno.ECONNREFUSED:
-                        s.close()
-                        time.sleep(0.2)
-                        continue
-                    else:
-                        s.close()
-                        time.sleep(0.2)
-                        continue
-                except IOError as e:
-                    if e.errno == errno.ENOENT:
-                        s.close()
-                        time.sleep(0.2)
-                        continue
-                    else:
-                        s.close()
-                        time.sleep(0.2)
-                        continue
+                    s = self._transport.connect()
+                except (OSError, IOError):
+                    # OSError is the base class for socket.error in Py => 3.3
+                    # IOError is the base class for socket.error in Py => 2.6
+                    # The agent is not listening (yet): retry
+                    self._sdk_stopped.wait(0.2)
+                    continue
+                if self._send_buffer_bytes:
+                    try:
+                        s.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF,
+                                     self._send_buffer_bytes)
+                    except (OSError, IOError):
+                        pass  # not supported by the transport: keep the default
 
                 self._socket = s
+                self._rx_decoder = JSON_LINES.decoder()
                 self._agent_linked = True
-                # Send notification of connected app to the iottly agent
-                self._buffer.put(Msg(self._app_start_msg, True, None))  # Signalling
-                self._handshake_ended.clear()
+                self._on_agent_linked()
                 # Notify the other threads that require the connection
                 self._disconnected_from_agent.clear()
-                # Exec agent_status_changed_cb once the handshake with the agent
-                # is complete or a timeout is expired (agent <= 1.8.0)
-                self._handshake_timeout_timer = Timer(
-                                1.0, self._invoke_initial_agent_status_changed_cb,
-                                kwargs={'timeout': True})
-                self._handshake_timeout_timer.start()
                 self._connected_to_agent.notifyAll()
             # Wait until the unix socket is broken
             # and the event _disconnected_from_agent is fired
             self._disconnected_from_agent.wait()
             if self._handshake_timeout_timer:
                 self._handshake_timeout_timer.cancel()
+            self._stop_heartbeat()
             with self._connected_to_agent:
                 # Set the disconnected state flag
                 self._agent_linked = False
                 if self._socket:
+                    try:
+                        # Wake the receiver thread blocked in `recv`
+                        self._socket.shutdown(socket.SHUT_RDWR)
+                    except (OSError, IOError):
+                        pass
                     self._socket.close()
-                self.socket = None
-            # Reset the version on disconnection (ie. handle agent upgrade)
-            with self._agent_version_state_lock:
-                self._agent_version = None
-
-            # Exec callback
-            if self._on_agent_status_changed_cb:
-                self._on_agent_status_changed_cb('stopped')
+                self._socket = None
+                # The next agent could be an old one
+                with self._socket_write_lock:
+                    self._protocol = JSON_LINES
+                self._acks_enabled = False
+                if self._window is not None:
+                    # Write the unacknowledged messages again on the next link
+                    self._window.rewind()
+            self._on_agent_unlinked()
         # Exit
 
+    def _on_agent_linked(self):
+        """Start the handshake on a new link with the iottly agent.
+
+        Called by the connection thread holding the socket state lock.
+        """
+        # Send notification of connected app to the iottly agent
+        if self._window is not None:
+            # Data messages wait for the end of the handshake:
+            # the signal can't be queued behind them
+            try:
+                self._send_msg_through_socket(self._app_start_msg)
+            except (OSError, IOError):
+                pass  # the receiver will notice
+        else:
+            self._buffer.put(Msg(self._app_start_msg, True, None))  # Signalling
+        self._handshake_ended.clear()
+        # Exec agent_status_changed_cb once the handshake with the agent
+        # is complete or a timeout is expired (agent <= 1.8.0)
+        self._handshake_timeout_timer = self._scheduler.call_later(
+            1.0, self._invoke_initial_agent_status_changed_cb, timeout=True)
+
+    def _on_agent_unlinked(self):
+        """Reset the link state after the connection is lost.
+        """
+        # Reset the version on disconnection (ie. handle agent upgrade)
+        with self._agent_version_state_lock:
+            self._agent_version = None
+
+        # Exec callback
+        if self._on_agent_status_changed_cb:
+            self._on_agent_status_changed_cb('stopped')
+
     def _consume_buffer(self):
         """Consume a message from the internal buffer and try to send it.
         """
         while not self._sdk_stopped.is_set():
-            msg = self._buffer.get()  # de-queue a msg blocking
+            try:
+                msg = self._buffer.get()  # de-queue a msg blocking
+            except Empty:
+                # Woken up to write the window on a new link (reliable mode)
+                self._write_window()
+                continue
             if msg is None:
-                break  # None is pushed to wake-up the thread for exit
+                break  # the buffer is closed to wake-up the thread for exit
+            if self._window is not None and not msg.type:
+                self._send_reliably(msg)
+                continue
             # Try sending the message
             sent = False
             while not sent:
@@ -422,68 +1107,170 @@ class IottlySDK:
                             break
                         continue  # re-acquire the socket (None)
                 try:
-                    data, is_signal, channel = msg
-                    if is_signal:
-                        # Signalling data is already JSON formatted and
-                        # netwrok encoded (bytes)
-                        payload = data
-                    else:
-                        payload = self._msg_serialize(data, channel)
-                    self._send_msg_through_socket(payload)
+                    # Messages are buffered JSON formatted and
+                    # netwrok encoded (a view on the buffer memory)
+                    self._send_msg_through_socket(msg.payload, msg.framing)
                     # the message was forwarded
                     sent = True
+                    self._buffer.task_done()
                 except (OSError, IOError):
                     # OSError is the base class for socket.error in Py => 3.3
                     # IOError is the base class for socket.error in Py => 2.6
                     # Wait for the connection to be re established
+                    # (unless it was while the write was failing)
                     with self._connected_to_agent:
-                        self._connected_to_agent.wait()
+                        if self._socket is socket:
+                            self._connected_to_agent.wait()
                     # Check the exit condition on resume
                     if self._sdk_stopped.is_set():
                         break
 
-    def _send_msg_through_socket(self, payload):
+    def _send_reliably(self, msg):
+        """Move a data message in the window and write the pending ones.
+        """
+        while not self._window.add(msg.payload, msg.framing):
+            # Rewound while full: write the window again to get the acks
+            if not self._write_window():
+                break
+        self._buffer.task_done()
+        self._write_window()
+
+    def _write_window(self):
+        """Write the window messages pending on the current link.
+
+        Returns False if the SDK is stopped.
+        """
+        while self._wait_for_handshake():
+            link, frames = self._window.pending()
+            acks = self._acks_enabled
+            try:
+                for seq, framing, frame in frames:
+                    if acks:
+                        frame = sequence(frame, PROTOCOLS[framing], seq)
+                    self._send_msg_through_socket(frame, framing)
+                    self._window.written(seq, link)
+                    if not acks:
+                        # The agent doesn't acknowledge: released once written
+                        self._window.ack(seq)
+                return True
+            except (OSError, IOError):
+                # Wait for the connection to be re established
+                with self._connected_to_agent:
+                    self._connected_to_agent.wait(0.5)
+        return False
+
+    def _wait_for_handshake(self):
+        """Wait for a link with the agent whose handshake is complete.
+
+        Returns False if the SDK is stopped.
+        """
+        while not self._sdk_stopped.is_set():
+            with self._connected_to_agent:
+                if not self._socket:
+                    self._connected_to_agent.wait()
+                    continue
+            self._handshake_ended.wait()
+            return not self._sdk_stopped.is_set()
+        return False
+
+    def _enqueue(self, msg):
+        """Put an encoded `Msg` in the internal buffer.
+
+        If the buffer is full the oldest message is discarded. If the buffer
+        dimension is correctly set this should happend only if:
+        - the iottly agent is disconnected from the network
+        - the sdk is disconnected from the iottly agent
+        """
+        self._buffer.put(msg)
+
+    def _send_msg_through_socket(self, payload, framing=0, blocking=True):
         """Send messages through the socket after acquiring a shared lock.
         This avoid possible interleaving between threads. Messages are
-        sezialized as they should.
+        sezialized as they should: payloads encoded with a `framing` other
+        than the one of the link are transcoded. Without `blocking` the
+        message is not sent if another write is in progress.
+        A write exceeding `write_timeout` drops the link (the message may
+        be cut off: it must be written again whole on the next one) and
+        raises `socket.timeout`.
         All raised errors are propagated to the callers which should act upon
         accordingly to their specific semantic.
         """
-        with self._socket_write_lock:
-            self._socket.sendall(payload)
+        if not self._socket_write_lock.acquire(blocking):
+            raise socket.error(errno.EWOULDBLOCK, 'a write is in progress')
+        try:
+            sock = self._socket
+            if sock is None:
+                raise socket.error(errno.ENOTCONN, 'not connected to the agent')
+            protocol = self._protocol
+            if framing != protocol.id:
+                payload = transcode(payload, PROTOCOLS[framing], protocol)
+            try:
+                _write(sock, payload, self._write_timeout, self._count_sent)
+            except socket.timeout:
+                self._on_write_timeout(sock)
+                raise
+        finally:
+            self._socket_write_lock.release()
+
+    def _count_sent(self, n):
+        # Called holding the socket write lock
+        self._tx_bytes += n
+
+    def _on_write_timeout(self, sock):
+        """Drop a link whose agent stopped reading.
+
+        Called holding the socket write lock: the connection thread can't
+        complete a reconnection meanwhile, so `sock` is still the current
+        socket unless it's already being closed.
+        """
+        if self._socket is not sock:
+            return
+        with self._heartbeat_lock:
+            self._link_stats['write_timeouts'] += 1
+        try:
+            # Wake the receiver thread blocked in `recv`
+            sock.shutdown(socket.SHUT_RDWR)
+        except (OSError, IOError):
+            pass
+        self._disconnected_from_agent.set()
 
-    def _drain_buffer(self):
-        """Keep the internal buffer at bay.
+    def _switch_framing(self, name):
+        """Switch the link to the framing chosen by the agent.
+
+        The acknowledge is the last JSON line sent by the SDK: the agent
+        switches on receiving it and doesn't send anything in between.
         """
-        while not self._sdk_stopped.is_set():
-            with self._buffer_full:
-                self._buffer_full.wait()
-                if self._buffer.full():
-                    # Consume and discard a message
-                    try:
-                        self._buffer.get(False)
-                    except Empty:
-                        pass
+        protocol = get_protocol(name)
+        if name not in self._framings or protocol is None:
+            # Not offered: without the acknowledge the agent keeps JSON lines
+            return
+        with self._socket_write_lock:
+            try:
+                self._socket.sendall(self._framing_msg.format(name).encode())
+            except (AttributeError, OSError, IOError):
+                # Disconnected: the receiver will notice
+                return
+            self._protocol = protocol
+        self._rx_decoder = protocol.decoder(self._rx_decoder.pending())
 
     def _receive_msgs_from_agent(self):
         """Receive messages/signals from the iottly agent
         """
-        msg_buf = []
         while not self._sdk_stopped.is_set():
-            with self._socket_state_lock:
+            with self._connected_to_agent:
                 socket = self._socket
-            if not socket:
-                # Wait for the connection to be re established
-                with self._connected_to_agent:
+                if not socket:
+                    # Wait for the connection to be re established
                     self._connected_to_agent.wait()
-                # Check the exit condition on resume
-                if self._sdk_stopped.is_set():
-                    break
-            msgs = _read_msg_from_socket(self._socket, msg_buf)
+                    # Re-acquire the socket (check the exit condition first)
+                    continue
+            # When coalescing, read every command already received
+            msgs = _read_frames(socket, self._rx_decoder,
+                                drain=self._coalescing(),
+                                size=self._transport.recv_size)
             if msgs:
-                for msg in msgs:
-                    # Process messages
-                    self._process_msg_from_agent(msg)
+                # Process messages
+                self._process_msgs_from_agent(msgs)
             else:
                 # Check the exit condition on resume
                 if self._sdk_stopped.is_set():
@@ -494,18 +1281,43 @@ class IottlySDK:
                         self._disconnected_from_agent.set()
                 # Wait for the connection to be re established
                 with self._connected_to_agent:
-                    self._connected_to_agent.wait()
+                    while self._socket is socket and \
+                            not self._sdk_stopped.is_set():
+                        self._connected_to_agent.wait()
 
     def _process_msg_from_agent(self, msg):
-        try:
-            msg = json.loads(msg)
-        except ValueError:
-            # if we receive an invalid message -> skip it
-            return
+        self._process_msgs_from_agent([msg])
+
+    def _process_msgs_from_agent(self, frames):
+        """Decode and dispatch the frames of a read from the socket.
+
+        Consecutive commands are dispatched together, so that the
+        coalesced ones can be collapsed (see `subscribe`).
+        """
+        cmds = []
+        for frame in frames:
+            try:
+                msg = self._protocol.decode(frame)
+            except ValueError:
+                # if we receive an invalid message -> skip it
+                continue
+            if not isinstance(msg, dict):
+                continue
+            if 'data' in msg and 'signal' not in msg:
+                cmds.append(msg)
+                continue
+            if cmds:
+                self._dispatch_cmds_from_agent(cmds)
+                cmds = []
+            self._dispatch_msg_from_agent(msg)
+        if cmds:
+            self._dispatch_cmds_from_agent(cmds)
+
+    def _dispatch_msg_from_agent(self, msg):
         if 'signal' in msg:
             self._handle_signals_from_agent(msg['signal'])
         elif 'data' in msg:
-            self._handle_cmd_from_agent(msg['data'])
+            self._dispatch_cmds_from_agent([msg])
         else:
             # TODO handle invalid msg. Disconnect?
             return
@@ -513,33 +1325,94 @@ class IottlySDK:
     def _handle_signals_from_agent(self, signal):
         if 'agentstatus' in signal:
             status = signal['agentstatus']  # TODO validate status
-            self._on_agent_status_changed_cb(status)
+            if self._on_agent_status_changed_cb:
+                self._on_agent_status_changed_cb(status)
         elif 'connectionstatus' in signal:
             status = signal['connectionstatus']  # TODO validate status
-            self._on_connection_status_changed_cb(status)
+            self._on_connection_status(status)
+            if self._on_connection_status_changed_cb:
+                self._on_connection_status_changed_cb(status)
         elif 'sdkinit' in signal:
             version = signal['sdkinit']['version']
+            framing = signal['sdkinit'].get('framing')
+            if framing:
+                self._switch_framing(framing)
+            self._acks_enabled = self._window is not None and \
+                bool(signal['sdkinit'].get('acks'))
+            if self._heartbeat and signal['sdkinit'].get('heartbeat'):
+                self._start_heartbeat()
             with self._agent_version_state_lock:
                 self._agent_version = version
                 self._invoke_initial_agent_status_changed_cb()
+        elif 'sdkpong' in signal:
+            self._on_pong(int(signal['sdkpong']['seq']))
+        elif 'sdkack' in signal:
+            # Cumulative acknowledge of the data messages (reliable mode)
+            if self._window is not None:
+                self._window.ack(int(signal['sdkack']['seq']))
         else:
             # NOTE ignore invalid signals to ensure retrocompatibility.
             return
 
-    def _handle_cmd_from_agent(self, cmd):
+    def _dispatch_cmds_from_agent(self, msgs):
+        self._handle_cmds_from_agent([msg['data'] for msg in msgs])
+
+    def _coalescing(self):
+        return bool(self._coalesced)
+
+    def _handle_cmds_from_agent(self, cmds):
+        """Execute a run of commands, only the newest of a coalesced type.
+        """
+        if not self._coalesced:
+            for cmd in cmds:
+                self._handle_cmd_from_agent(cmd)
+            return
+        # cmd_type -> [index of the newest, number of commands]
+        pending = {}
+        for i, cmd in enumerate(cmds):
+            cmd_type = _cmd_type(cmd)
+            if cmd_type in self._coalesced:
+                pending.setdefault(cmd_type, [i, 0])
+                pending[cmd_type][0] = i
+                pending[cmd_type][1] += 1
+        for i, cmd in enumerate(cmds):
+            newest = pending.get(_cmd_type(cmd))
+            if newest is None:
+                self._handle_cmd_from_agent(cmd)
+            elif newest[0] == i:
+                self._handle_cmd_from_agent(cmd, superseded=newest[1] - 1)
+
+    def _handle_cmd_from_agent(self, cmd, superseded=0):
         # Ensure there is a top-level key
         if len(cmd) == 1:
             # get the command type
             cmd_type = None
             for k in six.iterkeys(cmd):
                 cmd_type = k
+            if cmd_type == CONFIG_CMD:
+                # Reserved: runtime configuration from the cloud
+                try:
+                    self.configure(cmd[cmd_type])
+                except (TypeError, ValueError) as e:
+                    self._errors.report(e, CONFIG_CMD)
+                return
+            if cmd_type == FILE_CMD:
+                # Reserved: a chunk of a large command
+                try:
+                    self._files.feed(cmd[cmd_type])
+                except (TypeError, ValueError, OSError, IOError) as e:
+                    self._errors.report(e, FILE_CMD)
+                return
             # execute the registered cb (if any)
             try:
                 cb = self._cmd_callbacks[cmd_type]
-                # Execute callback
-                cb(cmd[cmd_type])
             except KeyError:
-                pass
+                return
+            # Execute callback
+            if cmd_type in self._coalesced:
+                cb(cmd[cmd_type], superseded=superseded)
+            else:
+                cb(cmd[cmd_type])
         else:
             # TODO handle invalid commands
             pass
@@ -547,18 +1420,226 @@ class IottlySDK:
     def _invoke_initial_agent_status_changed_cb(self, timeout=False):
         if not self._handshake_ended.is_set():
             self._handshake_ended.set()
+            if self._window is not None and len(self._window):
+                # Retransmit the unacknowledged messages
+                self._buffer.wakeup()
+            # Ask for the missing chunks of the files being received
+            self._files.resume()
             if self._on_agent_status_changed_cb:
                 self._on_agent_status_changed_cb('started')
-            if not timeout:
+            if not timeout and self._handshake_timeout_timer:
                 self._handshake_timeout_timer.cancel()
             self._handshake_timeout_timer = None
 
-    def _msg_serialize(self, msg, channel=None):
+    def _start_heartbeat(self):
+        """Ping the agent of the new link (it confirmed in sdkinit).
+        """
+        with self._heartbeat_lock:
+            if self._heartbeat_timer is not None:
+                self._heartbeat_timer.cancel()
+            self._pings.clear()
+            self._tx_mark = self._tx_bytes
+            self._heartbeat_timer = self._scheduler.every(
+                self._heartbeat, self._send_ping)
+
+    def _stop_heartbeat(self):
+        with self._heartbeat_lock:
+            if self._heartbeat_timer is not None:
+                self._heartbeat_timer.cancel()
+            self._heartbeat_timer = None
+            self._pings.clear()
+
+    def _send_ping(self):
+        """Send a ping, or declare the link dead if too many are unanswered.
+        """
+        with self._heartbeat_lock:
+            if self._heartbeat_timer is None:
+                return  # Stopped meanwhile
+            # Bytes written since the last ping: the agent is reading
+            progress = self._tx_bytes != self._tx_mark
+            self._tx_mark = self._tx_bytes
+            if len(self._pings) >= self._heartbeat_misses:
+                if progress:
+                    return  # The answers wait behind the messages
+                dead = True
+            else:
+                dead = False
+                self._ping_seq += 1
+                seq = self._ping_seq
+                self._pings[seq] = time.time()
+        if dead:
+            self._on_link_dead()
+            return
+        try:
+            self._send_msg_through_socket(self._ping_msg.format(seq).encode(),
+                                          blocking=False)
+        except (OSError, IOError):
+            # Skipped: another write holds the lock. It counts as
+            # unanswered only if that writer is blocked on a hung agent
+            if progress:
+                with self._heartbeat_lock:
+                    self._pings.pop(seq, None)
+                return
+        with self._heartbeat_lock:
+            self._link_stats['pings'] += 1
+
+    def _on_pong(self, seq):
+        now = time.time()
+        with self._heartbeat_lock:
+            sent = self._pings.get(seq)
+            if sent is None:
+                return  # Answer to a ping of a previous link
+            for k in list(self._pings):
+                if k <= seq:
+                    del self._pings[k]
+            rtt = now - sent
+            stats = self._link_stats
+            stats['pongs'] += 1
+            stats['rtt'] = rtt
+            # Smoothed as the TCP round-trip estimate
+            stats['srtt'] = rtt if stats['srtt'] is None else \
+                0.875 * stats['srtt'] + 0.125 * rtt
+
+    def _on_link_dead(self):
+        """Drop a link whose agent doesn't answer the pings.
+
+        The shutdown wakes the threads blocked on the socket: the receiver
+        notices the disconnection and the messages being written are
+        written again on the next link.
+        """
+        self._stop_heartbeat()
+        with self._socket_state_lock:
+            sock = self._socket
+            if sock is None:
+                return
+            self._link_stats['dead_links'] += 1
+            try:
+                sock.shutdown(socket.SHUT_RDWR)
+            except (OSError, IOError):
+                pass
+            self._disconnected_from_agent.set()
+
+    def _channel_policy(self, name):
+        # A new `SendPolicy` for the channel `name` (None: no settings)
+        with self._config_lock:
+            tables = [self._channel_settings]
+            if self._degraded:
+                tables.insert(0, self._degraded_settings)
+            for table in tables:
+                settings = table.get(name or '', table.get(DEFAULT_CHANNEL))
+                if settings is not None:
+                    return SendPolicy(scheduler=self._scheduler, **settings) \
+                        if settings else None
+            return None
+
+    def _update_policies(self):
+        """Give the channel handles the policies of the current settings.
+
+        Returns the replaced policies, to be closed (see `_close_policies`)
+        after releasing the config lock.
+        """
+        replaced = []
+        for handle in self._channel_handles():
+            policy = self._channel_policy(handle.name)
+            old = handle._policy
+            if (old and old.settings()) == (policy and policy.settings()):
+                continue  # Unchanged: keep the counters and the window
+            handle._policy = policy
+            if old is not None:
+                replaced.append((old, handle))
+        return replaced
+
+    def _close_policies(self, replaced):
+        for old, handle in replaced:
+            # Send the message held by the aggregation window (if any)
+            old.close(handle._emit)
+
+    def _on_connection_status(self, status):
+        """Degrade the channels while the MQTT connection is down.
+
+        The degraded mode starts at once; the full rate is restored after
+        `hysteresis` seconds of connectivity.
+        """
+        with self._config_lock:
+            if self._restore_timer is not None:
+                self._restore_timer.cancel()
+                self._restore_timer = None
+            self._restore_timer_id += 1
+            if status == 'disconnected':
+                self._set_degraded(True)
+            elif status == 'connected' and self._degraded:
+                if self._hysteresis:
+                    self._restore_timer = self._scheduler.call_later(
+                        self._hysteresis, self._end_degraded, self._restore_timer_id)
+                else:
+                    self._set_degraded(False)
+
+    def _end_degraded(self, timer_id):
+        with self._config_lock:
+            # Ignore a timer cancelled while it was firing
+            if timer_id == self._restore_timer_id:
+                self._restore_timer = None
+                self._set_degraded(False)
+
+    def _set_degraded(self, degraded):
+        with self._config_lock:
+            if degraded == self._degraded:
+                return
+            self._degraded = degraded
+            if not self._degraded_settings:
+                return  # No policy engine configured
+            replaced = self._update_policies()
+        self._close_policies(replaced)
+
+    def _channel_handle(self, channel):
+        """The handle of `channel` for `send` and the other senders.
+
+        Handles not requested with `channel` are kept for the most recent
+        `_MAX_IMPLICIT_CHANNELS` names only: names varying per message
+        (eg. a device identifier) don't grow the memory.
+        """
+        if not channel:
+            return self._no_channel
+        handle = self._channels.get(channel) or self._implicit_channels.get(channel)
+        if handle is not None:
+            return handle
+        evicted = None
+        with self._channels_lock:
+            handle = self._channels.get(channel) or self._implicit_channels.get(channel)
+            if handle is None:
+                handle = self._new_channel(channel)
+                if len(self._implicit_channels) >= _MAX_IMPLICIT_CHANNELS:
+                    # Evict the oldest one
+                    evicted = self._implicit_channels.pop(next(iter(self._implicit_channels)))
+                self._implicit_channels[channel] = handle
+        if evicted is not None and evicted._policy is not None:
+            # Send the message held by its aggregation window (if any)
+            evicted._policy.close(evicted._emit)
+        return handle
+
+    def _channel_handles(self):
+        return [self._no_channel] + list(self._channels.values()) + \
+            list(self._implicit_channels.values())
+
+    def _raw_msg(self, payload, channel=None):
+        # Splice a JSON-encoded payload in the data envelope (JSON lines):
+        # the parts are joined while copied in the buffer
+        handle = self._channel_handle(channel)
+        return (handle._prefix, payload, handle._suffix)
+
+    def _msg_serialize(self, msg, channel=None, protocol=JSON_LINES):
         # Prepare message to be sent on a socket
-        if channel:
-            return self._data_chan_msg.format(json.dumps(msg), channel).encode()
-        else:
-            return self._data_msg.format(json.dumps(msg)).encode()
+        if protocol is not JSON_LINES:
+            if isinstance(msg, six.binary_type):
+                msg = json.loads(msg.decode('utf-8'))
+            data = {'sdkclient': {'name': self._name}, 'payload': msg}
+            if channel:
+                data['channel'] = channel
+            return protocol.encode({'data': data})
+        if not isinstance(msg, six.binary_type):
+            msg = json.dumps(msg).encode()
+        # else: payload already JSON-encoded by the producer (eg. forwarder)
+        return self._channel_handle(channel)._encode(msg)
 
     def _wrapped_cb_execution(self, f):
         """Wrap callback execution and send error to agent.
@@ -566,66 +1647,110 @@ class IottlySDK:
         if f is None:
             return None
 
+        name = getattr(f, '__name__', None) or f.__class__.__name__
+
         @wraps(f)
         def wrapper(*args, **kwargs):
             try:
                 f(*args, **kwargs)
             except Exception as exc:
-                exc_dump = json.dumps({
-                    'type': exc.__class__.__name__,
-                    'msg': str(exc)
-                })
-                # Format signal message
-                exc_msg = Msg(
-                    payload=self._err_msg.format(exc_dump).encode(),
-                    type=True,
-                    channel=None
-                )
-                self._buffer.put(exc_msg)  # En-quque msg blocking
+                # Aggregated and rate-limited (not in the data buffer)
+                self._errors.report(exc, name)
 
         return wrapper
 
-def _read_msg_from_socket(socket, msg_buf):
-    msgs = []
-    while not msgs:
-        # Try to receive data from agent
+def _cmd_type(cmd):
+    # The type of a command is its only top-level key
+    if len(cmd) == 1:
+        for k in six.iterkeys(cmd):
+            return k
+    return None
+
+def _validate_raw_json(payload):
+    """Cheap structural check of a JSON-encoded object.
+    """
+    # memoryview.tobytes: bytes(view) is the repr of the view on Python 2
+    data = memoryview(payload).tobytes().strip(_JSON_WS)
+    if data[:1] != b'{' or data[-1:] != b'}':
+        raise ValueError('Given payload is not a JSON object.')
+    try:
+        data.decode('utf-8')
+    except UnicodeDecodeError:
+        raise ValueError('Given payload is not UTF-8 encoded.')
+
+def _read_frames(socket, decoder, drain=False, size=4096):
+    """Receive from the socket until `decoder` returns complete frames.
+
+    With `drain` the data already available on the socket is read too
+    (up to `_MAX_DRAIN_BYTES`), without blocking. Reads are of up to
+    `size` bytes.
+
+    Returns None if the connection is broken.
+    """
+    frames = []
+    while not frames:
         try:
-            # Read one message from the socket
-            buf = socket.recv(1024)
+            buf = socket.recv(size)
             if buf == b'':
                 # Broken connection
                 return None
-            else:
-                msg_buf.append(buf)
-        except (OSError, IOError):
+            frames = decoder.feed(buf)
+        except (OSError, IOError, FramingError):
             # OSError is the base class for socket.error in Py => 3.3
             # IOError is the base class for socket.error in Py => 2.6
             return None
-        # Extract messages
-        i = 0
-        buff_dim = len(msg_buf)
-        while i < buff_dim:
-            current = msg_buf[i]
-            chunck, splitted, next_buf = current.partition(b'\n')
-            if splitted:
-                # we have a new message
-                msg = b''.join(msg_buf[:i]) + chunck
-                if next_buf:
-                    # NOTE Python 3.4 compatibility
-                    # feature introduced in Python 3.5
-                    # https://www.python.org/dev/peps/pep-0448/
-                    #
-                    # msg_buf[:] = next_buf, * msg_buf[i+1:]
-                    tmp = msg_buf[i+1:]
-                    msg_buf[0] = next_buf
-                    msg_buf[1:] = tmp[:]
-                else:
-                    msg_buf[:] = msg_buf[i+1:]
-                # Update indexes
-                i = 0
-                buff_dim = len(msg_buf)
-                msgs.append(msg.decode())
-            else:
-                i += 1  # Consider next buffered item
-    # There is at least 1 complete message
-    return msgs
+    if drain and _MSG_DONTWAIT is not None:
+        n = 0
+        while n < _MAX_DRAIN_BYTES:
+            try:
+                buf = socket.recv(size, _MSG_DONTWAIT)
+                if not buf:
+                    break  # noticed by the next read
+                frames.extend(decoder.feed(buf))
+            except (OSError, IOError, FramingError):
+                break  # nothing more to read (or noticed by the next read)
+            n += len(buf)
+    return frames
+
+def _write(sock, payload, timeout, sent=None):
+    """Write the whole `payload` to the socket within `timeout` seconds.
+
+    Non-blocking sends continue after the partial writes, waiting for the
+    socket to become writable in between, so that an agent that stops
+    reading can't block the caller indefinitely. `sent` is called with the
+    bytes of each partial write.
+
+    Raises:
+        socket.timeout:
+            the deadline expired, part of `payload` may have been written.
+    """
+    if timeout is None or _MSG_DONTWAIT is None:
+        sock.sendall(payload)
+        if sent is not None:
+            sent(len(payload))
+        return
+    view = memoryview(payload)
+    deadline = time.time() + timeout
+    if hasattr(select, 'poll'):
+        # Unlike `select`, `poll` returns on a shutdown (POLLHUP): the
+        # link dropped by another thread
+        poller = select.poll()
+        poller.register(sock, select.POLLOUT)
+        wait = lambda t: poller.poll(t * 1000)
+    else:
+        wait = lambda t: select.select([], [sock], [sock], t)
+    while len(view):
+        try:
+            n = sock.send(view, _MSG_DONTWAIT)
+            view = view[n:]
+            if sent is not None:
+                sent(n)
+            if not len(view):
+                break
+        except (OSError, IOError) as e:
+            if e.errno not in (errno.EAGAIN, errno.EWOULDBLOCK):
+                raise
+        remaining = deadline - time.time()
+        if remaining <= 0:
+            raise socket.timeout('write timed out')
+        wait(remaining)
@@ -0,0 +1,340 @@
+# Copyright 2018 TomorrowData Srl
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Several applications sharing a single connection to the iottly agent.
+
+Every `IottlySDK` owns a unix socket and three threads. Processes hosting
+many logical applications can instead create one `AgentConnection` and a
+`IottlySession` for each application: sessions have the same API of
+`IottlySDK` (with their own command callbacks, status callbacks and
+buffer) but share the socket, the receiving and the sending threads.
+"""
+
+import time
+from collections import deque
+from threading import Condition
+try:
+    from queue import Empty
+except ImportError:
+    # python 2.7
+    from Queue import Empty
+
+from .iottly import IottlySDK, Msg
+
+
+class _SessionsBuffer(object):
+    """Queue-like view over the buffers of the attached sessions.
+
+    The sender thread of the connection consumes the sessions buffers in
+    round-robin, so that a chatty application can't starve the others.
+    Messages put directly in this buffer (handshake signals) take precedence.
+    """
+
+    def __init__(self, sessions):
+        self._cond = Condition()
+        self._control = deque()
+        # Shared with the AgentConnection, mutated under self._cond
+        self._sessions = sessions
+        self._next = 0
+        # Buffer of the last message returned by `get` (see `task_done`)
+        self._source = None
+        # Control messages not released yet (see `join`)
+        self._unfinished = 0
+        self._closed = False
+
+    def add(self, session):
+        with self._cond:
+            if session in self._sessions:
+                return False
+            self._sessions.append(session)
+            return True
+
+    def remove(self, session):
+        with self._cond:
+            if session not in self._sessions:
+                return False
+            self._sessions.remove(session)
+            return True
+
+    def sessions(self):
+        with self._cond:
+            return list(self._sessions)
+
+    def put(self, msg, block=True, timeout=None):
+        with self._cond:
+            self._control.append(msg)
+            self._unfinished += 1
+            self._cond.notify()
+
+    def notify(self):
+        """Wake the consumer after a session enqueued a message.
+        """
+        with self._cond:
+            self._cond.notify()
+
+    def get(self):
+        with self._cond:
+            while not self._closed:
+                if self._control:
+                    self._source = None
+                    return self._control.popleft()
+                n = len(self._sessions)
+                for i in range(n):
+                    session = self._sessions[(self._next + i) % n]
+                    try:
+                        msg = session._buffer.get(False)
+                    except Empty:
+                        continue
+                    self._next = (self._next + i + 1) % n
+                    self._source = session._buffer
+                    return msg
+                self._cond.wait()
+            return None
+
+    def task_done(self):
+        with self._cond:
+            source, self._source = self._source, None
+            if source is None:
+                self._unfinished -= 1
+                self._cond.notify_all()
+        if source is not None:
+            source.task_done()
+
+    def join(self, timeout=None):
+        """Wait for the control messages, then for the sessions buffers.
+        """
+        deadline = None if timeout is None else time.time() + timeout
+        with self._cond:
+            while self._unfinished and not self._closed:
+                remaining = None if deadline is None else deadline - time.time()
+                if remaining is not None and remaining <= 0:
+                    break
+                self._cond.wait(remaining)
+            pending = self._unfinished
+            sessions = list(self._sessions)
+        for session in sessions:
+            remaining = None if deadline is None else max(0, deadline - time.time())
+            pending += session._buffer.join(remaining)
+        return pending
+
+    def close(self):
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+
+    def empty(self):
+        with self._cond:
+            return not self._control and \
+                all(s._buffer.empty() for s in self._sessions)
+
+    def full(self):
+        # Sessions bound their own buffers
+        return False
+
+
+class IottlySession(IottlySDK):
+    """An application attached to a shared `AgentConnection`.
+
+    Sessions are created with `AgentConnection.session` and expose the
+    same API of `IottlySDK`: `start` attaches the session to the connection
+    and `stop` detaches it, without affecting the other sessions.
+    """
+
+    def __init__(self, connection, name, max_buffered_msgs=10,
+                 on_agent_status_changed=None,
+                 on_connection_status_changed=None):
+        self._connection = connection
+        IottlySDK.__init__(self, name,
+                           socket_path=connection._socket_path,
+                           transport=connection._transport,
+                           max_buffered_msgs=max_buffered_msgs,
+                           on_agent_status_changed=on_agent_status_changed,
+                           on_connection_status_changed=on_connection_status_changed)
+        self._app_stop_msg = \
+            '{{"signal": {{"sdkclient": {{"name": "{}", "status": "disconnected"}}}}}}\n'.format(self._name).encode()
+
+    @property
+    def _scheduler(self):
+        # Timers and periodic producers run on the wheel of the connection
+        return self._connection._scheduler
+
+    def _init_scheduler(self):
+        pass  # See `_scheduler`
+
+    def start(self):
+        """Attach the application to the shared connection.
+        """
+        self._connection._attach(self)
+
+    def stop(self, drain=False, timeout=2.0):
+        """Detach the application from the shared connection.
+
+        Keyword Args:
+            drain (`bool`):
+                write the buffered messages before detaching (see `flush`).
+            timeout (`float`):
+                the maximum time in seconds spent draining the buffer.
+
+        Returns:
+            `int`: the number of messages left in the buffer of the session.
+        """
+        for handle in list(self._periodic):
+            handle.cancel()
+        for batcher in self._batchers:
+            batcher.close()
+        # and the messages held by the aggregation windows
+        with self._config_lock:
+            if self._restore_timer is not None:
+                self._restore_timer.cancel()
+        for handle in self._channel_handles():
+            if handle._policy is not None:
+                handle._policy.close(handle._emit)
+        if self._handshake_timeout_timer:
+            self._handshake_timeout_timer.cancel()
+        self._errors.stop()
+        self._files.close()
+        if drain:
+            pending = self._buffer.join(timeout)
+        else:
+            pending = self._buffer.qsize()
+        self._connection._detach(self)
+        return pending
+
+    def _enqueue(self, msg):
+        IottlySDK._enqueue(self, msg)
+        self._connection._buffer.notify()
+
+    def _send_msg_through_socket(self, payload, framing=0, blocking=True):
+        self._connection._send_msg_through_socket(payload, framing, blocking)
+
+    def _set_linked(self, linked):
+        with self._connected_to_agent:
+            self._agent_linked = linked
+            self._connected_to_agent.notify_all()
+
+
+class AgentConnection(IottlySDK):
+    """Connection to the iottly agent shared by several applications.
+
+    The connection runs the same threads of a single `IottlySDK`
+    regardless of the number of attached sessions. On every (re)connection
+    each session performs its own handshake with the agent.
+
+    Signals from the agent are delivered to every session. Commands are
+    delivered to the session named in the optional `sdkclient` field of the
+    message, or to all the sessions when it is missing.
+
+    .. warning::
+        Requires an **iottly agent** serving several application names
+        on a single connection.
+
+    Keyword Args:
+        socket_path (`str`):
+            the path to the unix-socket exposed by the iottly agent.
+        transport (`Transport` or `str`, optional):
+            see `IottlySDK`.
+    """
+
+    def __init__(self,
+                 socket_path='/var/run/iottly.com-agent/sdk/iottly_sdk_socket',
+                 transport=None):
+        # Attached sessions (shared with the buffer view)
+        self._sessions = []
+        IottlySDK.__init__(self, 'iottly-connection', socket_path=socket_path,
+                           transport=transport)
+
+    def session(self, name, max_buffered_msgs=10,
+                on_agent_status_changed=None,
+                on_connection_status_changed=None):
+        """Create a new application session on this connection.
+
+        Args:
+            name (`str`):
+                an identifier for the connected application.
+
+        Keyword Args:
+            See `IottlySDK`.
+
+        Returns:
+            `IottlySession`: call its `start` to attach it.
+        """
+        return IottlySession(self, name, max_buffered_msgs,
+                             on_agent_status_changed,
+                             on_connection_status_changed)
+
+    def _init_runtime_state(self):
+        IottlySDK._init_runtime_state(self)
+        self._buffer = _SessionsBuffer(self._sessions)
+
+    def _attach(self, session):
+        if not self._buffer.add(session):
+            return
+        with self._connected_to_agent:
+            if self._agent_linked:
+                self._link_session(session)
+                session._handshake_timeout_timer = self._scheduler.call_later(
+                    1.0, session._invoke_initial_agent_status_changed_cb,
+                    timeout=True)
+
+    def _detach(self, session):
+        if not self._buffer.remove(session):
+            return
+        with self._connected_to_agent:
+            if self._agent_linked:
+                self._buffer.put(Msg(session._app_stop_msg, True, None))
+        session._set_linked(False)
+
+    def _link_session(self, session):
+        session._set_linked(True)
+        session._handshake_ended.clear()
+        self._buffer.put(Msg(session._app_start_msg, True, None))
+
+    def _on_agent_linked(self):
+        for session in self._buffer.sessions():
+            self._link_session(session)
+        # One timer completes the handshake of every session (agent < 1.8.0)
+        self._handshake_timeout_timer = self._scheduler.call_later(
+            1.0, self._invoke_initial_agent_status_changed_cb, timeout=True)
+
+    def _on_agent_unlinked(self):
+        for session in self._buffer.sessions():
+            session._set_linked(False)
+            session._on_agent_unlinked()
+
+    def _invoke_initial_agent_status_changed_cb(self, timeout=False):
+        self._handshake_timeout_timer = None
+        for session in self._buffer.sessions():
+            session._invoke_initial_agent_status_changed_cb(timeout=True)
+
+    def _dispatch_msg_from_agent(self, msg):
+        sessions = self._buffer.sessions()
+        if 'signal' in msg:
+            for session in sessions:
+                session._handle_signals_from_agent(msg['signal'])
+        elif 'data' in msg:
+            self._dispatch_cmds_from_agent([msg])
+
+    def _dispatch_cmds_from_agent(self, msgs):
+        for session in self._buffer.sessions():
+            cmds = []
+            for msg in msgs:
+                target = msg.get('sdkclient')
+                name = target.get('name') if isinstance(target, dict) else None
+                if name is None or session._name == name:
+                    cmds.append(msg['data'])
+            if cmds:
+                session._handle_cmds_from_agent(cmds)
+
+    def _coalescing(self):
+        return any(s._coalesced for s in self._buffer.sessions())
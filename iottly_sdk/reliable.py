@@ -0,0 +1,158 @@
+# Copyright 2018 TomorrowData Srl
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""At-least-once delivery of the data messages (reliable mode).
+
+In reliable mode every data message written to the agent carries a
+sequence number::
+
+    {"data": {"seq": 42, "sdkclient": {"name": "app"}, "payload": {...}}}
+
+and is kept in an `AckWindow` until the agent acknowledges it with a
+cumulative ack (every message up to `seq` has been forwarded)::
+
+    {"signal": {"sdkack": {"seq": 42}}}
+
+Up to `size` messages are in flight at the same time. After a
+reconnection the unacknowledged messages are written again with their
+sequence number, so the agent can discard the duplicates.
+"""
+
+import time
+from collections import deque
+from threading import Condition, Lock
+
+from .framing import JSON_LINES
+
+_DATA_HEAD = b'{"data": {'
+
+
+def sequence(frame, protocol, seq):
+    """Return `frame` (encoded with `protocol`) tagged with `seq`.
+    """
+    # memoryview.tobytes: bytes(view) is the repr of the view on Python 2
+    view = memoryview(frame)
+    head = len(_DATA_HEAD)
+    if protocol is JSON_LINES and view[:head].tobytes() == _DATA_HEAD:
+        # Splice the field in the envelope, the payload is not re-encoded
+        return b''.join((_DATA_HEAD, '"seq": {}, '.format(seq).encode(),
+                         view[head:].tobytes()))
+    msg = protocol.decode(protocol.framer.unframe(frame))
+    msg['data']['seq'] = seq
+    return protocol.encode(msg)
+
+
+class AckWindow(object):
+    """The data messages written (or to be written) but not acknowledged.
+
+    Entries are `(seq, framing, frame)` tuples in sequence order. The
+    window tracks the last sequence written on the current link: `rewind`
+    (on disconnection) makes every entry pending again.
+
+    Args:
+        size (`int`):
+            the maximum number of unacknowledged messages.
+    """
+
+    def __init__(self, size):
+        self.size = max(1, size)
+        self._cond = Condition(Lock())
+        self._frames = deque()
+        # Last sequence number assigned
+        self._seq = 0
+        # Last sequence number written on the current link
+        self._written = 0
+        # Incremented by `rewind`, see `written`
+        self.link = 0
+        self._closed = False
+
+    def __len__(self):
+        with self._cond:
+            return len(self._frames)
+
+    def add(self, payload, framing):
+        """Append a copy of the frame `payload`, waiting for room.
+
+        Returns False, without appending, if the window was rewound or
+        closed in the meantime: the pending entries must be written first.
+        """
+        with self._cond:
+            link = self.link
+            while len(self._frames) >= self.size:
+                if self._closed or self.link != link:
+                    return False
+                self._cond.wait()
+            if self._closed:
+                return False
+            self._seq += 1
+            self._frames.append((self._seq, framing,
+                                 memoryview(payload).tobytes()))
+            return True
+
+    def pending(self):
+        """Return the current link and the entries not written on it.
+        """
+        with self._cond:
+            # Sequence numbers in the window are contiguous: the pending
+            # entries are the last ones (cheap indexing at deque ends)
+            frames = self._frames
+            n = min(len(frames), self._seq - self._written)
+            return self.link, [frames[-i] for i in range(n, 0, -1)]
+
+    def written(self, seq, link):
+        """Record that the entry `seq` has been written on `link`.
+        """
+        with self._cond:
+            if link == self.link:
+                self._written = max(self._written, seq)
+
+    def ack(self, seq):
+        """Release the entries up to `seq` (included).
+        """
+        with self._cond:
+            frames = self._frames
+            while frames and frames[0][0] <= seq:
+                frames.popleft()
+            self._cond.notify_all()
+
+    def rewind(self):
+        """The link was lost: every entry has to be written again.
+        """
+        with self._cond:
+            self._written = self._frames[0][0] - 1 if self._frames else self._seq
+            self.link += 1
+            self._cond.notify_all()
+
+    def join(self, timeout=None):
+        """Wait until every entry is acknowledged (or the window is closed).
+
+        Returns:
+            `int`: the entries not acknowledged yet.
+        """
+        deadline = None if timeout is None else time.time() + timeout
+        with self._cond:
+            while self._frames and not self._closed:
+                if deadline is None:
+                    self._cond.wait()
+                    continue
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    break
+                self._cond.wait(remaining)
+            return len(self._frames)
+
+    def close(self):
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
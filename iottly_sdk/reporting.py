@@ -0,0 +1,142 @@
+# Copyright 2018 TomorrowData Srl
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Aggregated reports of the exceptions raised by the user callbacks.
+
+Exceptions with the same type, message and callback are counted in a
+single report::
+
+    {"signal": {"sdkclient": {"name": "app", "error": {
+        "type": "ValueError", "msg": "bad value", "callback": "on_cmd",
+        "count": 250, "first_ts": 1546300800.0, "last_ts": 1546300802.5,
+        "traceback": "..."}}}}
+
+The first report is sent at once, then the reports are sent at most every
+`interval` seconds. Reports don't go through the buffer of the data
+messages: they are written to the agent by a timer of the SDK, and kept
+(aggregated) while the SDK is disconnected.
+"""
+
+import json
+import sys
+import time
+import traceback
+from collections import OrderedDict
+from threading import Lock
+
+# The last characters of the traceback are sent (the raising frame)
+MAX_TRACEBACK_CHARS = 2048
+
+
+class ErrorReporter(object):
+    """Deduplicate, aggregate and rate-limit the error reports of a SDK.
+
+    Args:
+        sdk (`IottlySDK`):
+            the SDK sending the reports.
+
+    Keyword Args:
+        interval (`float`):
+            the minimum time in seconds between two batches of reports.
+        max_reports (`int`):
+            the maximum number of reports sent in a batch; the others are
+            kept for the next one.
+        max_pending (`int`):
+            the maximum number of distinct pending reports; further
+            distinct errors are only counted in `dropped`.
+    """
+
+    def __init__(self, sdk, interval=10.0, max_reports=10, max_pending=100):
+        self._sdk = sdk
+        self.interval = interval
+        self.max_reports = max_reports
+        self.max_pending = max_pending
+        self._lock = Lock()
+        # (type, msg, callback) -> report dict
+        self._pending = OrderedDict()
+        self._timer = None
+        self._stopped = False
+        # Distinct errors discarded because too many were pending
+        self.dropped = 0
+
+    def report(self, exc, callback):
+        """Record `exc` raised by `callback` (call it in the `except` block).
+        """
+        now = time.time()
+        key = (exc.__class__.__name__, str(exc), callback)
+        with self._lock:
+            report = self._pending.get(key)
+            if report is not None:
+                report['count'] += 1
+                report['last_ts'] = now
+                return
+            if len(self._pending) >= self.max_pending:
+                self.dropped += 1
+                return
+            # Format the traceback once per distinct error
+            tb = ''.join(traceback.format_exception(*sys.exc_info()))
+            self._pending[key] = {
+                'type': key[0],
+                'msg': key[1],
+                'callback': callback,
+                'count': 1,
+                'first_ts': now,
+                'last_ts': now,
+                'traceback': tb[-MAX_TRACEBACK_CHARS:],
+            }
+            if self._timer is None and not self._stopped:
+                # Idle: send at once, then throttle
+                self._start_timer(0)
+
+    def stop(self):
+        """Cancel the pending batch (reports are discarded).
+        """
+        with self._lock:
+            self._stopped = True
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+
+    def _start_timer(self, delay):
+        self._timer = self._sdk._scheduler.call_later(delay, self._send_reports)
+
+    def _send_reports(self):
+        with self._lock:
+            keys = list(self._pending)[:self.max_reports]
+            reports = [self._pending.pop(k) for k in keys]
+        sent = 0
+        for report in reports:
+            try:
+                self._sdk._send_msg_through_socket(
+                    self._sdk._err_msg.format(json.dumps(report)).encode())
+            except (OSError, IOError):
+                break  # Disconnected: retry with the next batch
+            sent += 1
+        with self._lock:
+            # Put back in front what could not be sent, merging the
+            # occurrences recorded in the meantime
+            pending = OrderedDict()
+            for key, report in zip(keys[sent:], reports[sent:]):
+                newer = self._pending.pop(key, None)
+                if newer is not None:
+                    report['count'] += newer['count']
+                    report['last_ts'] = newer['last_ts']
+                pending[key] = report
+            pending.update(self._pending)
+            self._pending = pending
+            if (sent or pending) and not self._stopped:
+                # Keep throttling for an interval after a batch
+                self._start_timer(self.interval)
+            else:
+                self._timer = None
@@ -0,0 +1,329 @@
+# Copyright 2018 TomorrowData Srl
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Timers of the SDK on a single thread (see `IottlySDK.every`).
+
+A `Scheduler` keeps its timers in a hierarchical timer wheel: `levels`
+wheels of `slots` buckets, each bucket of a level spanning a whole
+rotation of the level below. Adding and cancelling a timer is O(1)
+whatever their number; a timer is moved to a lower level at most
+`levels - 1` times before firing. The wheel thread sleeps until the next
+non-empty bucket (or level change), so idle timers cost no wake-ups.
+
+Expired timers run on a worker thread: their callbacks must be quick
+(the timers of the SDK). Periodic timers added with `pool` (the producers
+of `IottlySDK.every`) run on a small pool of workers instead, so a slow
+producer delays neither the other producers nor the timers of the SDK.
+Periodic timers are scheduled on a fixed grid (`start + k * interval`),
+so they don't drift; a run still executing when the next one is due is
+skipped, not queued.
+"""
+
+import math
+import random
+import time
+from threading import Condition, Lock, Thread, current_thread
+
+from six.moves import queue
+
+# Monotonic clock where available (Python 3)
+_clock = getattr(time, 'monotonic', time.time)
+
+
+class TimerHandle(object):
+    """A timer of a `Scheduler`, returned by `call_later` and `every`.
+
+    Attributes:
+        skipped (`int`):
+            the runs of a periodic timer skipped because the previous
+            run was still executing.
+    """
+
+    def __init__(self, scheduler, fn, deadline, interval=None, jitter=0.0,
+                 pool=False):
+        self._scheduler = scheduler
+        self._fn = fn
+        self.deadline = deadline
+        self.interval = interval
+        self.jitter = jitter
+        self.pool = pool
+        # Periodic timers: the grid origin and the next run index
+        self._origin = deadline
+        self._runs = 0
+        self._running = False
+        self.cancelled = False
+        self.skipped = 0
+        # Bucket of the wheel holding the timer (None: not in the wheel)
+        self._bucket = None
+        # Called with the handle by `cancel` (eg. to forget the timer)
+        self._on_cancel = None
+
+    def cancel(self):
+        """Stop the timer (a running callback is not interrupted).
+        """
+        self._scheduler._cancel(self)
+        if self._on_cancel is not None:
+            self._on_cancel(self)
+
+    def _next(self):
+        # Drift-free: the runs are on the grid, the jitter doesn't add up
+        self._runs += 1
+        self.deadline = self._origin + self._runs * self.interval
+        if self.jitter:
+            self.deadline += random.uniform(0, self.jitter)
+
+
+class Scheduler(object):
+    """Run callbacks after a delay or periodically, on a timer wheel.
+
+    The wheel thread is started with the first timer, the workers when the
+    first timer expires; `stop` stops them.
+
+    Keyword Args:
+        resolution (`float`):
+            the duration in seconds of a tick of the wheel: timers fire
+            at most `resolution` seconds late.
+        workers (`int`):
+            the threads of the pool, running the callbacks of the periodic
+            timers added with `pool`.
+        slots (`int`):
+            the buckets of each level of the wheel.
+        levels (`int`):
+            the levels of the wheel; with the defaults the wheel spans
+            about 46 hours (longer delays are cascaded again).
+    """
+
+    def __init__(self, resolution=0.01, workers=2, slots=64, levels=4):
+        self.resolution = resolution
+        self.slots = slots
+        self.levels = levels
+        self._n_workers = workers
+        self._cond = Condition(Lock())
+        self._wheels = [[set() for _ in range(slots)] for _ in range(levels)]
+        self._origin = None
+        # The last tick processed
+        self._tick = 0
+        self._count = 0
+        # The callbacks for the worker and for the pool
+        self._tasks = queue.Queue()
+        self._pool_tasks = queue.Queue()
+        self._wheel_t = None
+        self._worker_t = None
+        self._pool = []
+        self._stopped = False
+
+    def __len__(self):
+        with self._cond:
+            return self._count
+
+    def call_later(self, delay, fn, *args, **kwargs):
+        """Call `fn(*args, **kwargs)` in `delay` seconds.
+
+        Returns:
+            `TimerHandle`: call its `cancel` to stop the timer.
+        """
+        return self._add(TimerHandle(self, lambda: fn(*args, **kwargs),
+                                     _clock() + delay))
+
+    def every(self, interval, fn, jitter=0.0, delay=None, pool=False):
+        """Call `fn()` every `interval` seconds.
+
+        Keyword Args:
+            jitter (`float`):
+                a random delay, up to `jitter` seconds, added to every run
+                (eg. to spread the load of many devices).
+            delay (`float`):
+                the delay of the first run. Default to `interval`.
+            pool (`bool`):
+                run `fn` on the pool of workers (`fn` may be slow).
+
+        Returns:
+            `TimerHandle`: call its `cancel` to stop the timer.
+        """
+        if interval <= 0:
+            raise ValueError('interval must be positive.')
+        handle = TimerHandle(self, fn, _clock() + (interval if delay is None else delay),
+                             interval, jitter, pool)
+        if jitter:
+            handle.deadline += random.uniform(0, jitter)
+        return self._add(handle)
+
+    def stop(self, timeout=2.0):
+        """Cancel every timer and stop the threads.
+
+        Callbacks already running are waited for up to `timeout` seconds.
+        """
+        with self._cond:
+            if self._stopped:
+                return
+            self._stopped = True
+            self._wheels = [[set() for _ in range(self.slots)]
+                            for _ in range(self.levels)]
+            self._count = 0
+            self._cond.notify()
+            threads = [self._wheel_t, self._worker_t] + self._pool
+        if self._worker_t is not None:
+            self._tasks.put(None)
+        for _ in self._pool:
+            self._pool_tasks.put(None)
+        deadline = time.time() + timeout
+        for t in threads:
+            if t is not None and t is not current_thread():  # Stopped by a callback
+                t.join(max(0, deadline - time.time()))
+
+    def _add(self, handle):
+        with self._cond:
+            if self._stopped:
+                handle.cancelled = True
+                return handle
+            if self._wheel_t is None:
+                self._start()
+            self._insert(handle)
+            self._cond.notify()
+        return handle
+
+    def _cancel(self, handle):
+        with self._cond:
+            handle.cancelled = True
+            if handle._bucket is not None:
+                handle._bucket.discard(handle)
+                handle._bucket = None
+                self._count -= 1
+
+    def _start(self):
+        self._origin = _clock()
+        self._tick = 0
+        self._wheel_t = self._spawn(self._run_wheel, 'timer_wheel_t')
+
+    def _spawn(self, target, name, *args):
+        t = Thread(target=target, name=name, args=args)
+        t.daemon = True
+        t.start()
+        return t
+
+    def _insert(self, handle, earliest=None):
+        # Called holding the lock: the timer fires at the first tick not
+        # before its deadline (and after the current one, by default)
+        if earliest is None:
+            earliest = self._tick + 1
+        tick = max(earliest, int(math.ceil(
+            (handle.deadline - self._origin) / self.resolution)))
+        delta = tick - self._tick
+        span = self.slots
+        level = 0
+        while delta >= span and level < self.levels - 1:
+            span *= self.slots
+            level += 1
+        if delta >= span:
+            # Beyond the wheel: park in the farthest bucket, cascaded again
+            tick = self._tick + span - 1
+        bucket = self._wheels[level][(tick // (span // self.slots)) % self.slots]
+        bucket.add(handle)
+        handle._bucket = bucket
+        self._count += 1
+
+    def _next_tick(self):
+        # The next tick with work: a non-empty bucket of level 0 or the
+        # cascade of the upper levels at the end of the rotation
+        wheel = self._wheels[0]
+        for tick in range(self._tick + 1, self._tick + self.slots + 1):
+            if tick % self.slots == 0 or wheel[tick % self.slots]:
+                return tick
+        return self._tick + self.slots
+
+    def _run_wheel(self):
+        with self._cond:
+            while not self._stopped:
+                if not self._count:
+                    self._cond.wait()
+                    continue
+                tick = self._next_tick()
+                wait = self._origin + tick * self.resolution - _clock()
+                if wait > 0:
+                    # New timers may need an earlier wake-up
+                    self._cond.wait(wait)
+                    continue
+                self._advance(int((_clock() - self._origin) / self.resolution))
+
+    def _advance(self, now):
+        # Process the ticks up to `now`, holding the lock
+        wheels = self._wheels
+        slots = self.slots
+        due = []
+        pooled = []
+        while self._tick < now:
+            tick = self._next_tick()
+            if tick > now:
+                self._tick = now
+                break
+            self._tick = tick
+            # Move the timers of the upper levels entering the range below
+            span = 1
+            for level in range(1, self.levels):
+                span *= slots
+                if tick % span:
+                    break
+                i = (tick // span) % slots
+                bucket, wheels[level][i] = wheels[level][i], set()
+                self._count -= len(bucket)
+                for handle in bucket:
+                    self._insert(handle, earliest=tick)
+            bucket, wheels[0][tick % slots] = wheels[0][tick % slots], set()
+            self._count -= len(bucket)
+            for handle in bucket:
+                handle._bucket = None
+                self._fire(handle, pooled if handle.pool else due)
+        if due:
+            if self._worker_t is None:
+                # Workers start with the first expired timer
+                self._worker_t = self._spawn(self._run_tasks, 'timer_worker_t',
+                                             self._tasks)
+            self._tasks.put(due)
+        if pooled:
+            if not self._pool:
+                for i in range(self._n_workers):
+                    self._pool.append(self._spawn(
+                        self._run_tasks, 'timer_pool_t{}'.format(i), self._pool_tasks))
+            # A batch per worker: one queue operation for many timers
+            n = len(self._pool)
+            size = -(-len(pooled) // n)
+            for i in range(0, len(pooled), size):
+                self._pool_tasks.put(pooled[i:i + size])
+
+    def _fire(self, handle, due):
+        if handle.interval is None:
+            due.append(handle)
+            return
+        if handle._running:
+            handle.skipped += 1
+        else:
+            handle._running = True
+            due.append(handle)
+        handle._next()
+        self._insert(handle)
+
+    def _run_tasks(self, tasks):
+        while True:
+            batch = tasks.get()
+            if batch is None:
+                return
+            for handle in batch:
+                if handle.cancelled:
+                    continue
+                try:
+                    handle._fn()
+                except Exception:
+                    pass  # The SDK wraps the callbacks to report their errors
+                finally:
+                    handle._running = False
@@ -0,0 +1,117 @@
+# Copyright 2018 TomorrowData Srl
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import json
+from json.encoder import encode_basestring_ascii
+
+import six
+
+from .buffer import Msg
+
+_INFINITY = float('inf')
+
+
+def _format_float(v):
+    v = float(v)
+    if -_INFINITY < v < _INFINITY:
+        return repr(v)
+    if v != v:
+        return 'NaN'
+    return 'Infinity' if v > 0 else '-Infinity'
+
+
+def _format_int(v):
+    return str(int(v))
+
+
+def _format_bool(v):
+    return 'true' if v else 'false'
+
+
+def _format_str(v):
+    if not isinstance(v, six.string_types):
+        raise TypeError('expected a str but {} was given.'.format(type(v)))
+    return encode_basestring_ascii(v)
+
+
+# Field type -> JSON formatter (same output of `json.dumps`)
+_FORMATTERS = {
+    float: _format_float,
+    int: _format_int,
+    bool: _format_bool,
+    str: _format_str,
+}
+if six.PY2:
+    _FORMATTERS[long] = _format_int
+    _FORMATTERS[unicode] = _format_str
+
+
+class SchemaSender(object):
+    """Sender of fixed-shape messages, returned by `IottlySDK.register_schema`.
+
+    The JSON envelope of the message, field names included, is compiled
+    once in a template: `send` only formats the values.
+    """
+
+    def __init__(self, sdk, name, fields, channel=None):
+        self.name = name
+        self.channel = channel
+        self._sdk = sdk
+        self.fields = []
+        self._formatters = []
+        parts = []
+        for field, field_type in fields:
+            if not isinstance(field, six.string_types):
+                err = 'field names must be str but {} was given.'.format(type(field))
+                raise TypeError(err)
+            try:
+                self._formatters.append(_FORMATTERS[field_type])
+            except (KeyError, TypeError):
+                err = 'unsupported type {} for field {}.'.format(field_type, field)
+                raise TypeError(err)
+            self.fields.append(field)
+            parts.append(json.dumps(field).replace('%', '%%') + ': %s')
+        # Splice the payload template in the data envelope of the SDK
+        prefix, _, suffix = sdk._raw_msg(b'', channel)
+        # The payload within a message (see `max_message_bytes`)
+        self._payload = slice(len(prefix), -len(suffix))
+        self._template = '{}{{{}}}{}'.format(
+            prefix.decode().replace('%', '%%'), ', '.join(parts),
+            suffix.decode().replace('%', '%%'))
+        self._n = len(self.fields)
+
+    def send(self, *values):
+        """Sends a message with the given `values`, in the order of the fields.
+
+        Raises:
+            TypeError:
+                wrong number of values, or a value can't be converted to the
+                type of its field.
+            ValueError:
+                a value can't be converted to the type of its field.
+            MessageTooLarge:
+                the message exceeds `max_message_bytes` and the SDK rejects
+                the oversized messages.
+        """
+        if len(values) != self._n:
+            err = 'expected {} values but {} were given.'.format(self._n, len(values))
+            raise TypeError(err)
+        data = self._template % tuple(
+            [f(v) for f, v in zip(self._formatters, values)])
+        data = data.encode()
+        handle = self._sdk._channel_handle(self.channel)
+        if len(data) > handle._limit:
+            handle._send_oversized(data[self._payload])
+            return
+        handle._submit(Msg(payload=data, type=False, channel=self.channel), len(data))
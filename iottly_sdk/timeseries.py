@@ -0,0 +1,242 @@
+# Copyright 2018 TomorrowData Srl
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Columnar batching of high-rate sensor samples.
+
+Sending a message per sample repeats the keys and the envelope of every
+reading. A `TimeSeriesBatcher` accumulates the samples of each channel in
+columns (`array('d')`) and sends them as a single message::
+
+    {"ts": [1546300800.0, 1546300800.1], "temp": [21.5, 21.6]}
+"""
+
+import time
+from array import array
+from threading import Lock
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+# Estimated JSON size of a number in a column (repr of a double and `, `)
+_BYTES_PER_VALUE = 20
+
+
+def _extend(column, values):
+    if numpy is not None and isinstance(values, numpy.ndarray):
+        data = numpy.ascontiguousarray(values, dtype='d').tobytes()
+        try:
+            column.frombytes(data)
+        except AttributeError:
+            # python 2.7
+            column.fromstring(data)
+    else:
+        column.extend(array('d', values))
+
+
+class _Series(object):
+    """The columns of the samples of one channel.
+    """
+
+    def __init__(self, fields):
+        self.fields = fields
+        self.ts = array('d')
+        self.columns = [array('d') for _ in fields]
+
+    def __len__(self):
+        return len(self.ts)
+
+    def payload(self):
+        payload = {'ts': self.ts.tolist()}
+        for field, column in zip(self.fields, self.columns):
+            payload[field] = column.tolist()
+        return payload
+
+
+class TimeSeriesBatcher(object):
+    """Accumulate samples in columns and send them in batches.
+
+    Samples are grouped by channel. The batch of a channel is sent when
+    it holds `max_samples` samples, when its estimated JSON size reaches
+    `max_bytes` or `max_latency` seconds after its first sample, whichever
+    comes first. Pending batches are sent by `flush`, `close` and by
+    `IottlySDK.stop`.
+
+    All the samples of a batch have the same fields: a sample with
+    different fields sends the pending batch and starts a new one.
+
+    Args:
+        sdk (`IottlySDK`):
+            the SDK sending the batches.
+
+    Keyword Args:
+        max_samples (`int`):
+            the maximum number of samples in a batch.
+        max_bytes (`int`):
+            the maximum (estimated) size of a batch.
+        max_latency (`float`):
+            the maximum time in seconds a sample waits in a batch.
+    """
+
+    def __init__(self, sdk, max_samples=1000, max_bytes=64 * 1024,
+                 max_latency=1.0):
+        self._sdk = sdk
+        self.max_samples = max_samples
+        self.max_bytes = max_bytes
+        self.max_latency = max_latency
+        self._lock = Lock()
+        # channel -> _Series
+        self._series = {}
+        self._closed = False
+        sdk._batchers.append(self)
+
+    def add(self, sample, ts=None, channel=None):
+        """Add a sample to the batch of `channel`.
+
+        Args:
+            sample (`dict`):
+                the readings of the sample (field name -> number).
+            ts (`float`):
+                the timestamp of the sample. Default to `time.time()`.
+            channel (`str`):
+                The channel to which the batch will be forwarded.
+                Default to None
+
+        Raises:
+            TypeError:
+                `sample` is not a `dict` or it holds non-numeric values.
+        """
+        if not isinstance(sample, dict):
+            err = 'sample must be a dict but {} was given.'.format(type(sample))
+            raise TypeError(err)
+        # Validate the channel before accepting samples
+        self._sdk._channel_handle(channel)
+        if ts is None:
+            ts = time.time()
+        full = None
+        with self._lock:
+            series = self._series.get(channel)
+            same = series is not None and len(series.fields) == len(sample) and \
+                all(f in sample for f in series.fields)
+            fields = series.fields if same else tuple(sample)
+            # Convert first: on errors don't leave misaligned columns nor
+            # discard the pending batch
+            row = array('d', [sample[f] for f in fields])
+            if not same:
+                full = self._pop(channel)
+                series = self._new_series(channel, fields)
+            series.ts.append(ts)
+            for column, value in zip(series.columns, row):
+                column.append(value)
+            if self._is_full(series):
+                ready = self._pop(channel)
+            else:
+                ready = None
+        self._send(channel, full)
+        self._send(channel, ready)
+
+    def add_columns(self, ts, columns, channel=None):
+        """Add several samples at once.
+
+        Args:
+            ts (sequence or `numpy.ndarray`):
+                the timestamps of the samples.
+            columns (`dict`):
+                field name -> sequence (or `numpy.ndarray`) of the readings,
+                with the same length of `ts`.
+            channel (`str`):
+                The channel to which the batch will be forwarded.
+                Default to None
+
+        Raises:
+            ValueError:
+                the columns have different lengths.
+        """
+        if any(len(values) != len(ts) for values in columns.values()):
+            raise ValueError('ts and columns must have the same length.')
+        self._sdk._channel_handle(channel)
+        with self._lock:
+            pending = self._series.get(channel)
+            if pending is None or set(pending.fields) != set(columns):
+                full = self._pop(channel)
+                series = self._new_series(channel, tuple(columns))
+            else:
+                full = None
+                series = pending
+            n = len(series)
+            try:
+                _extend(series.ts, ts)
+                for field, column in zip(series.fields, series.columns):
+                    _extend(column, columns[field])
+            except (TypeError, ValueError):
+                # Realign the columns and keep the pending batch
+                for column in [series.ts] + series.columns:
+                    del column[n:]
+                if series is not pending:
+                    if pending is None:
+                        del self._series[channel]
+                    else:
+                        self._series[channel] = pending
+                raise
+            ready = self._pop(channel) if self._is_full(series) else None
+        self._send(channel, full)
+        self._send(channel, ready)
+
+    def flush(self):
+        """Send the pending batches of every channel.
+        """
+        with self._lock:
+            ready = [(channel, self._pop(channel)) for channel in list(self._series)]
+        for channel, series in ready:
+            self._send(channel, series)
+
+    def close(self):
+        """Send the pending batches and stop sending them on `max_latency`.
+        """
+        with self._lock:
+            self._closed = True
+        self.flush()
+
+    def _new_series(self, channel, fields):
+        series = _Series(fields)
+        self._series[channel] = series
+        if not self._closed:
+            # A timer of the SDK sends the batch if still pending
+            self._sdk._scheduler.call_later(self.max_latency, self._expire,
+                                            channel, series)
+        return series
+
+    def _is_full(self, series):
+        n = len(series)
+        return n >= self.max_samples or \
+            n * (len(series.fields) + 1) * _BYTES_PER_VALUE >= self.max_bytes
+
+    def _pop(self, channel):
+        series = self._series.pop(channel, None)
+        if series is not None and len(series):
+            return series
+        return None
+
+    def _send(self, channel, series):
+        if series is not None:
+            self._sdk._channel_handle(channel)._send(series.payload())
+
+    def _expire(self, channel, series):
+        # Send `series`, `max_latency` after its first sample
+        with self._lock:
+            if self._closed or self._series.get(channel) is not series:
+                return  # Already sent
+            ready = self._pop(channel)
+        self._send(channel, ready)
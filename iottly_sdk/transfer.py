@@ -0,0 +1,422 @@
+# Copyright 2018 TomorrowData Srl
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Streaming upload and download of files as sequenced chunk messages.
+
+A file sent with `IottlySDK.send_file` is split in chunks, each sent as a
+data message whose payload is::
+
+    {"file": {"id": "3f2a...", "name": "snapshot.jpg", "size": 1048576,
+              "chunk": 0, "chunks": 22, "offset": 0, "data": "<base64>"}}
+
+The last chunk also carries the `sha256` of the whole file. Receivers
+reassemble the file writing every `data` at its `offset` (chunks may be
+received more than once after a reconnection).
+
+The file is memory-mapped and chunks are encoded one at a time, straight
+from the mapping to the socket: they don't go through the SDK buffer, so
+neither the file nor its encoding are ever held in memory. When the link
+with the agent is lost the transfer pauses, and resumes from the first
+chunk not written once the SDK is connected again.
+
+Large commands are received the same way, as a stream of commands of the
+reserved type `sdkfile`::
+
+    {"sdkfile": {"cmd": "firmware", "id": "9c1e...", "name": "fw.bin",
+                 "size": 1048576, "chunk": 0, "chunks": 22, "offset": 0,
+                 "data": "<base64>"}}
+
+Chunks are written at their offset in a file preallocated in the
+download directory, so only a chunk at a time is held in memory. When
+every chunk is received (and the `sha256`, carried by any chunk, matches)
+the callback of `cmd` is invoked with the `params` (optional, in any
+chunk) and the `file` received::
+
+    {"version": "2.1", "file": {"path": "/tmp/iottly_x8a1.part",
+     "name": "fw.bin", "size": 1048576, "sha256": "e3b0..."}}
+
+The file is removed when the callback returns, unless it was moved.
+Every chunk but the last is of the same size: a header whose `chunks`
+doesn't match the `size` of the file is rejected, as well as files
+larger than `max_download_bytes` or beyond the `max_downloads` received
+at the same time (see `IottlySDK`). After a reconnection the SDK reports the first chunk it is missing for
+every incomplete file, and the sender resumes from there.
+"""
+
+import base64
+import hashlib
+import json
+import mmap
+import os
+import sys
+import tempfile
+import threading
+import time
+import uuid
+
+import six
+
+from .errors import MessageTooLarge
+
+# 48 KiB of data: 64 KiB of base64
+DEFAULT_CHUNK_SIZE = 48 * 1024
+
+# Reserved command type of the chunks of the received files
+FILE_CMD = 'sdkfile'
+# The payload of a chunk around its header and data
+_CHUNK_FRAMING = (b'{"file": ', b', "data": "', b'"}}')
+# Incomplete received files not updated for this long are discarded
+FILE_IDLE_TIMEOUT = 3600.0
+# Limits of the received files (see `FileReceiver`)
+DEFAULT_MAX_DOWNLOAD_BYTES = 1024 * 1024 * 1024
+DEFAULT_MAX_DOWNLOADS = 4
+
+
+class FileTransfer(object):
+    """A file being sent by `IottlySDK.send_file`.
+
+    Attributes:
+        id (`str`):
+            the transfer identifier, in every chunk.
+        size (`int`):
+            the size of the file in bytes.
+        chunks (`int`):
+            the number of chunks.
+        sent (`int`):
+            the chunks written to the agent so far.
+        error (`Exception`):
+            the error that aborted the transfer (None if none).
+    """
+
+    def __init__(self, sdk, path, channel=None, chunk_size=DEFAULT_CHUNK_SIZE,
+                 name=None):
+        if chunk_size < 1:
+            raise ValueError('chunk_size must be positive.')
+        self._sdk = sdk
+        self._handle = sdk._channel_handle(channel)
+        self._file = open(path, 'rb')
+        self.id = uuid.uuid4().hex
+        self.name = name or os.path.basename(path)
+        self.size = os.fstat(self._file.fileno()).st_size
+        self.chunk_size = min(chunk_size, self._max_chunk_size())
+        self.chunks = max(1, -(-self.size // self.chunk_size))
+        self.sent = 0
+        self.error = None
+        self._sha256 = hashlib.sha256()
+        self._cancelled = threading.Event()
+        self._done = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='file_t')
+        self._thread.daemon = True
+
+    def start(self):
+        self._thread.start()
+
+    def _max_chunk_size(self):
+        # The largest chunk whose message fits `max_message_bytes`
+        handle = self._handle
+        if handle._limit == sys.maxsize:
+            return sys.maxsize
+        # The longest header: the last chunk, with the digest
+        head = json.dumps({'id': self.id, 'name': self.name, 'size': self.size,
+                           'chunks': self.size, 'chunk': self.size,
+                           'offset': self.size, 'sha256': '0' * 64})
+        room = handle._limit - handle._envelope - len(head) - \
+            sum(len(b) for b in _CHUNK_FRAMING)
+        if room < 4:
+            self._file.close()
+            raise MessageTooLarge('max_message_bytes ({}) leaves no room for the '
+                                  'chunks of {}.'.format(handle._limit, self.name))
+        return room // 4 * 3
+
+    def wait(self, timeout=None):
+        """Wait for the end of the transfer.
+
+        Returns:
+            `bool`: True if every chunk has been written.
+        """
+        self._done.wait(timeout)
+        return self.sent == self.chunks
+
+    def cancel(self):
+        """Stop the transfer after the chunk being written (if any).
+        """
+        self._cancelled.set()
+
+    @property
+    def done(self):
+        return self._done.is_set()
+
+    def _run(self):
+        try:
+            if self.size:
+                data = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+            else:
+                data = b''  # Empty files can't be mapped
+            try:
+                self._send_chunks(data)
+            finally:
+                if self.size:
+                    data.close()
+        except Exception as e:
+            self.error = e
+        finally:
+            self._file.close()
+            self._done.set()
+
+    def _send_chunks(self, data):
+        header = {'id': self.id, 'name': self.name, 'size': self.size,
+                  'chunks': self.chunks}
+        while self.sent < self.chunks:
+            if not self._wait_for_link():
+                return
+            k = self.sent
+            offset = k * self.chunk_size
+            # Only the chunk is read from the mapping
+            chunk = data[offset:offset + self.chunk_size]
+            header['chunk'] = k
+            header['offset'] = offset
+            sha256 = self._sha256.copy()
+            sha256.update(chunk)
+            if k == self.chunks - 1:
+                header['sha256'] = sha256.hexdigest()
+            head = json.dumps(header).encode()
+            frame = b''.join((
+                self._handle._prefix, _CHUNK_FRAMING[0], head[:-1], _CHUNK_FRAMING[1],
+                base64.b64encode(chunk), _CHUNK_FRAMING[2], self._handle._suffix))
+            try:
+                self._sdk._send_msg_through_socket(frame)
+            except (OSError, IOError):
+                # Disconnected: write the chunk again on the next link
+                self._cancelled.wait(0.05)
+                continue
+            self._sha256 = sha256
+            self._handle._count(len(frame))
+            self.sent += 1
+
+    def _wait_for_link(self):
+        # Wait for a link whose handshake is complete, unless cancelled
+        sdk = self._sdk
+        while not (self._cancelled.is_set() or sdk._sdk_stopped.is_set()):
+            with sdk._connected_to_agent:
+                if not sdk._agent_linked:
+                    sdk._connected_to_agent.wait(0.5)
+                    continue
+            if sdk._handshake_ended.wait(0.5):
+                return True
+        return False
+
+
+class _Download(object):
+    # A file being received: the chunks are written in place
+
+    def __init__(self, header, chunk_size, directory):
+        self.cmd = header['cmd']
+        self.name = header.get('name') or header['id']
+        self.size = header['size']
+        self.chunk_size = chunk_size
+        self.sha256 = None
+        self.params = {}
+        self.received = bytearray(header['chunks'])
+        self.missing = header['chunks']
+        fd, self.path = tempfile.mkstemp(prefix='iottly_', suffix='.part',
+                                         dir=directory)
+        self._file = os.fdopen(fd, 'r+b')
+        # Reserve the size upfront (sparse where supported)
+        self._file.truncate(self.size)
+        self.updated = time.time()
+
+    def write(self, chunk, offset, data):
+        if self.received[chunk]:
+            return  # Sent again after a reconnection
+        self._file.seek(offset)
+        self._file.write(data)
+        self.received[chunk] = 1
+        self.missing -= 1
+        self.updated = time.time()
+
+    def next_chunk(self):
+        return self.received.find(b'\x00')
+
+    def verify(self):
+        self._file.flush()
+        if self.sha256 is None:
+            return True
+        digest = hashlib.sha256()
+        self._file.seek(0)
+        for block in iter(lambda: self._file.read(DEFAULT_CHUNK_SIZE), b''):
+            digest.update(block)
+        return digest.hexdigest() == self.sha256
+
+    def close(self):
+        self._file.close()
+
+    def discard(self):
+        self._file.close()
+        try:
+            os.remove(self.path)
+        except OSError:
+            pass
+
+
+def _check_chunk(header):
+    if not isinstance(header, dict):
+        raise TypeError('{} must be a dict.'.format(FILE_CMD))
+    for key, types in (('cmd', six.string_types), ('id', six.string_types),
+                       ('data', six.string_types), ('size', six.integer_types),
+                       ('chunks', six.integer_types), ('chunk', six.integer_types),
+                       ('offset', six.integer_types)):
+        if not isinstance(header.get(key), types) or \
+                isinstance(header.get(key), bool):
+            raise TypeError('{}.{} is missing or of wrong type.'.format(FILE_CMD, key))
+    if header['size'] < 0 or header['chunks'] < 1 or \
+            not 0 <= header['chunk'] < header['chunks'] or \
+            not 0 <= header['offset'] <= header['size']:
+        raise ValueError('{} chunk {} out of range.'.format(FILE_CMD, header['chunk']))
+
+
+def _chunk_size(header, n):
+    # The chunk size of the file implied by a chunk of `n` bytes: every
+    # chunk but the last is full, so `chunks` follows from the size
+    size, chunks, chunk, offset = (header['size'], header['chunks'],
+                                   header['chunk'], header['offset'])
+    if chunks == 1:
+        chunk_size = size
+    elif chunk < chunks - 1:
+        chunk_size = n
+    else:
+        chunk_size = offset // chunk
+    expected = -(-size // chunk_size) if chunk_size else 1
+    last = chunk == chunks - 1
+    if chunks != max(1, expected) or offset != chunk * chunk_size or \
+            (offset + n != size if last else n != chunk_size):
+        raise ValueError('{} chunk {} doesn\'t match a file of {} bytes in {} chunks.'.format(
+            FILE_CMD, chunk, size, chunks))
+    return chunk_size
+
+
+class FileReceiver(object):
+    """Reassemble the files received as `sdkfile` chunks.
+
+    Chunks are handled by the receiver thread of the SDK: `feed` writes
+    the chunk and, on the last one, dispatches the command of the file.
+
+    Args:
+        sdk (`IottlySDK`):
+            the SDK receiving the chunks.
+        directory (`str`, optional):
+            where the files are written, the system temporary directory
+            by default.
+        max_bytes (`int`):
+            the size of the largest file accepted.
+        max_files (`int`):
+            the incomplete files received at the same time.
+    """
+
+    def __init__(self, sdk, directory=None, max_bytes=DEFAULT_MAX_DOWNLOAD_BYTES,
+                 max_files=DEFAULT_MAX_DOWNLOADS):
+        self._sdk = sdk
+        self._directory = directory
+        self._max_bytes = max_bytes
+        self._max_files = max_files
+        # id -> _Download
+        self._downloads = {}
+        self._lock = threading.Lock()
+
+    def feed(self, header):
+        """Write a chunk, dispatching the command of a complete file.
+
+        Raises:
+            TypeError, ValueError:
+                the chunk is malformed or doesn't fit its file.
+        """
+        _check_chunk(header)
+        if six.PY3:
+            data = base64.b64decode(header['data'], validate=True)
+        else:
+            data = base64.b64decode(header['data'])
+        if header['size'] > self._max_bytes:
+            raise ValueError('{} of {} bytes exceeds max_download_bytes ({}).'.format(
+                FILE_CMD, header['size'], self._max_bytes))
+        chunk_size = _chunk_size(header, len(data))
+        with self._lock:
+            self._expire()
+            download = self._downloads.get(header['id'])
+            if download is None:
+                if len(self._downloads) >= self._max_files:
+                    raise ValueError('{} {}: already receiving max_downloads ({}) files.'.format(
+                        FILE_CMD, header['id'], self._max_files))
+                download = _Download(header, chunk_size, self._directory)
+                self._downloads[header['id']] = download
+            elif download.size != header['size'] or \
+                    len(download.received) != header['chunks'] or \
+                    download.chunk_size != chunk_size:
+                raise ValueError('{} chunk {} of a different file.'.format(
+                    FILE_CMD, header['chunk']))
+            download.write(header['chunk'], header['offset'], data)
+            if header.get('sha256'):
+                download.sha256 = header['sha256']
+            if isinstance(header.get('params'), dict):
+                download.params.update(header['params'])
+            if download.missing:
+                return
+            del self._downloads[header['id']]
+        self._complete(header['id'], download)
+
+    def _complete(self, file_id, download):
+        if not download.verify():
+            download.discard()
+            self._signal(file_id, status='corrupted')
+            raise ValueError('{} {}: sha256 mismatch.'.format(FILE_CMD, file_id))
+        download.close()
+        self._signal(file_id, status='complete')
+        params = dict(download.params)
+        params['file'] = {'path': download.path, 'name': download.name,
+                          'size': download.size, 'sha256': download.sha256}
+        try:
+            self._sdk._handle_cmd_from_agent({download.cmd: params})
+        finally:
+            # Files moved by the callback are kept
+            if os.path.exists(download.path):
+                os.remove(download.path)
+
+    def resume(self):
+        """Ask the sender for the missing chunks, after a reconnection.
+        """
+        with self._lock:
+            pending = [(k, d.next_chunk()) for k, d in self._downloads.items()]
+        for file_id, chunk in pending:
+            self._signal(file_id, next=chunk)
+
+    def _signal(self, file_id, **status):
+        status['id'] = file_id
+        try:
+            self._sdk._send_msg_through_socket(
+                self._sdk._file_msg.format(json.dumps(status)).encode())
+        except (OSError, IOError):
+            pass  # Reported again by `resume` on the next link
+
+    def _expire(self):
+        deadline = time.time() - FILE_IDLE_TIMEOUT
+        for file_id, download in list(self._downloads.items()):
+            if download.updated < deadline:
+                download.discard()
+                del self._downloads[file_id]
+
+    def close(self):
+        """Discard the incomplete files.
+        """
+        with self._lock:
+            for download in self._downloads.values():
+                download.discard()
+            self._downloads.clear()
@@ -0,0 +1,240 @@
+# Copyright 2018 TomorrowData Srl
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Transports between the SDK and the iottly agent.
+
+By default the SDK connects to the unix stream socket `socket_path`. The
+`transport` argument of `IottlySDK` selects another one, as an instance
+or as a string::
+
+    IottlySDK('app', transport='tcp:agent:8765')
+
+- `'unix:/path'` (or a plain path): unix stream socket.
+- `'seqpacket:/path'`: unix socket preserving the message boundaries.
+  Messages can't exceed the socket buffer: the default
+  `max_message_bytes` of the SDK becomes 128 KiB.
+- `'unix:@name'` and `'seqpacket:@name'`: sockets in the Linux abstract
+  namespace, without a file.
+- `'tcp:host:port'`: TCP, eg. an agent in a sibling container.
+
+`LoopbackTransport` connects the SDK to an agent in the same process
+through a `socketpair`, for tests and benchmarks.
+
+Every transport also provides the agent side: `listen` returns an object
+whose `accept` returns the socket of the next SDK connection.
+"""
+
+import os
+import socket
+import threading
+
+import six
+
+try:
+    import queue
+except ImportError:  # Python 2
+    import Queue as queue
+
+_SOCK_SEQPACKET = getattr(socket, 'SOCK_SEQPACKET', None)
+
+
+class Transport(object):
+    """How the SDK reaches the iottly agent.
+
+    Attributes:
+        recv_size (`int`):
+            the bytes read from the socket at a time.
+        max_message_bytes (`int`):
+            the largest message the transport can carry (None: no limit).
+    """
+    recv_size = 4096
+    max_message_bytes = None
+
+    def connect(self):
+        """Return a socket connected to the agent.
+
+        Raises:
+            socket.error:
+                the agent is not reachable.
+        """
+        raise NotImplementedError
+
+    def listen(self, backlog=1):
+        """Return the listening socket of the agent side.
+        """
+        raise NotImplementedError
+
+    def cleanup(self):
+        """Release the resources of `listen` (eg. the socket file).
+        """
+
+
+class UnixTransport(Transport):
+    """Unix socket at `path` (`@name`: in the abstract namespace).
+
+    Keyword Args:
+        seqpacket (`bool`):
+            use a `SOCK_SEQPACKET` socket. Default to False: a stream.
+    """
+
+    def __init__(self, path, seqpacket=False):
+        if seqpacket and _SOCK_SEQPACKET is None:
+            raise ValueError('SOCK_SEQPACKET is not available.')
+        self.path = path
+        self.seqpacket = seqpacket
+        self._type = _SOCK_SEQPACKET if seqpacket else socket.SOCK_STREAM
+        if path.startswith('@'):
+            self._address = '\0' + path[1:]
+        else:
+            self._address = path
+        if seqpacket:
+            # A message per read: room for the largest one
+            self.recv_size = 256 * 1024
+            self.max_message_bytes = 128 * 1024
+
+    def connect(self):
+        s = socket.socket(socket.AF_UNIX, self._type)
+        try:
+            s.connect(self._address)
+        except (OSError, IOError):
+            s.close()
+            raise
+        return s
+
+    def listen(self, backlog=1):
+        s = socket.socket(socket.AF_UNIX, self._type)
+        s.bind(self._address)
+        s.listen(backlog)
+        return s
+
+    def cleanup(self):
+        if not self.path.startswith('@'):
+            try:
+                os.unlink(self.path)
+            except OSError:
+                pass
+
+    def __repr__(self):
+        return '{}:{}'.format('seqpacket' if self.seqpacket else 'unix', self.path)
+
+
+class TcpTransport(Transport):
+    """TCP connection to `host`:`port`.
+
+    `listen` on port 0 picks a free port and updates `port`.
+    """
+
+    def __init__(self, host='127.0.0.1', port=0, timeout=2.0):
+        self.host = host
+        self.port = port
+        self.timeout = timeout
+
+    def connect(self):
+        s = socket.create_connection((self.host, self.port), self.timeout)
+        s.settimeout(None)
+        # Messages are written whole: don't wait to coalesce them
+        s.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        return s
+
+    def listen(self, backlog=1):
+        s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        s.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        s.bind((self.host, self.port))
+        s.listen(backlog)
+        self.port = s.getsockname()[1]
+        return s
+
+    def __repr__(self):
+        return 'tcp:{}:{}'.format(self.host, self.port)
+
+
+class _LoopbackListener(object):
+    # The agent end of the socket pairs created by `connect`
+
+    def __init__(self):
+        self._pending = queue.Queue()
+
+    def accept(self):
+        conn = self._pending.get()
+        if conn is None:
+            raise socket.error('listener closed')
+        return conn, None
+
+    def shutdown(self, how):
+        self.close()
+
+    def close(self):
+        self._pending.put(None)
+
+
+class LoopbackTransport(Transport):
+    """In-process connection through a `socketpair`.
+
+    The agent runs in the same process and serves the sockets returned by
+    the `accept` of `listen`, called before the SDK connects.
+    """
+
+    def __init__(self):
+        self._listener = None
+        self._lock = threading.Lock()
+
+    def connect(self):
+        with self._lock:
+            listener = self._listener
+        if listener is None:
+            raise socket.error('no loopback listener')
+        sdk_end, agent_end = socket.socketpair()
+        listener._pending.put(agent_end)
+        return sdk_end
+
+    def listen(self, backlog=1):
+        with self._lock:
+            self._listener = _LoopbackListener()
+            return self._listener
+
+    def cleanup(self):
+        with self._lock:
+            self._listener = None
+
+    def __repr__(self):
+        return 'loopback'
+
+
+def get_transport(spec):
+    """Return the `Transport` described by `spec` (see the module).
+
+    Raises:
+        TypeError:
+            `spec` is neither a `Transport` nor a `str`.
+        ValueError:
+            `spec` is not a valid transport.
+    """
+    if isinstance(spec, Transport):
+        return spec
+    if not isinstance(spec, six.string_types):
+        raise TypeError('transport must be a Transport or a str but {} was given.'.format(
+            type(spec)))
+    scheme, _, address = spec.partition(':')
+    if scheme in ('unix', 'seqpacket'):
+        if not address:
+            raise ValueError('missing path in transport {}.'.format(spec))
+        return UnixTransport(address, seqpacket=scheme == 'seqpacket')
+    if scheme == 'tcp':
+        host, _, port = address.rpartition(':')
+        try:
+            return TcpTransport(host or '127.0.0.1', int(port))
+        except ValueError:
+            raise ValueError('invalid TCP transport {}.'.format(spec))
+    # A plain socket path
+    return UnixTransport(spec)
@@ -113,6 +113,15 @@ setup(
     extras_require={  # Optional
         'dev': ['check-manifest'],
         'test': ['coverage'],
-    }
+        'msgpack': ['msgpack'],
+        'cbor': ['cbor2'],
+    },
+
+    # Command-line tools installed with the package
+    entry_points={  # Optional
+        'console_scripts': [
+            'iottly-send=iottly_sdk.cli:main',
+        ],
+    },
 
 )
@@ -14,6 +14,7 @@ except ImportError:
     Mock = mock_wrapper
 
 import os
+import json
 import time
 import shutil
 import tempfile
@@ -332,7 +333,10 @@ class IottlySDK(unittest.TestCase):
             client_connected.set()
             msg_buf = []
             msg = read_msg_from_socket(s,msg_buf)
-            self.assertEqual('{"signal": {"sdkclient": {"name": "testapp", "error": {"type": "ValueError", "msg": "exception in cb"}}}}', msg.decode())
+            error = json.loads(msg.decode())['signal']['sdkclient']['error']
+            self.assertEqual('ValueError', error['type'])
+            self.assertEqual('exception in cb', error['msg'])
+            self.assertEqual(1, error['count'])
         server = UDSStubServer(self.socket_path, on_bind=server_started.set, on_connect=on_connect)
         server.start()
         try:
@@ -361,6 +365,76 @@ class IottlySDK(unittest.TestCase):
         with self.assertRaises(InvalidAgentVersion):
             sdk.call_agent('echo')
 
+    def test_stop_with_drain(self):
+        all_rcvd = multiprocessing.Event()
+        def read_msgs(s):
+            msg_buf = []
+            # The connection signal follows the messages buffered before
+            msgs = [read_msg_from_socket(s, msg_buf) for _ in range(51)]
+            exp_msgs = [('{"data": {"sdkclient": {"name": "testapp"}, "payload": {"n": %d}}}' % i).encode()
+                        for i in range(50)]
+            if [m for m in msgs if m.startswith(b'{"data"')] == exp_msgs:
+                all_rcvd.set()
+        server = UDSStubServer(self.socket_path, on_connect=read_msgs)
+        server.start()
+
+        sdk = iottly.IottlySDK('testapp', self.socket_path, max_buffered_msgs=100)
+        sdk.start()
+        for i in range(50):
+            sdk.send({'n': i})
+
+        self.assertEqual(0, sdk.stop(drain=True, timeout=2.0))
+        self.wait_or_fail(all_rcvd, msg='The buffer was not drained')
+        server.stop()
+
+    def test_stop_with_disconnected_sdk(self):
+        sdk = iottly.IottlySDK('testapp', self.socket_path)
+        sdk.start()
+        for i in range(3):
+            sdk.send({'n': i})
+
+        self.assertEqual(3, sdk.flush(0.1))
+        t0 = time.time()
+        self.assertEqual(3, sdk.stop(drain=True, timeout=0.5))
+        self.assertLess(time.time() - t0, 1.0)
+        self.assertFalse(sdk._connection_t.is_alive())
+        self.assertFalse(sdk._consumer_t.is_alive())
+        self.assertFalse(sdk._receiver_t.is_alive())
+
+    def test_reliable_mode_retransmits_after_reconnect(self):
+        first_rcvd = multiprocessing.Event()
+        retransmitted = multiprocessing.Event()
+        connections = multiprocessing.Value('i', 0)
+        def agent_script(s):
+            connections.value += 1
+            msg_buf = []
+            read_msg_from_socket(s, msg_buf)  # start signal
+            s.send(b'{"signal": {"sdkinit": {"version": "1.9.0", "acks": true}}}\n')
+            msgs = [read_msg_from_socket(s, msg_buf) for _ in range(3)]
+            seqs = [json.loads(m.decode())['data']['seq'] for m in msgs]
+            if seqs != [1, 2, 3]:
+                return
+            if connections.value == 1:
+                # Crash before forwarding: no ack
+                first_rcvd.set()
+            else:
+                s.send(b'{"signal": {"sdkack": {"seq": 3}}}\n')
+                retransmitted.set()
+                read_msg_from_socket(s, msg_buf)  # wait for the SDK to close
+        server = UDSStubServer(self.socket_path, on_connect=agent_script)
+        server.start()
+
+        sdk = iottly.IottlySDK('testapp', self.socket_path, ack_window=4)
+        sdk.start()
+        for i in range(3):
+            sdk.send({'n': i})
+
+        self.wait_or_fail(first_rcvd, msg='Messages were not sent')
+        self.wait_or_fail(retransmitted, msg='Messages were not retransmitted')
+        self.assertEqual(0, sdk.flush(2.0))
+        sdk.stop()
+        server.stop()
+
     def test_call_agent_with_disconnected_sdk(self):
         sdk = iottly.IottlySDK('testapp', self.socket_path)
         sdk.start()
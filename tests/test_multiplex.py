@@ -0,0 +1,80 @@
+from __future__ import absolute_import
+import unittest
+
+import os
+import json
+import shutil
+import tempfile
+import threading
+import multiprocessing
+
+from stubs.agent_server import UDSStubServer
+from test_iottly_sdk import read_msg_from_socket
+
+from iottly_sdk.multiplex import AgentConnection
+
+
+class AgentConnectionMultiplexing(unittest.TestCase):
+
+    def setUp(self):
+        try:
+            self.sock_dir = tempfile.TemporaryDirectory()
+            self.socket_path = os.path.join(self.sock_dir.name, 'test_socket')
+        except AttributeError:
+            # Python 2.7
+            self.sock_dir = tempfile.mkdtemp()
+            self.socket_path = os.path.join(self.sock_dir, 'test_socket')
+
+    def tearDown(self):
+        try:
+            self.sock_dir.cleanup()
+        except AttributeError:
+            # Python 2.7
+            shutil.rmtree(self.sock_dir)
+
+    def test_sessions_share_one_connection(self):
+        received = multiprocessing.Event()
+        errors = multiprocessing.Queue()
+
+        def server_script(s):
+            msg_buf = []
+            try:
+                starts = [json.loads(read_msg_from_socket(s, msg_buf).decode())
+                          for _ in range(2)]
+                names = sorted(m['signal']['sdkclient']['name'] for m in starts)
+                assert names == ['app1', 'app2'], names
+                s.send(b'{"signal": {"sdkinit": {"version": "1.8.0"}}}\n')
+                s.send(b'{"data": {"echo": {"n": 1}}, "sdkclient": {"name": "app2"}}\n')
+                data = [json.loads(read_msg_from_socket(s, msg_buf).decode())
+                        for _ in range(2)]
+                names = sorted(m['data']['sdkclient']['name'] for m in data)
+                assert names == ['app1', 'app2'], names
+            except AssertionError as e:
+                errors.put(str(e))
+            received.set()
+            read_msg_from_socket(s, msg_buf)
+
+        server = UDSStubServer(self.socket_path, on_connect=server_script)
+        server.start()
+
+        started = [threading.Event(), threading.Event()]
+        echoes = []
+        conn = AgentConnection(self.socket_path)
+        app1 = conn.session('app1', on_agent_status_changed=lambda s: started[0].set())
+        app2 = conn.session('app2', on_agent_status_changed=lambda s: started[1].set())
+        app2.subscribe('echo', echoes.append)
+        app1.start()
+        app2.start()
+        conn.start()
+        try:
+            self.assertTrue(started[0].wait(2.0))
+            self.assertTrue(started[1].wait(2.0))
+            app1.send({'from': 'app1'})
+            app2.send({'from': 'app2'})
+            self.assertTrue(received.wait(2.0))
+            self.assertTrue(errors.empty(), errors.get() if not errors.empty() else '')
+            self.assertEqual([{'n': 1}], echoes)
+            self.assertEqual('1.8.0', app1._agent_version)
+        finally:
+            conn.stop()
+            server.stop()
@@ -0,0 +1,86 @@
+import socket
+import unittest
+try:
+    from unittest.mock import Mock, call
+except ImportError:
+    from mock.mock import Mock, call
+
+from iottly_sdk.framing import LineDecoder
+from iottly_sdk.iottly import IottlySDK, _read_frames
+
+
+class TestAgentSignals(unittest.TestCase):
+
+    def test_status_signals_without_callbacks(self):
+        sdk = IottlySDK('test app')
+
+        # No callback registered: signals are silently consumed
+        sdk._handle_signals_from_agent({'agentstatus': 'stopping'})
+        sdk._handle_signals_from_agent({'connectionstatus': 'disconnected'})
+
+    def test_status_signals_with_callbacks(self):
+        agent_cb = Mock(name='agent_cb')
+        conn_cb = Mock(name='conn_cb')
+        sdk = IottlySDK('test app',
+                        on_agent_status_changed=agent_cb,
+                        on_connection_status_changed=conn_cb)
+
+        sdk._handle_signals_from_agent({'agentstatus': 'stopping'})
+        sdk._handle_signals_from_agent({'connectionstatus': 'disconnected'})
+
+        agent_cb.assert_called_once_with('stopping')
+        conn_cb.assert_called_once_with('disconnected')
+
+
+class TestCommandCoalescing(unittest.TestCase):
+
+    def _frames(self, *cmds):
+        return [('{"data": {"%s": {"n": %d}}}' % cmd).encode() for cmd in cmds]
+
+    def test_only_newest_coalesced_command_is_executed(self):
+        cfg_cb = Mock(name='cfg_cb')
+        echo_cb = Mock(name='echo_cb')
+        sdk = IottlySDK('test app')
+        sdk.subscribe('setconfig', cfg_cb, coalesce=True)
+        sdk.subscribe('echo', echo_cb)
+
+        sdk._process_msgs_from_agent(self._frames(
+            ('setconfig', 1), ('echo', 1), ('setconfig', 2), ('echo', 2),
+            ('setconfig', 3)))
+
+        cfg_cb.assert_called_once_with({'n': 3}, superseded=2)
+        echo_cb.assert_has_calls([call({'n': 1}), call({'n': 2})])
+
+    def test_signals_split_coalesced_runs(self):
+        cfg_cb = Mock(name='cfg_cb')
+        sdk = IottlySDK('test app')
+        sdk.subscribe('setconfig', cfg_cb, coalesce=True)
+
+        sdk._process_msgs_from_agent(
+            self._frames(('setconfig', 1), ('setconfig', 2)) +
+            [b'{"signal": {"connectionstatus": "connected"}}'] +
+            self._frames(('setconfig', 3)))
+
+        cfg_cb.assert_has_calls([call({'n': 2}, superseded=1),
+                                 call({'n': 3}, superseded=0)])
+
+    def test_subscribe_without_coalesce_resets_it(self):
+        cfg_cb = Mock(name='cfg_cb')
+        sdk = IottlySDK('test app')
+        sdk.subscribe('setconfig', cfg_cb, coalesce=True)
+        sdk.subscribe('setconfig', cfg_cb)
+
+        sdk._process_msgs_from_agent(self._frames(('setconfig', 1), ('setconfig', 2)))
+
+        cfg_cb.assert_has_calls([call({'n': 1}), call({'n': 2})])
+
+    def test_read_frames_drains_pending_commands(self):
+        a, b = socket.socketpair()
+        self.addCleanup(a.close)
+        self.addCleanup(b.close)
+        b.sendall(b'{"data": {"setconfig": {"n": 1}}}\n')
+        b.sendall(b'{"data": {"setconfig": {"n": 2}}}\n' * 300)
+
+        frames = _read_frames(a, LineDecoder(), drain=True)
+
+        self.assertEqual(301, len(frames))
@@ -0,0 +1,87 @@
+import json
+import os
+import shutil
+import tempfile
+import time
+import unittest
+
+from iottly_sdk.bridge import Bridge, forward_line
+from iottly_sdk import iottly
+from iottly_sdk.bridge_client import BridgeClient, encode_line, send
+from iottly_sdk.iottly import IottlySDK
+
+
+def _buffered(sdk):
+    msgs = []
+    while not sdk._buffer.empty():
+        msgs.append(json.loads(bytes(sdk._buffer.get().payload).decode())['data'])
+        sdk._buffer.task_done()
+    return msgs
+
+
+class TestForwardLine(unittest.TestCase):
+
+    def setUp(self):
+        self.sdk = IottlySDK('bridge', max_buffered_msgs=10)
+
+    def test_lines(self):
+        self.assertTrue(forward_line(self.sdk, b'{"a": 1}'))
+        self.assertTrue(forward_line(self.sdk, b'jobs\t{"b": 2}\r'))
+
+        self.assertEqual([{'a': 1}, {'b': 2}], [m['payload'] for m in _buffered(self.sdk)])
+
+    def test_channel(self):
+        forward_line(self.sdk, encode_line({'b': 2}, 'jobs')[:-1])
+
+        self.assertEqual('jobs', _buffered(self.sdk)[0]['channel'])
+
+    def test_channels_bounded(self):
+        for i in range(iottly._MAX_IMPLICIT_CHANNELS + 100):
+            self.assertTrue(forward_line(self.sdk, 'job-{}\t{{"i": {}}}'.format(i, i).encode()))
+
+        self.assertEqual({}, self.sdk._channels)
+        self.assertEqual(iottly._MAX_IMPLICIT_CHANNELS, len(self.sdk._implicit_channels))
+
+    def test_invalid_lines(self):
+        for line in (b'[1, 2]', b'jobs {"b": 2}', b'\t{"b": 2}', b'{"a": 1'):
+            self.assertFalse(forward_line(self.sdk, line), line)
+        self.assertEqual([], _buffered(self.sdk))
+
+
+class TestBridge(unittest.TestCase):
+
+    def setUp(self):
+        self.sock_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.sock_dir)
+        self.path = os.path.join(self.sock_dir, 'bridge')
+        self.sdk = IottlySDK('bridge', max_buffered_msgs=100)
+        self.bridge = Bridge(self.sdk, self.path)
+        self.bridge.start()
+
+    def test_forward_from_clients(self):
+        send({'a': 1}, path=self.path)
+        with BridgeClient(self.path) as client:
+            client.send({'b': 2}, channel='jobs')
+            client.send_lines(b'{"c": 3}\nnot json\n{"d": 4}\n')
+
+        self.bridge.stop()
+
+        self.assertEqual(4, self.bridge.forwarded)
+        self.assertEqual(1, self.bridge.rejected)
+        self.assertEqual([{'a': 1}, {'b': 2}, {'c': 3}, {'d': 4}],
+                         [m['payload'] for m in _buffered(self.sdk)])
+        self.assertFalse(os.path.exists(self.path))
+
+    def test_stale_socket_is_replaced(self):
+        self.bridge.stop()
+        open(self.path, 'w').close()
+
+        bridge = Bridge(self.sdk, self.path)
+        bridge.start()
+        send({'a': 1}, path=self.path)
+        deadline = time.time() + 2.0
+        while not bridge.forwarded and time.time() < deadline:
+            time.sleep(0.01)
+        bridge.stop()
+
+        self.assertEqual(1, bridge.forwarded)
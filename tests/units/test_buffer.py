@@ -0,0 +1,101 @@
+import unittest
+try:
+    from queue import Empty
+except ImportError:
+    from Queue import Empty
+
+from iottly_sdk.buffer import ArenaBuffer, Msg
+
+
+class TestArenaBuffer(unittest.TestCase):
+
+    def _put(self, buf, data, signal=False):
+        buf.put(Msg(data, signal, None))
+
+    def _get(self, buf):
+        msg = buf.get(False)
+        data = bytes(msg.payload)
+        buf.task_done()
+        return data, msg.type
+
+    def test_fifo_order(self):
+        buf = ArenaBuffer(10)
+        self._put(buf, b'first\n')
+        self._put(buf, b'second\n', signal=True)
+
+        self.assertEqual(2, buf.qsize())
+        self.assertEqual((b'first\n', False), self._get(buf))
+        self.assertEqual((b'second\n', True), self._get(buf))
+        self.assertTrue(buf.empty())
+        with self.assertRaises(Empty):
+            buf.get(False)
+
+    def test_drops_oldest_when_full(self):
+        buf = ArenaBuffer(2)
+        for i in range(5):
+            self._put(buf, str(i).encode())
+
+        self.assertTrue(buf.full())
+        self.assertEqual(3, buf.dropped)
+        self.assertEqual([b'3', b'4'], [self._get(buf)[0] for _ in range(2)])
+
+    def test_grows_and_compacts_arena(self):
+        buf = ArenaBuffer(1000)
+        msgs = [('%05d' % i).encode() * (i % 50 + 1) for i in range(1000)]
+        for i, m in enumerate(msgs):
+            self._put(buf, m)
+            if i % 3 == 0:
+                self.assertEqual(msgs[i // 3], self._get(buf)[0])
+        remaining = [self._get(buf)[0] for _ in range(buf.qsize())]
+
+        self.assertEqual(msgs[334:], remaining)
+
+    def test_payload_in_use_is_not_overwritten(self):
+        buf = ArenaBuffer(1000)
+        self._put(buf, b'x' * 100)
+        msg = buf.get(False)
+        # Force several compactions while the payload is in use
+        for _ in range(200):
+            self._put(buf, b'y' * 100)
+            buf.get(False)
+
+        self.assertEqual(b'x' * 100, bytes(msg.payload))
+
+    def test_close_wakes_consumer(self):
+        buf = ArenaBuffer(10)
+        buf.close()
+
+        self.assertIsNone(buf.get())
+
+    def test_get_timeout(self):
+        buf = ArenaBuffer(10)
+
+        with self.assertRaises(Empty):
+            buf.get(timeout=0.01)
+
+    def test_join_waits_for_task_done(self):
+        buf = ArenaBuffer(10)
+        self._put(buf, b'a')
+        self._put(buf, b'b')
+        buf.get(False)
+
+        self.assertEqual(2, buf.join(0.01))
+        buf.task_done()
+        self._get(buf)
+        self.assertEqual(0, buf.join(0.01))
+
+    def test_join_returns_on_close(self):
+        buf = ArenaBuffer(10)
+        self._put(buf, b'a')
+        buf.close()
+
+        self.assertEqual(1, buf.join())
+
+    def test_wakeup_interrupts_get(self):
+        buf = ArenaBuffer(10)
+        buf.wakeup()
+
+        with self.assertRaises(Empty):
+            buf.get()
+        with self.assertRaises(Empty):
+            buf.get(timeout=0.01)
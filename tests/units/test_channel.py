@@ -0,0 +1,72 @@
+import json
+import unittest
+
+from iottly_sdk import iottly
+from iottly_sdk.iottly import IottlySDK
+
+
+class TestChannel(unittest.TestCase):
+
+    def setUp(self):
+        self.sdk = IottlySDK('test app', max_buffered_msgs=10)
+
+    def _buffered(self):
+        return json.loads(bytes(self.sdk._buffer.get().payload).decode())
+
+    def test_handles_are_cached(self):
+        self.assertIs(self.sdk.channel('alarms'), self.sdk.channel('alarms'))
+
+    def test_handle_same_as_send(self):
+        alarms = self.sdk.channel('alarms')
+
+        alarms.send({'door': 'open'})
+        self.sdk.send({'door': 'open'}, channel='alarms')
+
+        exp = self.sdk._msg_serialize({'door': 'open'}, 'alarms')
+        self.assertEqual(exp, bytes(self.sdk._buffer.get().payload))
+        self.assertEqual(exp, bytes(self.sdk._buffer.get().payload))
+
+    def test_send_channels_bounded(self):
+        for i in range(iottly._MAX_IMPLICIT_CHANNELS + 100):
+            self.sdk.send({'v': i}, channel='device-{}'.format(i))
+
+        self.assertEqual(iottly._MAX_IMPLICIT_CHANNELS, len(self.sdk._implicit_channels))
+        self.assertEqual({}, self.sdk._channels)
+
+    def test_send_channel_promoted(self):
+        self.sdk.send({'v': 1}, channel='alarms')
+
+        alarms = self.sdk.channel('alarms')
+
+        self.assertEqual(1, alarms.stats()['msgs'])
+        self.assertNotIn('alarms', self.sdk._implicit_channels)
+        for i in range(iottly._MAX_IMPLICIT_CHANNELS + 1):
+            self.sdk.send({'v': i}, channel='device-{}'.format(i))
+        self.assertIs(alarms, self.sdk._channel_handle('alarms'))
+
+    def test_channel_is_escaped(self):
+        self.sdk.channel('a "quoted"\\channel').send({'k': 1})
+
+        self.assertEqual('a "quoted"\\channel', self._buffered()['data']['channel'])
+
+    def test_stats(self):
+        alarms = self.sdk.channel('alarms')
+
+        alarms.send({'door': 'open'})
+        alarms.send_raw(b'{"door": "closed"}')
+        self.sdk.send({'door': 'open'}, channel='alarms')
+
+        stats = alarms.stats()
+        self.assertEqual(3, stats['msgs'])
+        self.assertEqual(sum(len(self.sdk._buffer.get().payload) for _ in range(3)),
+                         stats['bytes'])
+
+    def test_invalid_channel(self):
+        with self.assertRaises(TypeError):
+            self.sdk.channel(1234)
+
+        with self.assertRaises(ValueError):
+            self.sdk.channel('')
+
+        with self.assertRaises(TypeError):
+            self.sdk.channel('alarms').send('open')
@@ -0,0 +1,60 @@
+import io
+import json
+import threading
+import time
+import unittest
+
+from iottly_sdk.cli import Stats, ingest
+from iottly_sdk.iottly import IottlySDK
+
+
+class TestIngest(unittest.TestCase):
+
+    def _buffered(self, sdk):
+        msgs = []
+        while not sdk._buffer.empty():
+            msgs.append(json.loads(bytes(sdk._buffer.get().payload).decode())['data'])
+            sdk._buffer.task_done()
+        return msgs
+
+    def test_lines_and_channels(self):
+        sdk = IottlySDK('testapp', max_buffered_msgs=10)
+        stream = io.BytesIO(b'{"a": 1}\r\n\nalarms\t{"b": 2}\nnot json\n{"c": 3}')
+
+        stats = ingest(sdk, [stream], channel='telemetry')
+
+        self.assertEqual((4, 3, 1), (stats.lines, stats.accepted, stats.rejected))
+        self.assertEqual([('telemetry', {'a': 1}), ('alarms', {'b': 2}), ('telemetry', {'c': 3})],
+                         [(m['channel'], m['payload']) for m in self._buffered(sdk)])
+
+    def test_drop_mode_keeps_memory_bounded(self):
+        sdk = IottlySDK('testapp', max_buffered_msgs=100)
+        stream = io.BytesIO(b''.join(b'{"i": %d}\n' % i for i in range(1000)))
+
+        stats = ingest(sdk, [stream], block=False, stats=Stats())
+
+        self.assertEqual(1000, stats.accepted)
+        self.assertEqual(100, sdk._buffer.qsize())
+        self.assertEqual(900, sdk._buffer.dropped)
+
+    def test_block_mode_small_buffer(self):
+        sdk = IottlySDK('testapp', max_buffered_msgs=100)
+        stream = io.BytesIO(b''.join(b'{"i": %d}\n' % i for i in range(200)))
+        received = []
+
+        def drain():
+            # The sender thread, slower than the lines
+            time.sleep(0.2)
+            while len(received) < 200:
+                received.append(sdk._buffer.get())
+                sdk._buffer.task_done()
+        t = threading.Thread(target=drain)
+        t.daemon = True
+        t.start()
+
+        stats = ingest(sdk, [stream])
+        t.join(5.0)
+
+        self.assertEqual(200, stats.accepted)
+        self.assertEqual(0, sdk._buffer.dropped)
+        self.assertEqual(200, len(received))
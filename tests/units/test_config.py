@@ -0,0 +1,245 @@
+import json
+import time
+import unittest
+
+from iottly_sdk.buffer import ArenaBuffer, Msg
+from iottly_sdk.config import SendPolicy, validate_config
+from iottly_sdk.iottly import IottlySDK
+from iottly_sdk.scheduler import Scheduler
+
+
+class TestSendPolicy(unittest.TestCase):
+
+    def _submit(self, policy, n):
+        sent = []
+        for i in range(n):
+            policy.submit(i, 1, lambda msg, size: sent.append(msg))
+        return sent
+
+    def test_sampling(self):
+        policy = SendPolicy(sampling=0.25)
+
+        self.assertEqual([0, 4, 8], self._submit(policy, 12))
+        self.assertEqual(9, policy.dropped)
+
+    def test_rate_limit(self):
+        policy = SendPolicy(rate_limit=3)
+
+        self.assertEqual([0, 1, 2], self._submit(policy, 10))
+
+    def test_aggregation_sends_newest_at_window_end(self):
+        scheduler = Scheduler()
+        self.addCleanup(scheduler.stop)
+        policy = SendPolicy(aggregation=0.05, scheduler=scheduler)
+        sent = []
+        for i in range(5):
+            policy.submit(i, 1, lambda msg, size: sent.append(msg))
+        self.assertEqual([], sent)
+
+        time.sleep(0.2)
+
+        self.assertEqual([4], sent)
+
+    def test_close_sends_held_message(self):
+        scheduler = Scheduler()
+        self.addCleanup(scheduler.stop)
+        policy = SendPolicy(aggregation=60, scheduler=scheduler)
+        self._submit(policy, 3)
+        sent = []
+
+        policy.close(lambda msg, size: sent.append(msg))
+
+        self.assertEqual([2], sent)
+        self.assertEqual(None, policy._timer)
+
+    def test_invalid_settings(self):
+        for config, exc in [
+                ([], TypeError),
+                ({'max_buffered_msgs': 0}, ValueError),
+                ({'max_buffered_msgs': '10'}, TypeError),
+                ({'channels': {'a': {'sampling': 2}}}, ValueError),
+                ({'channels': {'a': {'rate': 2}}}, ValueError),
+                ({'channels': {'a': {'aggregation': 'x'}}}, TypeError),
+                ({'buffer': 10}, ValueError)]:
+            with self.assertRaises(exc):
+                validate_config(config)
+
+
+class TestConfigure(unittest.TestCase):
+
+    def setUp(self):
+        self.sdk = IottlySDK('testapp', max_buffered_msgs=10)
+
+    def _sent(self):
+        msgs = []
+        while not self.sdk._buffer.empty():
+            msgs.append(json.loads(bytes(self.sdk._buffer.get().payload).decode()))
+            self.sdk._buffer.task_done()
+        return msgs
+
+    def test_channel_sampling(self):
+        self.sdk.configure({'channels': {'telemetry': {'sampling': 0.5}}})
+        for i in range(4):
+            self.sdk.send({'i': i}, channel='telemetry')
+            self.sdk.send({'i': i})
+
+        self.assertEqual([0, 0, 1, 2, 2, 3],
+                         [m['data']['payload']['i'] for m in self._sent()])
+        self.assertEqual(2, self.sdk.channel('telemetry').stats()['msgs'])
+
+    def test_default_and_reset(self):
+        self.sdk.configure({'channels': {'*': {'rate_limit': 1}}})
+        for i in range(3):
+            self.sdk.send({'i': i}, channel='a')
+            self.sdk.send({'i': i})
+        self.assertEqual(2, len(self._sent()))
+
+        self.sdk.configure({'channels': {'*': None}})
+        for i in range(3):
+            self.sdk.send({'i': i}, channel='a')
+        self.assertEqual(3, len(self._sent()))
+        self.assertEqual({}, self.sdk.effective_config()['channels'])
+
+    def test_schema_sender_follows_channel_policy(self):
+        readings = self.sdk.register_schema('r', [('t', float)], channel='telemetry')
+        self.sdk.configure({'channels': {'telemetry': {'sampling': 0.5}}})
+        for i in range(4):
+            readings.send(float(i))
+
+        self.assertEqual([0.0, 2.0], [m['data']['payload']['t'] for m in self._sent()])
+
+    def test_replaced_aggregation_sends_held_message(self):
+        self.sdk.configure({'channels': {'status': {'aggregation': 60}}})
+        self.sdk.send({'s': 1}, channel='status')
+        self.sdk.send({'s': 2}, channel='status')
+        self.assertEqual([], self._sent())
+
+        self.sdk.configure({'channels': {'status': None}})
+
+        self.assertEqual([{'s': 2}], [m['data']['payload'] for m in self._sent()])
+
+    def test_invalid_config_is_not_applied(self):
+        with self.assertRaises(ValueError):
+            self.sdk.configure({'max_buffered_msgs': 5,
+                                'channels': {'a': {'sampling': 0}}})
+
+        config = self.sdk.effective_config()
+        self.assertEqual((10, {}), (config['max_buffered_msgs'], config['channels']))
+
+    def test_shrink_keeps_buffered_messages(self):
+        for i in range(10):
+            self.sdk.send({'i': i})
+
+        self.sdk.configure({'max_buffered_msgs': 4})
+
+        self.assertEqual(10, self.sdk._buffer.qsize())
+        self.sdk.send({'i': 10})
+        self.assertEqual(list(range(1, 11)),
+                         [m['data']['payload']['i'] for m in self._sent()])
+        for i in range(6):
+            self.sdk.send({'i': i})
+        self.assertEqual(4, self.sdk._buffer.qsize())
+
+    def test_reserved_command(self):
+        self.sdk._process_msg_from_agent(
+            b'{"data": {"sdkconfig": {"max_buffered_msgs": 20, '
+            b'"channels": {"a": {"rate_limit": 5}}}}}')
+
+        config = self.sdk.effective_config()
+        self.assertEqual((20, {'a': {'rate_limit': 5}}),
+                         (config['max_buffered_msgs'], config['channels']))
+        self.assertEqual(20, self.sdk._buffer.maxsize)
+
+    def test_invalid_reserved_command_is_reported(self):
+        self.sdk._errors.stop()
+
+        self.sdk._process_msg_from_agent(b'{"data": {"sdkconfig": {"max_buffered_msgs": -1}}}')
+
+        report, = self.sdk._errors._pending.values()
+        self.assertEqual(('sdkconfig', 'ValueError'), (report['callback'], report['type']))
+
+    def test_reserved_command_cannot_be_subscribed(self):
+        with self.assertRaises(ValueError):
+            self.sdk.subscribe('sdkconfig', lambda cmd: None)
+
+
+class TestDegradedMode(unittest.TestCase):
+
+    def setUp(self):
+        self.sdk = IottlySDK('testapp', max_buffered_msgs=100)
+        self.sdk.configure({'degraded': {'debug': {'paused': True},
+                                         '*': {'sampling': 0.5}},
+                            'hysteresis': 0.05})
+
+    def _send(self, n=4):
+        for i in range(n):
+            self.sdk.send({'i': i}, channel='debug')
+            self.sdk.send({'i': i}, channel='telemetry')
+        sent = self.sdk._buffer.qsize()
+        while not self.sdk._buffer.empty():
+            self.sdk._buffer.get()
+            self.sdk._buffer.task_done()
+        return sent
+
+    def _signal(self, status):
+        self.sdk._handle_signals_from_agent({'connectionstatus': status})
+
+    def test_degraded_while_disconnected(self):
+        self.assertEqual(8, self._send())
+
+        self._signal('disconnected')
+
+        self.assertEqual('degraded', self.sdk.effective_config()['mode'])
+        self.assertEqual(2, self._send())
+
+    def test_restore_after_hysteresis(self):
+        self._signal('disconnected')
+        self._signal('connected')
+        self.assertEqual(2, self._send())
+
+        time.sleep(0.2)
+
+        self.assertEqual('normal', self.sdk.effective_config()['mode'])
+        self.assertEqual(8, self._send())
+
+    def test_flapping_link_stays_degraded(self):
+        self._signal('disconnected')
+        for _ in range(5):
+            self._signal('connected')
+            time.sleep(0.02)
+            self._signal('disconnected')
+        self._signal('connected')
+
+        self.assertEqual('degraded', self.sdk.effective_config()['mode'])
+
+    def test_callback_still_invoked(self):
+        statuses = []
+        sdk = IottlySDK('testapp', on_connection_status_changed=statuses.append)
+
+        sdk._handle_signals_from_agent({'connectionstatus': 'disconnected'})
+
+        self.assertEqual(['disconnected'], statuses)
+
+
+class TestArenaBufferResize(unittest.TestCase):
+
+    def test_grow(self):
+        buf = ArenaBuffer(2)
+        buf.resize(100)
+        for i in range(100):
+            buf.put(Msg(str(i).encode(), False, None))
+
+        self.assertEqual(100, buf.qsize())
+        self.assertEqual(0, buf.dropped)
+
+    def test_shrink_keeps_in_flight_message(self):
+        buf = ArenaBuffer(4)
+        for i in range(4):
+            buf.put(Msg(str(i).encode(), False, None))
+        msg = buf.get()
+
+        buf.resize(1)
+        buf.put(Msg(b'x', False, None))
+
+        self.assertEqual(b'0', bytes(msg.payload))
+        self.assertEqual(3, buf.qsize())
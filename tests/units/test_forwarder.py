@@ -0,0 +1,205 @@
+import json
+import os
+import shutil
+import signal
+import socket
+import tempfile
+import threading
+import time
+import unittest
+
+from iottly_sdk.iottly import IottlySDK
+from iottly_sdk import forwarder
+from iottly_sdk.forwarder import SharedRingBuffer, SharedProducer, Forwarder, \
+    ForwarderProcess
+
+
+@unittest.skipIf(forwarder.shared_memory is None, 'requires Python >= 3.8')
+class TestSharedRingBuffer(unittest.TestCase):
+
+    def setUp(self):
+        self.ring = SharedRingBuffer(capacity=64)
+
+    def tearDown(self):
+        self.ring.close()
+
+    def test_put_and_get(self):
+        self.ring.put(b'first')
+        self.ring.put(b'second')
+
+        self.assertEqual([b'first', b'second'], self.ring.get_many(timeout=0))
+        self.assertEqual([], self.ring.get_many(timeout=0))
+
+    def test_wrap_around(self):
+        for i in range(20):
+            record = 'record-{:02d}'.format(i).encode()
+            self.ring.put(record)
+            self.assertEqual([record], self.ring.get_many(timeout=0))
+
+    def test_drop_oldest_when_full(self):
+        # 4 bytes of length prefix + 12 bytes of data: 4 records fit
+        for i in range(6):
+            self.ring.put('record-{:05d}'.format(i).encode())
+
+        self.assertEqual(2, self.ring.dropped)
+        records = self.ring.get_many(timeout=0)
+        self.assertEqual([b'record-00002', b'record-00003',
+                          b'record-00004', b'record-00005'], records)
+
+    def test_record_too_large(self):
+        with self.assertRaises(ValueError):
+            self.ring.put(b'x' * 64)
+
+    def test_producer_args(self):
+        producer = SharedProducer(self.ring)
+
+        with self.assertRaises(TypeError):
+            producer.send('test data')
+
+        with self.assertRaises(TypeError):
+            producer.send({'test': 'foobar'}, channel=1234)
+
+        with self.assertRaises(ValueError):
+            producer.send({'test': set()})
+
+    def test_forward_to_sdk(self):
+        producer = SharedProducer(self.ring)
+        producer.send({'t': 1})
+        producer.send({'t': 2}, channel='alarms')
+        sdk = IottlySDK('test app')
+
+        fwd = Forwarder(sdk, self.ring)
+        fwd.start()
+        fwd.stop()
+
+        self.assertEqual(sdk._msg_serialize({'t': 1}), bytes(sdk._buffer.get().payload))
+        self.assertEqual(sdk._msg_serialize({'t': 2}, 'alarms'), bytes(sdk._buffer.get().payload))
+        self.assertEqual(2, fwd.forwarded)
+
+    def test_forward_applies_channel_settings(self):
+        producer = SharedProducer(self.ring)
+        producer.send({'t': 1})
+        producer.send({'t': 2}, channel='alarms')
+        sdk = IottlySDK('test app')
+        sdk.configure({'channels': {'*': {'paused': True}, '': {'paused': True}}})
+
+        fwd = Forwarder(sdk, self.ring)
+        fwd.start()
+        fwd.stop()
+
+        self.assertTrue(sdk._buffer.empty())
+        self.assertEqual(2, fwd.forwarded)
+
+    def test_forward_oversized_rejected(self):
+        ring = SharedRingBuffer(capacity=4096)
+        self.addCleanup(ring.close)
+        producer = SharedProducer(ring)
+        producer.send({'data': 'x' * 2048})
+        producer.send({'t': 1})
+        sdk = IottlySDK('test app', max_message_bytes=256, oversized='reject')
+
+        fwd = Forwarder(sdk, ring)
+        fwd.start()
+        fwd.stop()
+
+        self.assertEqual(sdk._msg_serialize({'t': 1}), bytes(sdk._buffer.get().payload))
+        self.assertTrue(sdk._buffer.empty())
+        self.assertEqual((1, 1), (fwd.forwarded, fwd.rejected))
+
+
+@unittest.skipIf(forwarder.shared_memory is None, 'requires Python >= 3.8')
+class TestForwarderProcess(unittest.TestCase):
+
+    def setUp(self):
+        self.ring = SharedRingBuffer(capacity=1 << 16)
+        self.addCleanup(self.ring.close)
+        tmp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmp_dir)
+        self.path = os.path.join(tmp_dir, 'agent.sock')
+        self.server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.addCleanup(self.server.close)
+        self.server.bind(self.path)
+
+    def _agent(self, lines):
+        # An agent not answering the handshake: the SDK writes the data
+        # once the handshake times out
+        self.server.listen(1)
+        self.server.settimeout(5.0)
+        try:
+            conn, _ = self.server.accept()
+        except socket.timeout:
+            return  # the SDK stopped without connecting
+        with conn:
+            for line in conn.makefile('rb'):
+                lines.append(json.loads(line.decode()))
+
+    def test_stop_delivers_queued_records(self):
+        proc = ForwarderProcess(self.ring, 'test app', socket_path=self.path,
+                                max_buffered_msgs=100)
+        proc.start()
+        producer = SharedProducer(self.ring)
+        for i in range(50):
+            producer.send({'i': i})
+
+        # The agent is available only once the process is stopping
+        stopping = threading.Thread(target=proc.stop)
+        stopping.start()
+        time.sleep(0.5)
+        lines = []
+        self._agent(lines)
+        stopping.join()
+
+        self.assertEqual(list(range(50)),
+                         [m['data']['payload']['i'] for m in lines if 'data' in m])
+
+
+@unittest.skipUnless(hasattr(os, 'register_at_fork'), 'requires Python >= 3.7')
+class TestResetAfterFork(unittest.TestCase):
+
+    def test_state_reset_in_child(self):
+        sdk = IottlySDK('test app')
+        sdk.send({'test': 'parent data'})
+        parent_lock = sdk._socket_write_lock
+        # Simulate a lock held by a thread of the parent during fork
+        parent_lock.acquire()
+        try:
+            pid = os.fork()
+            if pid == 0:
+                ok = (sdk._buffer.empty() and
+                      sdk._socket_write_lock is not parent_lock and
+                      sdk._socket_write_lock.acquire(False))
+                os._exit(0 if ok else 1)
+            _, status = os.waitpid(pid, 0)
+        finally:
+            parent_lock.release()
+
+        self.assertEqual(0, status)
+        # The parent state is untouched
+        self.assertEqual(1, sdk._buffer.qsize())
+
+    def test_config_lock_reset_in_child(self):
+        sdk = IottlySDK('test app')
+        parent_lock = sdk._config_lock
+        # A `configure` in progress in a thread of the parent during fork
+        acquired = threading.Event()
+        release = threading.Event()
+
+        def hold():
+            with parent_lock:
+                acquired.set()
+                release.wait()
+        t = threading.Thread(target=hold)
+        t.start()
+        acquired.wait()
+        try:
+            pid = os.fork()
+            if pid == 0:
+                signal.alarm(5)  # A deadlock kills the child
+                sdk.configure({'channels': {'*': {'paused': True}}})
+                os._exit(0 if sdk._config_lock is not parent_lock else 1)
+            _, status = os.waitpid(pid, 0)
+        finally:
+            release.set()
+            t.join()
+
+        self.assertEqual(0, status)
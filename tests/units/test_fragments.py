@@ -0,0 +1,130 @@
+import json
+import os
+import tempfile
+import unittest
+
+from iottly_sdk.errors import MessageTooLarge
+from iottly_sdk.fragments import Reassembler
+from iottly_sdk.iottly import IottlySDK
+
+
+class TestOversizedMessages(unittest.TestCase):
+
+    def _buffered(self, sdk):
+        lines = []
+        while not sdk._buffer.empty():
+            lines.append(bytes(sdk._buffer.get().payload))
+            sdk._buffer.task_done()
+        return lines
+
+    def test_fragmented(self):
+        sdk = IottlySDK('testapp', max_buffered_msgs=100, max_message_bytes=1024)
+        msg = {'image': 'x' * 5000, 'text': u'café "quoted"'}
+
+        sdk.send(msg, channel='camera')
+
+        lines = self._buffered(sdk)
+        self.assertTrue(len(lines) > 5)
+        self.assertTrue(all(len(line) <= 1024 for line in lines))
+        reassembler = Reassembler()
+        results = []
+        for line in lines:
+            data = json.loads(line.decode())['data']
+            self.assertEqual('camera', data['channel'])
+            results.append(reassembler.feed(data['payload']))
+        self.assertEqual([None] * (len(lines) - 1) + [msg], results)
+        self.assertEqual(len(lines), sdk.channel('camera').stats()['msgs'])
+
+    def test_small_messages_unchanged(self):
+        sdk = IottlySDK('testapp', max_message_bytes=1024)
+
+        sdk.send({'a': 1})
+        sdk.send_raw(b'{"b": 2}')
+
+        self.assertEqual([{'a': 1}, {'b': 2}],
+                         [json.loads(line.decode())['data']['payload'] for line in self._buffered(sdk)])
+
+    def test_raw_fragmented(self):
+        sdk = IottlySDK('testapp', max_buffered_msgs=100, max_message_bytes=256)
+        payload = json.dumps({'v': list(range(200))}).encode()
+
+        sdk.send_raw(payload)
+
+        reassembler = Reassembler()
+        results = [reassembler.feed(json.loads(line.decode())['data']['payload'])
+                   for line in self._buffered(sdk)]
+        self.assertEqual({'v': list(range(200))}, results[-1])
+
+    def test_reject(self):
+        sdk = IottlySDK('testapp', max_message_bytes=1024, oversized='reject')
+
+        self.assertRaises(MessageTooLarge, sdk.send, {'image': 'x' * 5000})
+        self.assertRaises(ValueError, sdk.send_raw, b'{"a": "' + b'x' * 5000 + b'"}')
+        self.assertEqual(0, sdk._buffer.qsize())
+
+    def test_more_fragments_than_buffered_msgs(self):
+        sdk = IottlySDK('testapp', max_buffered_msgs=3, max_message_bytes=1024)
+
+        self.assertRaises(MessageTooLarge, sdk.send, {'image': 'x' * 5000})
+        self.assertEqual(0, sdk._buffer.qsize())
+
+    def test_schema_sender(self):
+        sdk = IottlySDK('testapp', max_buffered_msgs=100, max_message_bytes=1024)
+        sender = sdk.register_schema('log', [('text', str)], channel='logs')
+
+        sender.send('x' * 5000)
+
+        reassembler = Reassembler()
+        results = [reassembler.feed(json.loads(line.decode())['data']['payload'])
+                   for line in self._buffered(sdk)]
+        self.assertTrue(len(results) > 1)
+        self.assertEqual({'text': 'x' * 5000}, results[-1])
+
+        sdk = IottlySDK('testapp', max_message_bytes=256, oversized='reject')
+        sender = sdk.register_schema('log', [('text', str)])
+        self.assertRaises(MessageTooLarge, sender.send, 'x' * 5000)
+        self.assertEqual(0, sdk._buffer.qsize())
+
+    def test_file_chunks_fit(self):
+        sdk = IottlySDK('testapp', max_message_bytes=1024)
+        with tempfile.NamedTemporaryFile(delete=False) as f:
+            f.write(os.urandom(10000))
+        self.addCleanup(os.unlink, f.name)
+
+        transfer = sdk.send_file(f.name)
+        transfer.cancel()
+
+        self.assertTrue(transfer.chunk_size < 1024)
+        self.assertTrue(transfer.chunks > 10)
+
+    def test_invalid_arguments(self):
+        self.assertRaises(TypeError, IottlySDK, 'testapp', max_message_bytes='1k')
+        self.assertRaises(ValueError, IottlySDK, 'testapp', max_message_bytes=100)
+        self.assertRaises(ValueError, IottlySDK, 'testapp', oversized='truncate')
+
+
+class TestReassembler(unittest.TestCase):
+
+    def _fragment(self, frag_id, index, count, data='ew=='):
+        return {'fragment': {'id': frag_id, 'index': index, 'count': count, 'data': data}}
+
+    def test_lost_fragments_expire(self):
+        reassembler = Reassembler(max_age=0.0)
+
+        self.assertIsNone(reassembler.feed(self._fragment('a', 0, 2)))
+        self.assertIsNone(reassembler.feed(self._fragment('b', 0, 2)))
+
+        self.assertEqual(1, reassembler.discarded)
+
+    def test_max_pending(self):
+        reassembler = Reassembler(max_pending=2)
+
+        for frag_id in 'abc':
+            reassembler.feed(self._fragment(frag_id, 0, 2))
+
+        self.assertEqual(1, reassembler.discarded)
+        self.assertEqual({}, reassembler.feed(self._fragment('c', 1, 2, 'fQ==')))
+
+    def test_not_a_fragment(self):
+        payload = {'fragment': 'not a dict'}
+        self.assertIs(payload, Reassembler().feed(payload))
@@ -0,0 +1,101 @@
+import socket
+import unittest
+
+from iottly_sdk import framing
+from iottly_sdk.framing import (JSON_LINES, FramingError, LengthPrefixDecoder,
+                                LineDecoder, get_protocol, transcode)
+from iottly_sdk.iottly import IottlySDK
+
+
+class TestDecoders(unittest.TestCase):
+
+    def test_line_decoder_split_chunks(self):
+        decoder = LineDecoder()
+
+        self.assertEqual([], decoder.feed(b'{"a": '))
+        self.assertEqual([b'{"a": 1}', b'{"b": 2}'], decoder.feed(b'1}\n{"b": 2}\n{"c"'))
+        self.assertEqual(b'{"c"', decoder.pending())
+
+    def test_line_decoder_long_line(self):
+        decoder = LineDecoder()
+        line = b'{"data": "' + b'x' * 100000 + b'"}'
+
+        for i in range(0, len(line), 4096):
+            self.assertEqual([], decoder.feed(line[i:i + 4096]))
+        self.assertEqual([line, b'{}'], decoder.feed(b'\n{}\n'))
+        self.assertEqual(b'', decoder.pending())
+
+    def test_length_prefix_decoder_split_chunks(self):
+        decoder = LengthPrefixDecoder()
+        data = b'\x00\x00\x00\x03abc\x00\x00\x00\x01d'
+
+        self.assertEqual([], decoder.feed(data[:5]))
+        self.assertEqual([b'abc', b'd'], decoder.feed(data[5:]))
+
+    def test_length_prefix_decoder_rejects_huge_frames(self):
+        decoder = LengthPrefixDecoder()
+
+        with self.assertRaises(FramingError):
+            decoder.feed(b'\xff\xff\xff\xff')
+
+    def test_decode_memoryview(self):
+        frame = memoryview(bytearray(b'{"data": {"t": 1}}'))
+
+        self.assertEqual({'data': {'t': 1}}, JSON_LINES.decode(frame))
+
+    def test_unavailable_protocol(self):
+        self.assertIsNone(get_protocol('xml'))
+        self.assertIs(JSON_LINES, get_protocol('json'))
+
+
+@unittest.skipIf(framing.msgpack is None, 'requires msgpack')
+class TestNegotiation(unittest.TestCase):
+
+    def setUp(self):
+        self.msgpack = get_protocol('msgpack')
+        self.sdk = IottlySDK('testapp', framings=['msgpack'])
+        self.sdk._socket, self.agent = socket.socketpair()
+
+    def tearDown(self):
+        self.sdk._socket.close()
+        self.agent.close()
+
+    def test_framings_offered_in_handshake(self):
+        self.assertIn(b'"framings": ["msgpack"]', self.sdk._app_start_msg)
+        self.assertNotIn(b'framings', IottlySDK('testapp')._app_start_msg)
+
+    def test_transcode_roundtrip(self):
+        frame = b'{"data": {"payload": {"t": 21.5}}}\n'
+
+        binary = transcode(frame, JSON_LINES, self.msgpack)
+
+        self.assertEqual(frame, transcode(binary, self.msgpack, JSON_LINES))
+
+    def test_switch_on_sdkinit(self):
+        buffered = self.sdk._msg_serialize({'t': 1})
+        self.sdk._process_msg_from_agent(
+            b'{"signal": {"sdkinit": {"version": "1.9.0", "framing": "msgpack"}}}')
+
+        self.sdk._send_msg_through_socket(buffered, JSON_LINES.id)
+        self.sdk._socket.shutdown(socket.SHUT_WR)
+        received = b''
+        while True:
+            chunk = self.agent.recv(4096)
+            if not chunk:
+                break
+            received += chunk
+        ack, _, rest = received.partition(b'\n')
+        self.assertEqual(b'{"signal": {"sdkclient": {"name": "testapp", "framing": "msgpack"}}}', ack)
+        data = self.msgpack.decoder().feed(rest)
+        self.assertEqual(
+            {'data': {'sdkclient': {'name': 'testapp'}, 'payload': {'t': 1}}},
+            self.msgpack.decode(data[0]))
+        self.assertIs(self.msgpack, self.sdk._protocol)
+        self.assertIsInstance(self.sdk._rx_decoder, LengthPrefixDecoder)
+
+    def test_framing_not_offered_is_ignored(self):
+        self.sdk._framings = []
+        self.sdk._process_msg_from_agent(
+            b'{"signal": {"sdkinit": {"version": "1.9.0", "framing": "msgpack"}}}')
+
+        self.assertIs(JSON_LINES, self.sdk._protocol)
@@ -0,0 +1,146 @@
+import json
+import socket
+import threading
+import time
+import unittest
+
+from iottly_sdk.iottly import IottlySDK
+from iottly_sdk.transport import LoopbackTransport
+
+
+class TestHeartbeat(unittest.TestCase):
+
+    def setUp(self):
+        self.transport = LoopbackTransport()
+        self.server = self.transport.listen()
+        self.statuses = []
+        self.sdk = IottlySDK('testapp', transport=self.transport,
+                             max_buffered_msgs=100, heartbeat=0.05,
+                             heartbeat_misses=3,
+                             on_agent_status_changed=self.statuses.append)
+        self.addCleanup(self.sdk.stop)
+
+    def _accept(self, heartbeat=True, backlog=None):
+        # The agent side of a new link, after the handshake
+        conn, _ = self.server.accept()
+        self.addCleanup(conn.close)
+        reader = conn.makefile('rb')
+        self.addCleanup(reader.close)
+        msg = json.loads(reader.readline().decode())
+        while 'data' in msg:
+            # Buffered before the start-up signal
+            backlog.append(msg['data']['payload'])
+            msg = json.loads(reader.readline().decode())
+        start = msg['signal']['sdkclient']
+        self.assertEqual(0.05, start['heartbeat'])
+        conn.sendall('{{"signal": {{"sdkinit": {{"version": "1.8.0", "heartbeat": {}}}}}}}\n'.format(
+            json.dumps(heartbeat)).encode())
+        return conn, reader
+
+    def _pong(self, conn, msg):
+        seq = msg['signal']['sdkclient']['ping']
+        conn.sendall('{{"signal": {{"sdkpong": {{"seq": {}}}}}}}\n'.format(seq).encode())
+
+    def _answer_pings(self, conn, reader, n):
+        for _ in range(n):
+            self._pong(conn, json.loads(reader.readline().decode()))
+
+    def test_rtt_measured(self):
+        self.sdk.start()
+        conn, reader = self._accept()
+
+        self._answer_pings(conn, reader, 3)
+        time.sleep(0.02)
+
+        stats = self.sdk.link_stats()
+        self.assertTrue(stats['pongs'] >= 2)
+        self.assertTrue(0 < stats['rtt'] < 1.0)
+        self.assertTrue(0 < stats['srtt'] < 1.0)
+        self.assertEqual(0, stats['dead_links'])
+
+    def test_hung_agent_dropped(self):
+        self.sdk.start()
+        conn, reader = self._accept()
+        self._answer_pings(conn, reader, 2)
+
+        # The agent stops reading and answering: the SDK reconnects
+        t0 = time.time()
+        self._accept()
+
+        self.assertTrue(time.time() - t0 < 1.0)
+        self.assertEqual(1, self.sdk.link_stats()['dead_links'])
+        self.assertIn('stopped', self.statuses)
+
+    def test_blocked_writer_released(self):
+        self.sdk.start()
+        conn, reader = self._accept()
+        # The agent never reads: the sender thread blocks in sendall
+        payload = {'data': 'x' * 65536}
+        for i in range(20):
+            self.sdk.send(dict(payload, i=i))
+
+        backlog = []
+        conn, reader = self._accept(backlog=backlog)
+        done = threading.Event()
+        received = [msg['i'] for msg in backlog]
+        if 19 in received:
+            done.set()
+
+        def read():
+            try:
+                for line in iter(reader.readline, b''):
+                    msg = json.loads(line.decode())
+                    if 'data' in msg:
+                        received.append(msg['data']['payload']['i'])
+                        if received[-1] == 19:
+                            done.set()
+                            return
+                    else:
+                        self._pong(conn, msg)
+            except (OSError, IOError, ValueError):
+                pass  # closed by the cleanup
+        t = threading.Thread(target=read)
+        t.daemon = True
+        t.start()
+        # Before the agent end is closed (cleanups run in reverse order)
+        self.addCleanup(t.join, 1.0)
+
+        self.assertTrue(done.wait(5.0))
+        self.assertEqual(1, self.sdk.link_stats()['dead_links'])
+
+    def test_busy_link_kept(self):
+        self.sdk.start()
+        conn, reader = self._accept()
+
+        def read():
+            try:
+                for line in iter(reader.readline, b''):
+                    msg = json.loads(line.decode())
+                    if 'signal' in msg:
+                        self._pong(conn, msg)
+            except (OSError, IOError, ValueError):
+                pass  # closed by the cleanup
+        t = threading.Thread(target=read)
+        t.daemon = True
+        t.start()
+        self.addCleanup(t.join, 1.0)
+        self.addCleanup(conn.shutdown, socket.SHUT_RDWR)
+
+        # The writes hold the lock most of the time: the pings can't get
+        # through but the agent keeps reading
+        t0 = time.time()
+        while time.time() - t0 < 1.0:
+            self.sdk.send({'data': 'x' * 200 * 1024})
+        self.sdk.flush(2.0)
+
+        self.assertEqual(0, self.sdk.link_stats()['dead_links'])
+        self.assertNotIn('stopped', self.statuses)
+
+    def test_not_supported_by_agent(self):
+        self.sdk.start()
+        conn, reader = self._accept(heartbeat=False)
+
+        time.sleep(0.3)
+
+        self.assertEqual(0, self.sdk.link_stats()['pings'])
+
@@ -32,6 +32,39 @@ class TestIottlySDKApiArgTypes(unittest.TestCase):
         with self.assertRaises(TypeError):
             sdk.send({"test": "foobar"}, channel=1234)
 
+    def test_send_raw_args(self):
+        sdk = IottlySDK('test app')
+
+        with self.assertRaises(TypeError):
+            sdk.send_raw({"test": "foobar"})
+
+        with self.assertRaises(TypeError):
+            sdk.send_raw(b'{"test": "foobar"}', channel=1234)
+
+        with self.assertRaises(ValueError):
+            sdk.send_raw(b'{"test":\n"foobar"}')
+
+        with self.assertRaises(ValueError):
+            sdk.send_raw(b'["test"]', validate=True)
+
+        with self.assertRaises(ValueError):
+            sdk.send_raw(b'{"test": "\xff"}', validate=True)
+
+    def test_send_raw_same_as_send(self):
+        sdk = IottlySDK('test app', max_buffered_msgs=10)
+        msg = {"test": "foobar"}
+        raw = json.dumps(msg).encode()
+
+        sdk.send(msg, channel='alarms')
+        sdk.send_raw(raw, channel='alarms')
+        sdk.send_raw(bytearray(raw))
+        sdk.send_raw(memoryview(raw), validate=True)
+
+        self.assertEqual(sdk._msg_serialize(msg, 'alarms'), bytes(sdk._buffer.get().payload))
+        self.assertEqual(sdk._msg_serialize(msg, 'alarms'), bytes(sdk._buffer.get().payload))
+        self.assertEqual(sdk._msg_serialize(msg), bytes(sdk._buffer.get().payload))
+        self.assertEqual(sdk._msg_serialize(msg), bytes(sdk._buffer.get().payload))
+
     def test_subscribe_args(self):
         sdk = IottlySDK('test app')
 
@@ -0,0 +1,152 @@
+import json
+import unittest
+try:
+    from unittest.mock import Mock, call
+except ImportError:
+    from mock.mock import Mock, call
+
+from iottly_sdk.multiplex import AgentConnection
+
+
+class TestAgentConnection(unittest.TestCase):
+
+    def setUp(self):
+        self.conn = AgentConnection('/tmp/non-existent')
+
+    def test_sessions_buffers_consumed_in_round_robin(self):
+        app1 = self.conn.session('app1', max_buffered_msgs=10)
+        app2 = self.conn.session('app2', max_buffered_msgs=10)
+        self.conn._attach(app1)
+        self.conn._attach(app2)
+        for i in range(3):
+            app1.send({'n': i})
+        app2.send({'n': 0})
+
+        names = []
+        for _ in range(4):
+            msg = self.conn._buffer.get()
+            names.append(json.loads(bytes(msg.payload).decode())['data']['sdkclient']['name'])
+
+        self.assertEqual(['app1', 'app2', 'app1', 'app1'], names)
+        self.assertTrue(self.conn._buffer.empty())
+
+    def test_session_buffer_drops_oldest(self):
+        app = self.conn.session('app', max_buffered_msgs=2)
+        for i in range(3):
+            app.send({'n': i})
+
+        msgs = [bytes(app._buffer.get(False).payload) for _ in range(2)]
+
+        self.assertIn(b'"payload": {"n": 1}', msgs[0])
+        self.assertIn(b'"payload": {"n": 2}', msgs[1])
+
+    def test_handshake_for_every_session(self):
+        app1 = self.conn.session('app1')
+        app2 = self.conn.session('app2')
+        self.conn._attach(app1)
+        self.conn._attach(app2)
+
+        with self.conn._connected_to_agent:
+            self.conn._on_agent_linked()
+        self.conn._handshake_timeout_timer.cancel()
+
+        self.assertTrue(app1._agent_linked)
+        self.assertTrue(app2._agent_linked)
+        self.assertEqual(app1._app_start_msg, self.conn._buffer.get().payload)
+        self.assertEqual(app2._app_start_msg, self.conn._buffer.get().payload)
+
+    def test_commands_routed_by_name(self):
+        cb1 = Mock(name='cb1')
+        cb2 = Mock(name='cb2')
+        app1 = self.conn.session('app1')
+        app2 = self.conn.session('app2')
+        app1.subscribe('echo', cb1)
+        app2.subscribe('echo', cb2)
+        self.conn._attach(app1)
+        self.conn._attach(app2)
+
+        self.conn._process_msg_from_agent(
+            '{"data": {"echo": {"n": 1}}, "sdkclient": {"name": "app2"}}')
+        self.conn._process_msg_from_agent('{"data": {"echo": {"n": 2}}}')
+
+        cb1.assert_called_once_with({'n': 2})
+        cb2.assert_has_calls([call({'n': 1}), call({'n': 2})])
+
+    def test_commands_coalesced_per_session(self):
+        cb1 = Mock(name='cb1')
+        cb2 = Mock(name='cb2')
+        app1 = self.conn.session('app1')
+        app2 = self.conn.session('app2')
+        app1.subscribe('setconfig', cb1, coalesce=True)
+        app2.subscribe('setconfig', cb2)
+        self.conn._attach(app1)
+        self.conn._attach(app2)
+
+        self.conn._process_msgs_from_agent([
+            '{"data": {"setconfig": {"n": 1}}}',
+            '{"data": {"setconfig": {"n": 2}}, "sdkclient": {"name": "app2"}}',
+            '{"data": {"setconfig": {"n": 3}}}'])
+
+        self.assertTrue(self.conn._coalescing())
+        cb1.assert_called_once_with({'n': 3}, superseded=1)
+        cb2.assert_has_calls([call({'n': 1}), call({'n': 2}), call({'n': 3})])
+
+    def test_signals_delivered_to_every_session(self):
+        status_cb1 = Mock(name='status_cb1')
+        status_cb2 = Mock(name='status_cb2')
+        app1 = self.conn.session('app1', on_connection_status_changed=status_cb1)
+        app2 = self.conn.session('app2', on_connection_status_changed=status_cb2)
+        self.conn._attach(app1)
+        self.conn._attach(app2)
+
+        self.conn._process_msg_from_agent('{"signal": {"sdkinit": {"version": "1.8.0"}}}')
+        self.conn._process_msg_from_agent('{"signal": {"connectionstatus": "disconnected"}}')
+
+        self.assertEqual('1.8.0', app1._agent_version)
+        self.assertEqual('1.8.0', app2._agent_version)
+        status_cb1.assert_called_once_with('disconnected')
+        status_cb2.assert_called_once_with('disconnected')
+
+    def test_detach_sends_disconnected_status(self):
+        app = self.conn.session('app')
+        self.conn._attach(app)
+        self.conn._agent_linked = True
+
+        self.conn._detach(app)
+
+        self.assertFalse(app._agent_linked)
+        self.assertEqual(app._app_stop_msg, self.conn._buffer.get().payload)
+        self.assertEqual([], self.conn._buffer.sessions())
+
+    def test_session_uses_connection_scheduler(self):
+        app = self.conn.session('app')
+
+        self.assertIs(self.conn._scheduler, app._scheduler)
+
+    def test_session_send_not_blocking(self):
+        app = self.conn.session('app')
+        self.conn._socket_write_lock.acquire()
+        try:
+            with self.assertRaises(IOError):
+                app._send_msg_through_socket(b'{}\n', blocking=False)
+        finally:
+            self.conn._socket_write_lock.release()
+
+    def test_stop_cancels_session_timers(self):
+        app = self.conn.session('app')
+        app.configure({'channels': {'alarms': {'aggregation': 60}}})
+        app.send({'door': 'open'}, channel='alarms')
+        self.conn._agent_linked = True
+        app.start()
+        timer = app._handshake_timeout_timer
+        app._errors.report(ValueError('bad'), 'cb')
+
+        app.stop()
+
+        self.assertTrue(timer.cancelled)
+        self.assertTrue(app._errors._stopped)
+        self.assertIsNone(app._errors._timer)
+        self.assertIsNone(app.channel('alarms')._policy._timer)
+        # The message held by the aggregation window is buffered
+        self.assertEqual(1, app._buffer.qsize())
+        self.conn._scheduler.stop()
@@ -0,0 +1,121 @@
+import json
+import unittest
+
+from iottly_sdk import framing
+from iottly_sdk.framing import JSON_LINES, get_protocol
+from iottly_sdk.iottly import IottlySDK
+from iottly_sdk.reliable import AckWindow, sequence
+
+
+class TestSequence(unittest.TestCase):
+
+    def test_sequence_json_line(self):
+        frame = b'{"data": {"sdkclient": {"name": "app"}, "payload": {"t": 1}}}\n'
+
+        tagged = sequence(frame, JSON_LINES, 7)
+
+        self.assertEqual(b'{"data": {"seq": 7, "sdkclient": {"name": "app"}, "payload": {"t": 1}}}\n', tagged)
+
+    def test_sequence_memoryview(self):
+        frame = b'{"data": {"payload": {"t": 1}}}\n'
+
+        tagged = sequence(memoryview(frame), JSON_LINES, 7)
+
+        self.assertEqual(b'{"data": {"seq": 7, "payload": {"t": 1}}}\n', bytes(tagged))
+
+    @unittest.skipIf(framing.msgpack is None, 'requires msgpack')
+    def test_sequence_binary_frame(self):
+        msgpack = get_protocol('msgpack')
+        frame = msgpack.encode({'data': {'payload': {'t': 1}}})
+
+        tagged = sequence(frame, msgpack, 7)
+
+        self.assertEqual({'data': {'seq': 7, 'payload': {'t': 1}}},
+                         msgpack.decode(msgpack.framer.unframe(tagged)))
+
+
+class TestAckWindow(unittest.TestCase):
+
+    def test_cumulative_ack(self):
+        window = AckWindow(4)
+        for data in (b'a', b'b', b'c'):
+            self.assertTrue(window.add(data, 0))
+
+        window.ack(2)
+
+        self.assertEqual(1, len(window))
+        self.assertEqual([(3, 0, b'c')], window.pending()[1])
+
+    def test_memoryview_payload_copied(self):
+        window = AckWindow(4)
+        payload = bytearray(b'{"data": {}}\n')
+        window.add(memoryview(payload), 0)
+        payload[:] = b'x' * len(payload)  # the writer reuses its buffer
+
+        frame = window.pending()[1][0][2]
+        self.assertIsInstance(frame, bytes)
+        self.assertEqual(b'{"data": {}}\n', frame)
+
+    def test_rewind_makes_unacked_pending(self):
+        window = AckWindow(4)
+        window.add(b'a', 0)
+        window.add(b'b', 0)
+        link, frames = window.pending()
+        for seq, _, _ in frames:
+            window.written(seq, link)
+        self.assertEqual([], window.pending()[1])
+
+        window.ack(1)
+        window.rewind()
+
+        self.assertEqual([(2, 0, b'b')], window.pending()[1])
+
+    def test_written_on_stale_link_is_ignored(self):
+        window = AckWindow(4)
+        window.add(b'a', 0)
+        link, _ = window.pending()
+        window.rewind()
+
+        window.written(1, link)
+
+        self.assertEqual([(1, 0, b'a')], window.pending()[1])
+
+    def test_full_window_add_returns_on_close(self):
+        window = AckWindow(1)
+        window.add(b'a', 0)
+        window.close()
+
+        self.assertFalse(window.add(b'b', 0))
+        self.assertEqual(1, window.join())
+
+
+class TestAckSignals(unittest.TestCase):
+
+    def test_acks_requested_in_handshake(self):
+        sdk = IottlySDK('testapp', ack_window=8)
+
+        start = json.loads(sdk._app_start_msg.decode())
+        self.assertEqual(8, start['signal']['sdkclient']['acks'])
+        self.assertNotIn(b'acks', IottlySDK('testapp')._app_start_msg)
+
+    def test_acks_enabled_by_sdkinit(self):
+        sdk = IottlySDK('testapp', ack_window=8)
+        sdk._process_msg_from_agent(
+            b'{"signal": {"sdkinit": {"version": "1.9.0", "acks": true}}}')
+
+        self.assertTrue(sdk._acks_enabled)
+
+    def test_old_agent_does_not_enable_acks(self):
+        sdk = IottlySDK('testapp', ack_window=8)
+        sdk._process_msg_from_agent(b'{"signal": {"sdkinit": {"version": "1.8.0"}}}')
+
+        self.assertFalse(sdk._acks_enabled)
+
+    def test_sdkack_releases_window(self):
+        sdk = IottlySDK('testapp', ack_window=8)
+        sdk._window.add(b'a', 0)
+        sdk._window.add(b'b', 0)
+
+        sdk._process_msg_from_agent(b'{"signal": {"sdkack": {"seq": 1}}}')
+
+        self.assertEqual(1, len(sdk._window))
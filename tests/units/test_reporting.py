@@ -0,0 +1,133 @@
+import json
+import socket
+import time
+import unittest
+
+from iottly_sdk.iottly import IottlySDK
+from iottly_sdk.reporting import MAX_TRACEBACK_CHARS, ErrorReporter
+from iottly_sdk.scheduler import Scheduler
+
+
+class _Sink(object):
+    """Stand-in for the SDK collecting the error signals.
+    """
+    _err_msg = IottlySDK('app')._err_msg
+
+    def __init__(self, connected=True):
+        self.connected = connected
+        self._scheduler = Scheduler()
+        self.signals = []
+        self.times = []
+
+    def _send_msg_through_socket(self, payload, framing=0):
+        if not self.connected:
+            raise socket.error('not connected')
+        self.signals.append(json.loads(payload.decode()))
+        self.times.append(time.time())
+
+    def errors(self):
+        return [s['signal']['sdkclient']['error'] for s in self.signals]
+
+
+def _raise(reporter, exc, callback='cb'):
+    try:
+        raise exc
+    except Exception as e:
+        reporter.report(e, callback)
+
+
+class TestErrorReporter(unittest.TestCase):
+
+    def setUp(self):
+        self.sink = _Sink()
+        self.reporter = ErrorReporter(self.sink, interval=60.0)
+        # Batches are sent by the tests, not by the timer
+        self.reporter.stop()
+
+    def test_same_error_is_aggregated(self):
+        for _ in range(100):
+            _raise(self.reporter, ValueError('bad'))
+        _raise(self.reporter, ValueError('bad'), callback='other_cb')
+
+        self.reporter._send_reports()
+
+        errors = self.sink.errors()
+        self.assertEqual([('bad', 'cb', 100), ('bad', 'other_cb', 1)],
+                         [(e['msg'], e['callback'], e['count']) for e in errors])
+        self.assertLessEqual(errors[0]['first_ts'], errors[0]['last_ts'])
+        self.assertIn('ValueError: bad', errors[0]['traceback'])
+
+    def test_reports_per_batch_are_limited(self):
+        self.reporter.max_reports = 2
+        for i in range(5):
+            _raise(self.reporter, ValueError(str(i)))
+
+        self.reporter._send_reports()
+
+        self.assertEqual(['0', '1'], [e['msg'] for e in self.sink.errors()])
+        self.assertEqual(3, len(self.reporter._pending))
+
+    def test_distinct_pending_errors_are_bounded(self):
+        self.reporter.max_pending = 3
+        for i in range(5):
+            _raise(self.reporter, ValueError(str(i)))
+
+        self.assertEqual(3, len(self.reporter._pending))
+        self.assertEqual(2, self.reporter.dropped)
+
+    def test_reports_kept_while_disconnected(self):
+        self.sink.connected = False
+        _raise(self.reporter, ValueError('bad'))
+        self.reporter._send_reports()
+        _raise(self.reporter, ValueError('bad'))
+
+        self.sink.connected = True
+        self.reporter._send_reports()
+
+        self.assertEqual([2], [e['count'] for e in self.sink.errors()])
+
+    def test_traceback_is_truncated(self):
+        _raise(self.reporter, ValueError('x' * (2 * MAX_TRACEBACK_CHARS)))
+
+        self.reporter._send_reports()
+
+        self.assertEqual(MAX_TRACEBACK_CHARS, len(self.sink.errors()[0]['traceback']))
+
+
+class TestRateLimit(unittest.TestCase):
+
+    def test_burst_is_throttled(self):
+        sink = _Sink()
+        reporter = ErrorReporter(sink, interval=0.2, max_reports=2)
+        self.addCleanup(sink._scheduler.stop)
+        self.addCleanup(reporter.stop)
+
+        t0 = time.time()
+        for i in range(6):
+            _raise(reporter, ValueError(str(i)))
+        deadline = t0 + 2.0
+        while len(sink.signals) < 6 and time.time() < deadline:
+            time.sleep(0.01)
+
+        self.assertEqual([str(i) for i in range(6)], [e['msg'] for e in sink.errors()])
+        # The first batch at once, then at most one batch per interval
+        self.assertLess(sink.times[0] - t0, 0.1)
+        for first, third in zip(sink.times, sink.times[2:]):
+            self.assertGreaterEqual(third - first, 0.15)
+
+
+class TestCallbackErrors(unittest.TestCase):
+
+    def test_callback_errors_are_not_buffered(self):
+        sdk = IottlySDK('app', max_buffered_msgs=10)
+        sdk._errors.stop()
+
+        def on_cmd(cmd):
+            raise ValueError('bad')
+        sdk.subscribe('echo', on_cmd)
+        for _ in range(100):
+            sdk._handle_cmd_from_agent({'echo': {}})
+
+        self.assertTrue(sdk._buffer.empty())
+        report, = sdk._errors._pending.values()
+        self.assertEqual(('on_cmd', 100), (report['callback'], report['count']))
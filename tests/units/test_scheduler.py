@@ -0,0 +1,135 @@
+import threading
+import time
+import unittest
+
+from iottly_sdk.iottly import IottlySDK
+from iottly_sdk.scheduler import Scheduler
+
+
+class TestScheduler(unittest.TestCase):
+
+    def setUp(self):
+        self.scheduler = Scheduler(resolution=0.005)
+        self.addCleanup(self.scheduler.stop)
+
+    def test_call_later_order(self):
+        fired = []
+        done = threading.Event()
+        for delay in (0.09, 0.03, 0.06):
+            self.scheduler.call_later(delay, fired.append, delay)
+        self.scheduler.call_later(0.12, done.set)
+
+        self.assertTrue(done.wait(2.0))
+        self.assertEqual([0.03, 0.06, 0.09], fired)
+
+    def test_cancel(self):
+        fired = []
+        handle = self.scheduler.call_later(0.02, fired.append, 1)
+        handle.cancel()
+        time.sleep(0.1)
+
+        self.assertEqual([], fired)
+        self.assertEqual(0, len(self.scheduler))
+
+    def test_delays_across_levels(self):
+        # 4 slots of 1 ms per level: 0.3 s needs the upper levels
+        scheduler = Scheduler(resolution=0.001, slots=4, levels=3)
+        self.addCleanup(scheduler.stop)
+        fired = []
+        t0 = time.time()
+        for delay in (0.01, 0.05, 0.3):
+            scheduler.call_later(delay, lambda d=delay: fired.append((d, time.time() - t0)))
+        time.sleep(0.5)
+
+        self.assertEqual([0.01, 0.05, 0.3], [d for d, _ in fired])
+        for delay, elapsed in fired:
+            self.assertGreaterEqual(elapsed, delay)
+            self.assertLess(elapsed, delay + 0.1)
+
+    def test_periodic_runs_do_not_drift(self):
+        runs = []
+        t0 = time.time()
+        handle = self.scheduler.every(0.02, lambda: runs.append(time.time() - t0))
+        time.sleep(0.5)
+        handle.cancel()
+
+        # Run k is due at k * interval, whatever the lateness of the others
+        self.assertGreaterEqual(len(runs), 20)
+        self.assertLess(runs[-1] - 0.02 * len(runs), 0.05)
+
+    def test_busy_periodic_run_is_skipped(self):
+        release = threading.Event()
+        runs = []
+
+        def slow():
+            runs.append(1)
+            release.wait(1.0)
+        handle = self.scheduler.every(0.01, slow)
+        time.sleep(0.1)
+        release.set()
+        handle.cancel()
+
+        self.assertEqual(1, len(runs))
+        self.assertGreater(handle.skipped, 0)
+
+    def test_slow_pool_does_not_delay_timers(self):
+        release = threading.Event()
+        self.addCleanup(release.set)
+        for _ in range(4):
+            self.scheduler.every(0.01, lambda: release.wait(2.0), pool=True)
+        time.sleep(0.05)  # every worker of the pool is busy
+        fired = threading.Event()
+        t0 = time.time()
+
+        self.scheduler.call_later(0.02, fired.set)
+
+        self.assertTrue(fired.wait(1.0))
+        self.assertLess(time.time() - t0, 0.2)
+
+
+class TestEvery(unittest.TestCase):
+
+    def setUp(self):
+        self.sdk = IottlySDK('testapp', max_buffered_msgs=100)
+        self.addCleanup(self.sdk._scheduler.stop)
+
+    def test_producer_messages_are_sent(self):
+        readings = iter(range(3))
+        handle = self.sdk.every(0.01, lambda: {'t': next(readings, None)},
+                                channel='sensors')
+        time.sleep(0.1)
+        handle.cancel()
+
+        msg = self.sdk._buffer.get()
+        self.assertIn(b'"channel": "sensors"', bytes(msg.payload))
+        self.assertGreaterEqual(self.sdk.channel('sensors').stats()['msgs'], 3)
+
+    def test_none_is_not_sent(self):
+        self.sdk.every(0.01, lambda: None)
+        time.sleep(0.05)
+
+        self.assertTrue(self.sdk._buffer.empty())
+
+    def test_producer_errors_are_reported(self):
+        self.sdk._errors.stop()
+
+        def read_sensor():
+            raise IOError('sensor unavailable')
+        self.sdk.every(0.01, read_sensor)
+        time.sleep(0.05)
+
+        report, = self.sdk._errors._pending.values()
+        self.assertEqual('read_sensor', report['callback'])
+
+    def test_cancelled_producers_are_forgotten(self):
+        kept = self.sdk.every(1.0, lambda: None)
+        for _ in range(100):
+            self.sdk.every(1.0, lambda: None).cancel()
+
+        self.assertEqual({kept}, self.sdk._periodic)
+
+    def test_invalid_producer(self):
+        with self.assertRaises(TypeError):
+            self.sdk.every(1.0, {'t': 1})
+        with self.assertRaises(ValueError):
+            self.sdk.every(0, lambda: None)
@@ -0,0 +1,58 @@
+# -*- coding: utf-8 -*-
+import json
+import unittest
+
+from iottly_sdk.iottly import IottlySDK
+
+
+class TestSchemaSender(unittest.TestCase):
+
+    def setUp(self):
+        self.sdk = IottlySDK('test app', max_buffered_msgs=10)
+
+    def _buffered(self):
+        return bytes(self.sdk._buffer.get().payload)
+
+    def test_same_encoding_of_send(self):
+        readings = self.sdk.register_schema(
+            'readings', [('temperature', float), ('ok', bool), ('ts', int), ('unit', str)],
+            channel='sensors')
+
+        readings.send(21.5, True, 1546300800, u'°C "100%"')
+
+        exp = {'temperature': 21.5, 'ok': True, 'ts': 1546300800, 'unit': u'°C "100%"'}
+        self.assertEqual(self.sdk._msg_serialize(exp, 'sensors'), self._buffered())
+
+    def test_values_converted_to_field_type(self):
+        readings = self.sdk.register_schema('readings', [('t', float), ('n', int)])
+
+        readings.send(21, 3.0)
+        readings.send(float('nan'), 0)
+
+        self.assertEqual({'t': 21.0, 'n': 3},
+                         json.loads(self._buffered().decode())['data']['payload'])
+        self.assertIn(b'"t": NaN', self._buffered())
+
+    def test_invalid_schema(self):
+        with self.assertRaises(TypeError):
+            self.sdk.register_schema('readings', [('t', list)])
+
+        with self.assertRaises(TypeError):
+            self.sdk.register_schema('readings', [(1, float)])
+
+        with self.assertRaises(TypeError):
+            self.sdk.register_schema(1, [('t', float)])
+
+    def test_invalid_values(self):
+        readings = self.sdk.register_schema('readings', [('t', float), ('unit', str)])
+
+        with self.assertRaises(TypeError):
+            readings.send(21.5)
+
+        with self.assertRaises(ValueError):
+            readings.send('hot', 'C')
+
+        with self.assertRaises(TypeError):
+            readings.send(21.5, 1)
+
+        self.assertTrue(self.sdk._buffer.empty())
@@ -4,7 +4,8 @@ try:
 except ImportError:
     from mock.mock import Mock, call
 
-from iottly_sdk.iottly import _read_msg_from_socket
+from iottly_sdk.framing import LineDecoder
+from iottly_sdk.iottly import _read_frames
 
 class TestSocketMessageReceive(unittest.TestCase):
 
@@ -13,47 +14,47 @@ class TestSocketMessageReceive(unittest.TestCase):
         socket = Mock()
         socket.recv = Mock(side_effect=data)
 
-        msg_buf = []
-        msgs = _read_msg_from_socket(socket, msg_buf)
+        decoder = LineDecoder()
+        msgs = _read_frames(socket, decoder)
 
         self.assertEqual(1, len(msgs))
-        self.assertEqual('fixture data', msgs[0])
+        self.assertEqual(b'fixture data', msgs[0])
 
     def test_receive_data_with_more_messages(self):
         data = b'fixture data\nother fixture data\nand some more\n'
         socket = Mock()
         socket.recv = Mock(return_value=data)
 
-        msg_buf = []
-        msgs = _read_msg_from_socket(socket, msg_buf)
+        decoder = LineDecoder()
+        msgs = _read_frames(socket, decoder)
 
         self.assertEqual(3, len(msgs))
-        self.assertEqual('fixture data', msgs[0])
-        self.assertEqual('other fixture data', msgs[1])
-        self.assertEqual('and some more', msgs[2])
+        self.assertEqual(b'fixture data', msgs[0])
+        self.assertEqual(b'other fixture data', msgs[1])
+        self.assertEqual(b'and some more', msgs[2])
 
     def test_receive_chuncked_messages(self):
         data = [b'fixture data\nother fixt', b'ure data\nand some more\n']
         socket = Mock()
         socket.recv = Mock(side_effect=data)
 
-        msg_buf = []
-        msgs = _read_msg_from_socket(socket, msg_buf)
+        decoder = LineDecoder()
+        msgs = _read_frames(socket, decoder)
         self.assertEqual(1, len(msgs))
-        self.assertEqual('fixture data', msgs[0])
+        self.assertEqual(b'fixture data', msgs[0])
 
-        msgs = _read_msg_from_socket(socket, msg_buf)
+        msgs = _read_frames(socket, decoder)
         self.assertEqual(2, len(msgs))
-        self.assertEqual('other fixture data', msgs[0])
-        self.assertEqual('and some more', msgs[1])
+        self.assertEqual(b'other fixture data', msgs[0])
+        self.assertEqual(b'and some more', msgs[1])
 
 
     def test_handle_socket_error(self):
         socket = Mock()
         socket.recv = Mock(side_effect=OSError())
 
-        msg_buf = []
-        msg = _read_msg_from_socket(socket, msg_buf)
+        decoder = LineDecoder()
+        msg = _read_frames(socket, decoder)
         self.assertIsNone(msg)
 
     def test_draining_socket_data(self):
@@ -61,9 +62,9 @@ class TestSocketMessageReceive(unittest.TestCase):
         socket = Mock()
         socket.recv = Mock(side_effect=data)
 
-        msg_buf = []
-        msgs = _read_msg_from_socket(socket, msg_buf)
-        self.assertEqual('fixture data', msgs[0])
+        decoder = LineDecoder()
+        msgs = _read_frames(socket, decoder)
+        self.assertEqual(b'fixture data', msgs[0])
 
-        msg = _read_msg_from_socket(socket, msg_buf)
+        msg = _read_frames(socket, decoder)
         self.assertIsNone(msg)
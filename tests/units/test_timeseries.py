@@ -0,0 +1,103 @@
+import json
+import time
+import unittest
+
+from iottly_sdk import timeseries
+from iottly_sdk.iottly import IottlySDK
+from iottly_sdk.timeseries import TimeSeriesBatcher
+
+
+class TestTimeSeriesBatcher(unittest.TestCase):
+
+    def setUp(self):
+        self.sdk = IottlySDK('test app', max_buffered_msgs=10)
+
+    def _buffered(self):
+        return json.loads(bytes(self.sdk._buffer.get(timeout=1.0).payload).decode())['data']
+
+    def test_flush_on_max_samples(self):
+        batcher = TimeSeriesBatcher(self.sdk, max_samples=3, max_latency=60)
+        for i in range(4):
+            batcher.add({'temp': 20 + i, 'hum': 40}, ts=i, channel='sensors')
+
+        data = self._buffered()
+        self.assertEqual('sensors', data['channel'])
+        self.assertEqual({'ts': [0, 1, 2], 'temp': [20, 21, 22], 'hum': [40, 40, 40]},
+                         data['payload'])
+        self.assertTrue(self.sdk._buffer.empty())
+        batcher.close()
+        self.assertEqual([3], self._buffered()['payload']['ts'])
+
+    def test_flush_on_max_bytes(self):
+        batcher = TimeSeriesBatcher(self.sdk, max_bytes=200, max_latency=60)
+        for i in range(5):
+            batcher.add({'temp': 20}, ts=i)
+
+        self.assertEqual(5, len(self._buffered()['payload']['ts']))
+        batcher.close()
+
+    def test_flush_on_max_latency(self):
+        batcher = TimeSeriesBatcher(self.sdk, max_latency=0.05)
+        batcher.add({'temp': 20}, ts=1)
+
+        self.assertEqual({'ts': [1], 'temp': [20]}, self._buffered()['payload'])
+        batcher.close()
+
+    def test_fields_change_starts_new_batch(self):
+        batcher = TimeSeriesBatcher(self.sdk, max_latency=60)
+        batcher.add({'temp': 20}, ts=1)
+        batcher.add({'hum': 40}, ts=2)
+
+        self.assertEqual({'ts': [1], 'temp': [20]}, self._buffered()['payload'])
+        batcher.flush()
+        self.assertEqual({'ts': [2], 'hum': [40]}, self._buffered()['payload'])
+        batcher.close()
+
+    def test_add_columns(self):
+        batcher = TimeSeriesBatcher(self.sdk, max_latency=60)
+        batcher.add_columns([1, 2], {'temp': [20, 21]})
+
+        with self.assertRaises(ValueError):
+            batcher.add_columns([3], {'temp': [22, 23]})
+        with self.assertRaises(TypeError):
+            batcher.add_columns([3], {'temp': ['hot']})
+        batcher.close()
+
+        self.assertEqual({'ts': [1, 2], 'temp': [20, 21]}, self._buffered()['payload'])
+
+    def test_invalid_sample_keeps_pending_batch(self):
+        batcher = TimeSeriesBatcher(self.sdk, max_latency=60)
+        batcher.add({'a': 1.0, 'b': 2.0}, ts=1)
+        batcher.add({'a': 3.0, 'b': 4.0}, ts=2)
+
+        with self.assertRaises(TypeError):
+            batcher.add({'a': 1.0, 'c': 'bad'}, ts=3)
+        with self.assertRaises(TypeError):
+            batcher.add_columns([3], {'c': ['bad']})
+        batcher.close()
+
+        self.assertEqual({'ts': [1, 2], 'a': [1.0, 3.0], 'b': [2.0, 4.0]},
+                         self._buffered()['payload'])
+        self.assertTrue(self.sdk._buffer.empty())
+
+    @unittest.skipIf(timeseries.numpy is None, 'requires numpy')
+    def test_add_numpy_columns(self):
+        numpy = timeseries.numpy
+        batcher = TimeSeriesBatcher(self.sdk, max_latency=60)
+        batcher.add_columns(numpy.arange(3), {'temp': numpy.array([20, 21, 22], dtype='f4')})
+        batcher.close()
+
+        self.assertEqual({'ts': [0, 1, 2], 'temp': [20, 21, 22]}, self._buffered()['payload'])
+
+    def test_invalid_samples(self):
+        batcher = TimeSeriesBatcher(self.sdk, max_latency=60)
+
+        with self.assertRaises(TypeError):
+            batcher.add([20])
+        with self.assertRaises(TypeError):
+            batcher.add({'temp': 'hot'})
+        with self.assertRaises(TypeError):
+            batcher.add({'temp': 20}, channel=1234)
+        batcher.close()
+
+        self.assertTrue(self.sdk._buffer.empty())
@@ -0,0 +1,239 @@
+import base64
+import hashlib
+import json
+import os
+import shutil
+import socket
+import tempfile
+import unittest
+
+from iottly_sdk.iottly import IottlySDK
+from iottly_sdk.transfer import FILE_CMD
+
+
+class TestSendFile(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmp_dir)
+        self.sdk = IottlySDK('testapp')
+        self.sent = []
+        # A linked SDK whose writes are recorded
+        self.sdk._agent_linked = True
+        self.sdk._handshake_ended.set()
+        self.sdk._send_msg_through_socket = self._record
+
+    def _record(self, payload, framing=0):
+        self.sent.append(json.loads(payload.decode())['data'])
+
+    def _file(self, data):
+        path = os.path.join(self.tmp_dir, 'snapshot.bin')
+        with open(path, 'wb') as f:
+            f.write(data)
+        return path
+
+    def _reassemble(self):
+        chunks = [m['payload']['file'] for m in self.sent]
+        data = bytearray(chunks[0]['size'])
+        for chunk in chunks:
+            raw = base64.b64decode(chunk['data'])
+            data[chunk['offset']:chunk['offset'] + len(raw)] = raw
+        return bytes(data), chunks
+
+    def test_chunks(self):
+        content = os.urandom(10000)
+        transfer = self.sdk.send_file(self._file(content), channel='files', chunk_size=4096)
+
+        self.assertTrue(transfer.wait(2.0))
+        data, chunks = self._reassemble()
+        self.assertEqual(content, data)
+        self.assertEqual([0, 1, 2], [c['chunk'] for c in chunks])
+        self.assertEqual({'snapshot.bin'}, set(c['name'] for c in chunks))
+        self.assertEqual(hashlib.sha256(content).hexdigest(), chunks[-1]['sha256'])
+        self.assertNotIn('sha256', chunks[0])
+        self.assertEqual('files', self.sent[0]['channel'])
+        self.assertEqual(3, self.sdk.channel('files').stats()['msgs'])
+
+    def test_empty_file(self):
+        transfer = self.sdk.send_file(self._file(b''))
+
+        self.assertTrue(transfer.wait(2.0))
+        self.assertEqual([(0, 1, '')], [(m['payload']['file']['size'],
+                                         m['payload']['file']['chunks'],
+                                         m['payload']['file']['data']) for m in self.sent])
+
+    def test_resume_after_write_error(self):
+        content = os.urandom(3 * 1024)
+        failures = [2]
+
+        def flaky(payload, framing=0):
+            if len(self.sent) == 1 and failures[0]:
+                failures[0] -= 1
+                raise socket.error('broken pipe')
+            self._record(payload)
+        self.sdk._send_msg_through_socket = flaky
+
+        transfer = self.sdk.send_file(self._file(content), chunk_size=1024)
+
+        self.assertTrue(transfer.wait(2.0))
+        data, chunks = self._reassemble()
+        self.assertEqual([0, 1, 2], [c['chunk'] for c in chunks])
+        self.assertEqual(hashlib.sha256(content).hexdigest(), chunks[-1]['sha256'])
+
+    def test_paused_while_disconnected(self):
+        self.sdk._agent_linked = False
+        transfer = self.sdk.send_file(self._file(b'x' * 100))
+
+        self.assertFalse(transfer.wait(0.2))
+        self.assertEqual(0, transfer.sent)
+
+        with self.sdk._connected_to_agent:
+            self.sdk._agent_linked = True
+            self.sdk._connected_to_agent.notify_all()
+        self.assertTrue(transfer.wait(2.0))
+
+    def test_cancel(self):
+        self.sdk._agent_linked = False
+        transfer = self.sdk.send_file(self._file(b'x' * 100))
+        transfer.cancel()
+
+        self.assertFalse(transfer.wait(2.0))
+        self.assertTrue(transfer.done)
+
+
+class TestReceiveFile(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmp_dir)
+        self.sdk = IottlySDK('testapp', download_dir=self.tmp_dir)
+        self.addCleanup(self.sdk._files.close)
+        self.signals = []
+        self.sdk._send_msg_through_socket = self._record
+        self.errors = []
+        self.sdk._errors.report = lambda exc, name: self.errors.append((name, exc))
+        self.received = []
+        self.sdk.subscribe('firmware', self._on_firmware)
+
+    def _record(self, payload, framing=0):
+        self.signals.append(json.loads(payload.decode())['signal']['sdkclient']['file'])
+
+    def _on_firmware(self, params):
+        path = params['file']['path']
+        with open(path, 'rb') as f:
+            self.received.append((params, f.read()))
+
+    def _chunks(self, content, chunk_size, **extra):
+        chunks = max(1, -(-len(content) // chunk_size))
+        for k in range(chunks):
+            offset = k * chunk_size
+            header = {'cmd': 'firmware', 'id': 'f1', 'name': 'fw.bin',
+                      'size': len(content), 'chunks': chunks, 'chunk': k,
+                      'offset': offset,
+                      'data': base64.b64encode(content[offset:offset + chunk_size]).decode()}
+            header.update(extra)
+            yield {'sdkfile': header}
+
+    def _feed(self, cmds):
+        for cmd in cmds:
+            self.sdk._handle_cmd_from_agent(cmd)
+
+    def test_reassembled_to_file(self):
+        content = os.urandom(10000)
+        cmds = list(self._chunks(content, 4096, params={'version': '2.1'},
+                                 sha256=hashlib.sha256(content).hexdigest()))
+        # Out of order and repeated
+        self._feed([cmds[2], cmds[0], cmds[0], cmds[1]])
+
+        self.assertEqual([], self.errors)
+        params, data = self.received[0]
+        self.assertEqual(content, data)
+        self.assertEqual('2.1', params['version'])
+        self.assertEqual(('fw.bin', 10000), (params['file']['name'], params['file']['size']))
+        self.assertEqual(os.path.dirname(params['file']['path']), self.tmp_dir)
+        # The file is removed after the callback
+        self.assertEqual([], os.listdir(self.tmp_dir))
+        self.assertEqual([{'id': 'f1', 'status': 'complete'}], self.signals)
+
+    def test_file_moved_by_callback(self):
+        target = os.path.join(self.tmp_dir, 'kept.bin')
+        self.sdk.subscribe('firmware', lambda params: os.rename(params['file']['path'], target))
+
+        self._feed(self._chunks(b'abc', 2))
+
+        with open(target, 'rb') as f:
+            self.assertEqual(b'abc', f.read())
+
+    def test_sha256_mismatch(self):
+        self._feed(self._chunks(b'abcdef', 4, sha256=hashlib.sha256(b'other').hexdigest()))
+
+        self.assertEqual([], self.received)
+        self.assertEqual([{'id': 'f1', 'status': 'corrupted'}], self.signals)
+        self.assertEqual(FILE_CMD, self.errors[0][0])
+        self.assertEqual([], os.listdir(self.tmp_dir))
+
+    def test_malformed_chunks(self):
+        header = next(self._chunks(b'abcdef', 4))['sdkfile']
+        for change in ({'chunk': 2}, {'offset': 5}, {'size': 'six'}, {'data': '#'}):
+            bad = dict(header, **change)
+            self._feed([{'sdkfile': bad}])
+        self.assertEqual(4, len(self.errors))
+        self.assertEqual([], os.listdir(self.tmp_dir))
+
+    def test_chunks_match_size(self):
+        header = next(self._chunks(b'x' * 10, 4))['sdkfile']
+        for change in ({'chunks': 2 ** 50}, {'chunks': 2}, {'chunk': 2, 'offset': 6},
+                       {'size': 2 ** 40}):
+            bad = dict(header, **change)
+            self._feed([{'sdkfile': bad}])
+        self.assertEqual(4, len(self.errors))
+        self.assertTrue(all(isinstance(e, ValueError) for _, e in self.errors))
+        self.assertEqual([], os.listdir(self.tmp_dir))
+
+    def test_size_limit(self):
+        sdk = IottlySDK('testapp', download_dir=self.tmp_dir, max_download_bytes=8)
+        sdk._errors.report = lambda exc, name: self.errors.append((name, exc))
+
+        for cmd in self._chunks(b'x' * 10, 4):
+            sdk._handle_cmd_from_agent(cmd)
+
+        self.assertEqual(3, len(self.errors))
+        self.assertEqual([], os.listdir(self.tmp_dir))
+
+    def test_concurrent_downloads_limit(self):
+        sdk = IottlySDK('testapp', download_dir=self.tmp_dir, max_downloads=2)
+        self.addCleanup(sdk._files.close)
+        sdk._errors.report = lambda exc, name: self.errors.append((name, exc))
+
+        for i in range(3):
+            header = dict(next(self._chunks(b'x' * 10, 4))['sdkfile'], id='f{}'.format(i))
+            sdk._handle_cmd_from_agent({'sdkfile': header})
+
+        self.assertEqual(1, len(self.errors))
+        self.assertEqual(2, len(os.listdir(self.tmp_dir)))
+
+    def test_invalid_limits(self):
+        self.assertRaises(TypeError, IottlySDK, 'testapp', max_download_bytes='1G')
+        self.assertRaises(ValueError, IottlySDK, 'testapp', max_downloads=0)
+
+    def test_resume_after_reconnection(self):
+        cmds = list(self._chunks(b'x' * 10, 2))
+        self._feed([cmds[0], cmds[1], cmds[3]])
+
+        # A new handshake with the agent
+        self.sdk._invoke_initial_agent_status_changed_cb()
+
+        self.assertEqual([{'id': 'f1', 'next': 2}], self.signals)
+        self._feed([cmds[2], cmds[4]])
+        self.assertEqual(b'x' * 10, self.received[0][1])
+
+    def test_reserved(self):
+        self.assertRaises(ValueError, self.sdk.subscribe, FILE_CMD, lambda params: None)
+
+    def test_stop_discards_incomplete(self):
+        self._feed(list(self._chunks(b'x' * 10, 2))[:1])
+        self.assertEqual(1, len(os.listdir(self.tmp_dir)))
+
+        self.sdk.stop()
+
+        self.assertEqual([], os.listdir(self.tmp_dir))
@@ -0,0 +1,99 @@
+import json
+import os
+import shutil
+import socket
+import sys
+import tempfile
+import threading
+import unittest
+
+from iottly_sdk.iottly import IottlySDK
+from iottly_sdk.transport import LoopbackTransport, TcpTransport, UnixTransport, \
+    get_transport
+
+
+class TestTransports(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmp_dir)
+
+    def _roundtrip(self, transport):
+        server = transport.listen()
+        self.addCleanup(transport.cleanup)
+        self.addCleanup(server.close)
+        client = transport.connect()
+        self.addCleanup(client.close)
+        conn, _ = server.accept()
+        self.addCleanup(conn.close)
+        client.sendall(b'ping\n')
+        self.assertEqual(b'ping\n', conn.recv(16))
+        conn.sendall(b'pong\n')
+        self.assertEqual(b'pong\n', client.recv(16))
+
+    def test_unix(self):
+        self._roundtrip(UnixTransport(os.path.join(self.tmp_dir, 'agent.sock')))
+
+    @unittest.skipUnless(hasattr(socket, 'SOCK_SEQPACKET'), 'no SOCK_SEQPACKET')
+    def test_seqpacket(self):
+        transport = UnixTransport(os.path.join(self.tmp_dir, 'agent.sock'), seqpacket=True)
+        self._roundtrip(transport)
+        self.assertEqual(128 * 1024, transport.max_message_bytes)
+
+    @unittest.skipUnless(sys.platform.startswith('linux'), 'Linux only')
+    def test_abstract(self):
+        self._roundtrip(UnixTransport('@iottly-test-{}'.format(os.getpid())))
+
+    def test_tcp(self):
+        transport = TcpTransport('127.0.0.1', 0)
+        self._roundtrip(transport)
+        self.assertNotEqual(0, transport.port)
+
+    def test_loopback(self):
+        self._roundtrip(LoopbackTransport())
+
+    def test_not_listening(self):
+        self.assertRaises(socket.error, LoopbackTransport().connect)
+        self.assertRaises(socket.error, UnixTransport(os.path.join(self.tmp_dir, 'none')).connect)
+
+    def test_specs(self):
+        self.assertEqual('/run/agent.sock', get_transport('/run/agent.sock').path)
+        self.assertEqual('@agent', get_transport('unix:@agent').path)
+        self.assertTrue(get_transport('seqpacket:/run/agent.sock').seqpacket)
+        tcp = get_transport('tcp:agent:8765')
+        self.assertEqual(('agent', 8765), (tcp.host, tcp.port))
+        loopback = LoopbackTransport()
+        self.assertIs(loopback, get_transport(loopback))
+        self.assertRaises(ValueError, get_transport, 'tcp:agent:http')
+        self.assertRaises(ValueError, get_transport, 'unix:')
+        self.assertRaises(TypeError, get_transport, 8765)
+
+
+class TestSDKTransport(unittest.TestCase):
+
+    def test_sdk_over_loopback(self):
+        transport = LoopbackTransport()
+        server = transport.listen()
+        sdk = IottlySDK('testapp', transport=transport)
+        received = []
+        done = threading.Event()
+        sdk.subscribe('echo', lambda params: (received.append(params), done.set()))
+        sdk.start()
+        self.addCleanup(sdk.stop)
+
+        conn, _ = server.accept()
+        self.addCleanup(conn.close)
+        reader = conn.makefile('rb')
+        start = json.loads(reader.readline().decode())
+        self.assertEqual('testapp', start['signal']['sdkclient']['name'])
+
+        sdk.send({'a': 1})
+        self.assertEqual({'a': 1}, json.loads(reader.readline().decode())['data']['payload'])
+
+        conn.sendall(b'{"data": {"echo": {"b": 2}}}\n')
+        self.assertTrue(done.wait(2.0))
+        self.assertEqual([{'b': 2}], received)
+
+    def test_seqpacket_limits_message_size(self):
+        sdk = IottlySDK('testapp', transport='seqpacket:/run/agent.sock')
+        self.assertEqual(128 * 1024, sdk._max_message_bytes)
@@ -0,0 +1,83 @@
+import json
+import threading
+import time
+import unittest
+
+from iottly_sdk.errors import DisconnectedSDK
+from iottly_sdk.iottly import IottlySDK
+from iottly_sdk.transport import LoopbackTransport
+
+
+class TestWriteTimeout(unittest.TestCase):
+
+    def setUp(self):
+        self.transport = LoopbackTransport()
+        self.server = self.transport.listen()
+        self.sdk = IottlySDK('testapp', transport=self.transport,
+                             max_buffered_msgs=100, write_timeout=0.5,
+                             send_buffer_bytes=16384)
+        self.addCleanup(self.sdk.stop)
+
+    def _accept(self):
+        # The agent side of a new link, after the handshake
+        conn, _ = self.server.accept()
+        self.addCleanup(conn.close)
+        conn.sendall(b'{"signal": {"sdkinit": {"version": "1.8.0"}}}\n')
+        return conn
+
+    def _lines(self, conn):
+        # Everything written on a dropped link (the last line may be cut)
+        chunks = []
+        conn.settimeout(1.0)
+        for chunk in iter(lambda: conn.recv(65536), b''):
+            chunks.append(chunk)
+        return b''.join(chunks).split(b'\n')
+
+    def _data(self, lines):
+        received = []
+        for line in lines:
+            try:
+                msg = json.loads(line.decode())
+            except ValueError:
+                continue  # cut off by the timeout
+            if 'data' in msg:
+                received.append(msg['data']['payload']['i'])
+        return received
+
+    def test_stalled_agent_no_message_lost(self):
+        self.sdk.start()
+        stalled = self._accept()
+        # The agent never reads: the writes fill the socket buffers
+        for i in range(20):
+            self.sdk.send({'data': 'x' * 65536, 'i': i})
+
+        conn = self._accept()
+        reader = conn.makefile('rb')
+        self.addCleanup(reader.close)
+        received = []
+        while 19 not in received:
+            line = reader.readline()
+            self.assertTrue(line)
+            received.extend(self._data([line]))
+
+        # Written whole on either link: the one timed out is written again
+        self.assertEqual(list(range(20)),
+                         sorted(set(self._data(self._lines(stalled)) + received)))
+        self.assertEqual(1, self.sdk.link_stats()['write_timeouts'])
+
+    def test_call_agent_not_blocked(self):
+        self.sdk.start()
+        self._accept()
+        time.sleep(0.1)  # the handshake
+        self.sdk.send({'data': 'x' * 1024 * 1024, 'i': 0})
+
+        t0 = time.time()
+        with self.assertRaises(DisconnectedSDK):
+            for _ in range(100):
+                self.sdk.call_agent('echo', {'data': 'x' * 65536})
+        self.assertTrue(time.time() - t0 < 2.0)
+
+    def test_invalid_arguments(self):
+        self.assertRaises(ValueError, IottlySDK, 'testapp', write_timeout=0)
+        self.assertRaises(TypeError, IottlySDK, 'testapp', send_buffer_bytes='64k')
+        self.assertRaises(ValueError, IottlySDK, 'testapp', send_buffer_bytes=0)